@@ -0,0 +1,68 @@
+import json
+
+from app.order.menu_catalog import MenuCatalog, plural
+
+NUMBER_WORDS = [
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "eleven", "twelve", "a", "an", "another", "a couple of", "a dozen",
+]
+
+MODIFIER_PHRASES = [
+    "no", "extra", "with", "without", "light", "add", "remove", "take off", "cancel", "instead",
+    "more", "less", "one more", "no onions", "no pickles", "no cheese", "no ice", "extra cheese",
+    "extra sauce", "extra ice", "onions", "pickles", "cheese", "ice", "ketchup", "mayo", "mustard",
+    "lettuce", "tomato", "sauce", "salt", "large", "small", "medium", "make it", "change", "actually",
+]
+
+CONTROL_PHRASES = [
+    "i am done", "i'm done", "that's all", "that is all", "that's it", "that is it", "confirm",
+    "confirm order", "done", "complete", "finish", "yes", "no", "nothing else", "the usual",
+]
+
+FILLER_PHRASES = [
+    "can i get", "can i have", "could i get", "i want", "i would like", "i'd like", "let me get",
+    "give me", "please", "and", "also", "the", "of", "on", "it", "my", "order", "for", "me", "to",
+]
+
+
+def build_menu_phrases(menu):
+    """Phrase list for a Vosk grammar: menu items (and plurals) plus quantities, modifiers and control phrases."""
+    phrases = []
+    for section_items in menu.values():
+        for entry in section_items:
+            name = entry["name"].lower()
+            phrases += [name, plural(name)]
+    phrases += NUMBER_WORDS + MODIFIER_PHRASES + CONTROL_PHRASES + FILLER_PHRASES
+
+    # Vosk wants unique, lowercase phrases; [unk] soaks up anything off-menu.
+    seen = set()
+    unique = []
+    for phrase in phrases:
+        if phrase not in seen:
+            seen.add(phrase)
+            unique.append(phrase)
+    return unique + ["[unk]"]
+
+
+class MenuGrammar:
+    """Vosk grammar built from the menu catalog, rebuilt whenever the menu changes.
+
+    Only models with a dynamic graph (the "small" Vosk models) honour a
+    grammar; larger models ignore it and fall back to free dictation.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog or MenuCatalog.default()
+        self.version = None
+        self.phrases = []
+        self.grammar_json = "[]"
+
+    def get(self):
+        """Return the grammar as the JSON string KaldiRecognizer expects."""
+        menu = self.catalog.menu  # picks up edits to menu.json
+        if self.catalog.version != self.version:
+            self.phrases = build_menu_phrases(menu)
+            self.grammar_json = json.dumps(self.phrases)
+            self.version = self.catalog.version
+            print(f"[INFO] Built menu grammar with {len(self.phrases)} phrases")
+        return self.grammar_json
@@ -0,0 +1,211 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import sounddevice as sd
+
+try:
+    import webrtcvad
+except ImportError:  # optional, the energy detector works without it
+    webrtcvad = None
+
+
+class ListenCancelled(Exception):
+    """Raised by AudioStream.utterance() when interrupt() is called."""
+
+
+class EnergyVad:
+    """Frame-level speech detector: RMS energy against an adaptive noise floor.
+
+    If the `webrtcvad` package is installed it is used as well (aggressiveness
+    0-3, None to skip it): a block counts as speech only if it passes the
+    energy gate and webrtcvad agrees. webrtcvad only takes 10, 20 or 30 ms
+    blocks; other block sizes fall back to the energy gate alone.
+    """
+
+    def __init__(self, samplerate=16000, ratio=3.0, min_rms=300.0, aggressiveness=2):
+        self.samplerate = samplerate
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.noise_floor = min_rms / ratio
+        self.webrtc = None
+        if aggressiveness is not None and webrtcvad is not None:
+            self.webrtc = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, pcm, gain=1.0):
+        """`gain` raises the energy gate, e.g. while our own prompt is playing."""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+        threshold = max(self.min_rms, self.noise_floor * self.ratio) * gain
+
+        speech = rms > threshold
+        if speech and self.webrtc is not None and webrtcvad.valid_rate_and_frame_length(
+                self.samplerate, len(pcm) // 2):
+            speech = self.webrtc.is_speech(pcm, self.samplerate)
+        if not speech:
+            # Track the background level slowly so engine noise doesn't count as speech.
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+
+class AudioStream:
+    """One long-lived microphone stream, segmented into utterances by a VAD.
+
+    The input stream is opened once and never closed between turns. A worker
+    thread runs the VAD over 30 ms blocks and publishes "start" / "audio" /
+    "end" events; consumers pull one utterance at a time with utterance(),
+    getting its audio while the customer is still talking. The last few
+    seconds are kept in a ring buffer so an utterance starts with a short
+    pre-roll instead of clipping its first syllable.
+
+    The stream keeps listening while we talk. `echo_gain()` returns the VAD
+    gate multiplier to use (raised while a prompt plays so our own audio is
+    not picked up) and `on_speech_start()` is called when speech starts; if
+    it returns True the utterance counts as a barge-in and survives the
+    flush() at the start of the next turn.
+    """
+
+    def __init__(self, samplerate=16000, block_ms=30, device=None, hangover=1.0, preroll=0.3,
+                 start_frames=3, buffer_seconds=10.0, vad=None, on_speech_start=None, echo_gain=None):
+        self.samplerate = samplerate
+        self.blocksize = int(samplerate * block_ms / 1000)
+        self.block_seconds = self.blocksize / samplerate
+        self.device = device
+        self.hangover = hangover
+        self.start_frames = start_frames
+        self.vad = vad or EnergyVad(samplerate)
+        self.on_speech_start = on_speech_start
+        self.echo_gain = echo_gain
+
+        self.ring = deque(maxlen=max(1, int(buffer_seconds / self.block_seconds)))
+        self.preroll_blocks = max(1, int(preroll / self.block_seconds))
+
+        self.blocks = queue.Queue()
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_speech = False
+        self.discard_current = False  # swallow the rest of an utterance flushed mid-way
+        self.barge_in = False  # current utterance started over one of our prompts
+        self.stream = None
+        self.thread = None
+        self.running = False
+
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            print(status, flush=True)
+        self.blocks.put((time.monotonic(), bytes(indata)))
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._segment_loop, daemon=True)
+        self.thread.start()
+        self.stream = sd.RawInputStream(samplerate=self.samplerate, blocksize=self.blocksize, dtype='int16',
+                                        channels=1, device=self.device, callback=self._callback)
+        self.stream.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        self.blocks.put(None)
+
+    def _segment_loop(self):
+        voiced_run = 0
+        silence = 0.0
+        while self.running:
+            item = self.blocks.get()
+            if item is None:
+                break
+            timestamp, pcm = item
+            self.ring.append(pcm)
+            speech = self.vad.is_speech(pcm, gain=self.echo_gain() if self.echo_gain else 1.0)
+
+            with self.lock:
+                if not self.in_speech:
+                    voiced_run = voiced_run + 1 if speech else 0
+                    if voiced_run >= self.start_frames:
+                        self.in_speech = True
+                        silence = 0.0
+                        if self.on_speech_start is not None:
+                            self.barge_in = bool(self.on_speech_start())
+                        self.events.put(("start", timestamp))
+                        # Hand over the pre-roll plus the frames that triggered us.
+                        for block in list(self.ring)[-(self.preroll_blocks + self.start_frames):]:
+                            self.events.put(("audio", block))
+                    continue
+
+                silence = 0.0 if speech else silence + self.block_seconds
+                ended = silence >= self.hangover
+                if not self.discard_current:
+                    self.events.put(("audio", pcm))
+                    if ended:
+                        self.events.put(("end", timestamp))
+                if ended:
+                    self.in_speech = False
+                    self.discard_current = False
+                    voiced_run = 0
+
+    def flush(self):
+        """Drop all queued audio, including the rest of an utterance in progress.
+
+        Called at the start of a turn so nothing heard before it (the previous
+        turn, our own prompt) leaks into the next transcript. An utterance
+        that barged in on a prompt is kept: it is the answer to that prompt.
+        """
+        with self.lock:
+            pending = []
+            while True:
+                try:
+                    pending.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+            barge_in, self.barge_in = self.barge_in, self.barge_in and self.in_speech
+            if barge_in:
+                starts = [i for i, (kind, _) in enumerate(pending) if kind == "start"]
+                if starts:
+                    for event in pending[starts[-1]:]:
+                        self.events.put(event)
+                    return
+            if self.in_speech:
+                self.discard_current = True
+
+    def interrupt(self):
+        """Make a blocked utterance() raise ListenCancelled, e.g. when the session is cancelled."""
+        self.events.put(("cancel", None))
+
+    def utterance(self, timeout=None, max_duration=15.0):
+        """Yield the PCM blocks of the next utterance as they arrive.
+
+        Returns without yielding anything if no speech starts within `timeout`
+        seconds; an utterance is cut off after `max_duration` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                kind, payload = self.events.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if kind == "cancel":
+                raise ListenCancelled()
+            if kind == "start":
+                break
+
+        started = time.monotonic()
+        while True:
+            kind, payload = self.events.get()
+            if kind == "cancel":
+                raise ListenCancelled()
+            if kind == "end":
+                return
+            if kind == "audio":
+                yield payload
+            if time.monotonic() - started > max_duration:
+                return
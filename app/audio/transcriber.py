@@ -1,65 +1,123 @@
-import queue
-import sounddevice as sd
 import json
+import time
+import wave
+
 from vosk import Model, KaldiRecognizer
 
+from app.audio.stream import AudioStream
+from app.audio.grammar import MenuGrammar
+from app.utils import metrics
+
+UTTERANCE_SECONDS = metrics.Histogram("drive_thru_asr_utterance_seconds",
+                                      "First audio block of an utterance to its transcript", labelnames=("lane",))
+# Kaldi's final decode after the VAD closed the utterance; the VAD hang-over comes on top.
+FINALIZE_SECONDS = metrics.Histogram("drive_thru_asr_finalize_seconds", "End of utterance audio to transcript",
+                                     labelnames=("lane",), log_events=True)
+
 class VoskTranscriber:
-    def __init__(self, model_path="models/vosk-model-small-en-us-0.15"):
-        self.model = Model(model_path)
+    def __init__(self, model_path="models/vosk-model-small-en-us-0.15", device=None, hangover=1.0, menu_grammar=True,
+                 model=None, grammar=None, live=True, lane=""):
+        # A Model is read-only once loaded; lanes pass in one shared instance.
+        self.model = model or Model(model_path)
         self.samplerate = 16000
-        self.q = queue.Queue()
+        self.lane = lane  # metrics label only
+        self.grammar = (grammar or MenuGrammar()) if menu_grammar else None
+        # One stream for the whole session; the VAD's hang-over is the
+        # "seconds of silence to consider speech over". live=False skips the
+        # microphone entirely, for transcribe_file() only.
+        self.stream = None
+        if live:
+            self.stream = AudioStream(samplerate=self.samplerate, device=device, hangover=hangover).start()
+
+    def _recognizer(self, use_grammar=True):
+        if use_grammar and self.grammar is not None:
+            recognizer = KaldiRecognizer(self.model, self.samplerate, self.grammar.get())
+        else:
+            recognizer = KaldiRecognizer(self.model, self.samplerate)
+        recognizer.SetWords(True)
+        return recognizer
+
+    def _decode_utterance(self, recognizer, timeout=None, on_partial=None):
+        """Feed one utterance to the recognizer while it is spoken; returns its final text.
 
-    def _callback(self, indata, frames, time, status):
-        if status:
-            print(status, flush=True)
-        self.q.put(bytes(indata))
+        on_partial(text) is called with the running transcript after every block.
+        """
+        return self._decode_chunks(recognizer, self.stream.utterance(timeout=timeout), on_partial)
+
+    def _decode_chunks(self, recognizer, chunks, on_partial=None):
+        heard = False
+        segments = []  # Kaldi may endpoint inside a long utterance
+        started = None
+        for chunk in chunks:
+            if not heard:
+                started = time.perf_counter()
+            heard = True
+            if recognizer.AcceptWaveform(chunk):
+                text = json.loads(recognizer.Result()).get("text", "").strip()
+                if text:
+                    segments.append(text)
+                partial = ""
+            else:
+                partial = json.loads(recognizer.PartialResult()).get("partial", "").strip()
+            if on_partial is not None:
+                on_partial(" ".join(segments + [partial]).strip())
+        if not heard:
+            return ""
+        with FINALIZE_SECONDS.time(lane=self.lane) as span:
+            segments.append(json.loads(recognizer.FinalResult()).get("text", "").strip())
+            text = " ".join(s for s in segments if s)
+            span.note(words=len(text.split()))
+        UTTERANCE_SECONDS.observe(time.perf_counter() - started, lane=self.lane)
+        return text
 
     def transcribe_once(self):
         """Short transcription for things like getting the user's name."""
-        recognizer = KaldiRecognizer(self.model, self.samplerate)
-
-        with sd.RawInputStream(samplerate=self.samplerate, blocksize=8000, dtype='int16',
-                               channels=1, callback=self._callback):
-            print("Listening...")
-            while True:
-                data = self.q.get()
-                if recognizer.AcceptWaveform(data):
-                    result = recognizer.Result()
-                    text = json.loads(result).get("text", "").strip()
-                    if text:
-                        return text
-
-    def transcribe_order(self, ui, timeout=3.0):
-        """Longer transcription loop that waits until silence."""
-        recognizer = KaldiRecognizer(self.model, self.samplerate)
-        recognizer.SetWords(True)
+        self.stream.flush()
+        print("Listening...")
+        while True:
+            recognizer = KaldiRecognizer(self.model, self.samplerate)
+            text = self._decode_utterance(recognizer)
+            if text:
+                return text
 
-        with sd.RawInputStream(samplerate=self.samplerate, blocksize=8000, dtype='int16',
-                               channels=1, callback=self._callback):
-            ui.set_status_text("Listening...")
-            silence_duration = 0.0
-            silence_threshold = 1.0  # seconds of silence to consider speech over
-
-            collected_text = ""
-            silence_counter = 0
-
-            while True:
-                data = self.q.get()
-                if recognizer.AcceptWaveform(data):
-                    result = recognizer.Result()
-                    text = json.loads(result).get("text", "").strip()
-                    if text:
-                        collected_text += " " + text
-                        silence_counter = 0  # reset on speech
-                    else:
-                        silence_counter += 1
-                else:
-                    partial = json.loads(recognizer.PartialResult()).get("partial", "")
-                    if not partial:
-                        silence_counter += 1
-
-                if silence_counter * 0.25 > silence_threshold:
-                    break
+    def transcribe_order(self, ui=None, timeout=None, use_grammar=True, on_partial=None):
+        """Transcribe the next utterance; returns "" if nobody starts talking within `timeout` seconds.
+
+        With `use_grammar` the decoder is restricted to the menu grammar;
+        otherwise it is free dictation like transcribe_once(). on_partial
+        receives the partial transcript as it grows (see SpeculativeParser).
+        Pass ui=None when calling off the Qt thread.
+        """
+        recognizer = self._recognizer(use_grammar)
 
+        self.stream.flush()
+        if ui is not None:
+            ui.set_status_text("Listening...")
+        text = self._decode_utterance(recognizer, timeout=timeout, on_partial=on_partial)
+        if ui is not None:
             ui.set_status_text("Processing...")
-            return collected_text.strip()
+        return text
+
+    def transcribe_file(self, path, use_grammar=True, on_partial=None, realtime=False, block_ms=100):
+        """Transcribe a recorded utterance (16 kHz mono 16-bit WAV) exactly as a live one.
+
+        With `realtime` the blocks are fed at the pace they were spoken, so
+        the time after the last block is the latency a customer would see.
+        """
+        with wave.open(path, "rb") as wav:
+            if wav.getframerate() != self.samplerate or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected {self.samplerate} Hz mono 16-bit PCM")
+            pcm = wav.readframes(wav.getnframes())
+
+        block = self.samplerate * block_ms // 1000 * 2
+
+        def chunks():
+            started = time.monotonic()
+            for i, offset in enumerate(range(0, len(pcm), block)):
+                if realtime:
+                    delay = started + i * block_ms / 1000.0 - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield pcm[offset:offset + block]
+
+        return self._decode_chunks(self._recognizer(use_grammar), chunks(), on_partial)
@@ -1,33 +1,290 @@
-import pyttsx3
-import threading
+import os
 import queue
+import re
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pyttsx3
+import sounddevice as sd
+
+from app.utils import metrics
+
+RENDER_SECONDS = metrics.Histogram("drive_thru_tts_render_seconds", "Waiting for a prompt's PCM clip",
+                                   labelnames=("lane",))
+PLAY_SECONDS = metrics.Histogram("drive_thru_tts_play_seconds", "Prompt playback, to the end or the barge-in",
+                                 labelnames=("lane", "outcome"), log_events=True)
+QUEUE_DEPTH = metrics.Gauge("drive_thru_tts_queue_depth", "Prompts waiting to be spoken", labelnames=("lane",))
+
+# Prompts spoken on every visit; rendered once at startup.
+PHRASES = [
+    "Welcome. Please state your name.",
+    "Please place your order now.",
+    "Do you need anything else? If not, please say 'I am done.'",
+]
+
+# Prompts with a customer name in them. The fixed parts are pre-rendered and
+# only the name is synthesized live.
+TEMPLATES = [
+    "Welcome back, {name}!",
+    "Thank you {name}, you are now registered.",
+]
+
+
+def _template_pattern(template):
+    before, after = template.split("{name}")
+    return re.compile(re.escape(before) + r"(?P<name>.+?)" + re.escape(after) + "$"), before, after
 
-class TextToSpeech:
-    def __init__(self):
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 170)
-        self.engine.setProperty('volume', 1.0)
+
+def _trim(pcm, threshold=200):
+    """Strip leading/trailing near-silence so concatenated pieces don't leave gaps."""
+    loud = np.flatnonzero(np.abs(pcm).max(axis=1) > threshold)
+    if not len(loud):
+        return pcm[:0]
+    return pcm[loud[0]:loud[-1] + 1]
+
+
+class SpeechRenderer:
+    """Owns the pyttsx3 engine and turns text into PCM clips on its own thread.
+
+    pyttsx3 hands out one engine per process, so every TextToSpeech (one per
+    lane) shares a renderer. Fixed prompts and the fixed parts of templated
+    prompts are rendered when the thread starts; other text is rendered on
+    first use and kept in an LRU of `cache_size` clips.
+    """
+
+    def __init__(self, rate=170, volume=1.0, cache_size=64):
+        self.rate = rate
+        self.volume = volume
+        self.cache_size = cache_size
+
+        self.phrases = {}  # text -> (pcm, samplerate)
+        self.dynamic = OrderedDict()
+        self.templates = [_template_pattern(t) for t in TEMPLATES]
+        self.ready = threading.Event()
+
+        self.saying = None  # interrupt Event of the live say() in progress
 
         self.queue = queue.Queue()
         self.thread = threading.Thread(target=self._process_queue, daemon=True)
         self.thread.start()
 
-    def speak(self, text: str):
-        self.queue.put(text)
+    def clip(self, text):
+        """Future for (pcm, samplerate), or None if this driver cannot render to a file."""
+        future = Future()
+        self.queue.put(("clip", text, future, None))
+        return future
+
+    def say(self, text, interrupt=None):
+        """Future for speaking `text` live through the engine (fallback when clip() gives None).
+
+        Setting `interrupt` (a threading.Event) stops it at the next word; the
+        Future then holds False.
+        """
+        future = Future()
+        self.queue.put(("say", text, future, interrupt))
+        return future
 
     def _process_queue(self):
+        # pyttsx3 engines are not thread safe: create and use it only here.
+        self.engine = pyttsx3.init()
+        self.engine.setProperty('rate', self.rate)
+        self.engine.setProperty('volume', self.volume)
+        self.engine.connect('started-word', self._on_word)
+        self._prerender()
+        self.ready.set()
+
         while True:
-            text = self.queue.get()
-            self.engine.say(text)
+            kind, text, future, interrupt = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if kind == "say":
+                    self.saying = interrupt
+                    try:
+                        self.engine.say(text)
+                        self.engine.runAndWait()
+                    finally:
+                        self.saying = None
+                    future.set_result(interrupt is None or not interrupt.is_set())
+                else:
+                    future.set_result(self._clip(text))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _on_word(self, name, location, length):
+        # pyttsx3 only allows stop() from inside its own loop, so barge-in is
+        # checked here, once per word.
+        if self.saying is not None and self.saying.is_set():
+            self.engine.stop()
+
+    def _prerender(self):
+        parts = list(PHRASES)
+        for _, before, after in self.templates:
+            parts.extend(p for p in (before, after) if p.strip(" ,.!?"))
+        for text in parts:
+            try:
+                self.phrases[text] = self._render(text)
+            except Exception as e:
+                print(f"[WARN] Could not pre-render {text!r}: {e}")
+                return
+        print(f"[INFO] Pre-rendered {len(self.phrases)} TTS phrases")
+
+    def _render(self, text):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, path)
             self.engine.runAndWait()
+            with wave.open(path, "rb") as w:
+                if w.getsampwidth() != 2:
+                    raise ValueError(f"unsupported sample width {w.getsampwidth()}")
+                frames = w.readframes(w.getnframes())
+                pcm = np.frombuffer(frames, dtype=np.int16).reshape(-1, w.getnchannels())
+                return pcm, w.getframerate()
+        finally:
+            os.remove(path)
+
+    def _render_cached(self, text):
+        clip = self.dynamic.get(text)
+        if clip is not None:
+            self.dynamic.move_to_end(text)
+            return clip
+        clip = self._render(text)
+        self.dynamic[text] = clip
+        while len(self.dynamic) > self.cache_size:
+            self.dynamic.popitem(last=False)
+        return clip
+
+    def _clip(self, text):
+        """PCM for `text`, from the phrase cache where possible; None if rendering fails."""
+        if text in self.phrases:
+            return self.phrases[text]
+        try:
+            for pattern, before, after in self.templates:
+                match = pattern.match(text)
+                fixed = [p for p in (before, after) if p.strip(" ,.!?")]
+                if not match or not all(p in self.phrases for p in fixed):
+                    continue
+                name = self._render_cached(match.group("name"))
+                pieces = [self.phrases[before]] if before in fixed else []
+                pieces.append(name)
+                if after in fixed:
+                    pieces.append(self.phrases[after])
+                samplerate = name[1]
+                if all(rate == samplerate for _, rate in pieces):
+                    return np.concatenate([_trim(pcm) for pcm, _ in pieces]), samplerate
+            return self._render_cached(text)
+        except Exception as e:
+            print(f"[WARN] TTS render failed, speaking live: {e}")
+            return None
+
+
+class TextToSpeech:
+    """Speech output for one lane: a single playback worker on one output device.
+
+    speak() returns a Future that completes when the audio has finished
+    playing, with False if it was cut off by barge_in(). Clips come from a
+    SpeechRenderer, which may be shared between lanes.
+
+    Playback is written in short blocks so it can be stopped mid-prompt
+    when the customer starts talking over it.
+    """
+
+    def __init__(self, rate=170, volume=1.0, cache_size=64, device=None, echo_gain=2.5, block_ms=50,
+                 renderer=None, lane=""):
+        self.renderer = renderer or SpeechRenderer(rate, volume, cache_size)
+        self.lane = lane  # metrics label only
+        self.device = device
+        self.gain_while_playing = echo_gain
+        self.block_ms = block_ms
+        self.playing = threading.Event()
+        self.interrupt = threading.Event()
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._process_queue, daemon=True)
+        self.thread.start()
+
+    def speak(self, text: str):
+        future = Future()
+        self.queue.put((text, future))
+        QUEUE_DEPTH.set(self.queue.qsize(), lane=self.lane)
+        return future
 
     def speak_blocking(self, text: str):
-        done = threading.Event()
+        """Speak and wait; returns False if the customer interrupted the prompt."""
+        return self.speak(text).result()
 
-        def wrapped():
-            self.engine.say(text)
-            self.engine.runAndWait()
-            done.set()
+    def is_playing(self):
+        return self.playing.is_set()
+
+    def barge_in(self):
+        """Stop the prompt being played, if any. Returns True if something was cut off.
+
+        Used as the AudioStream speech-start listener; it only sets a flag and
+        never blocks.
+        """
+        if not self.playing.is_set():
+            return False
+        self.interrupt.set()
+        return True
+
+    def echo_gain(self):
+        """VAD gate multiplier for the microphone: raised while our own audio is playing."""
+        return self.gain_while_playing if self.playing.is_set() else 1.0
+
+    def _process_queue(self):
+        while True:
+            text, future = self.queue.get()
+            QUEUE_DEPTH.set(self.queue.qsize(), lane=self.lane)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with RENDER_SECONDS.time(lane=self.lane):
+                    clip = self.renderer.clip(text).result()
+                started = time.perf_counter()
+                if clip is None:
+                    # Rendering to a file is not supported by this driver.
+                    completed = self._say_live(text)
+                else:
+                    completed = self._play(*clip)
+                PLAY_SECONDS.observe(time.perf_counter() - started, lane=self.lane,
+                                     outcome="completed" if completed else "interrupted")
+                future.set_result(completed)
+            except Exception as e:
+                print(f"[ERROR] TTS failed for {text!r}: {e}")
+                future.set_exception(e)
+
+    def _say_live(self, text):
+        """Speak through the engine; barge_in() stops it at the next word. Returns False if it did."""
+        self.interrupt.clear()
+        self.playing.set()
+        try:
+            completed = self.renderer.say(text, interrupt=self.interrupt).result()
+        finally:
+            self.playing.clear()
+        if not completed:
+            print("[INFO] Prompt interrupted by customer")
+        return completed
 
-        threading.Thread(target=wrapped, daemon=True).start()
-        done.wait()
+    def _play(self, pcm, samplerate):
+        """Play a clip block by block; returns False if barge_in() stopped it."""
+        block = max(1, int(samplerate * self.block_ms / 1000))
+        self.interrupt.clear()
+        with sd.OutputStream(samplerate=samplerate, channels=pcm.shape[1], dtype='int16',
+                             device=self.device) as out:
+            self.playing.set()
+            try:
+                for start in range(0, len(pcm), block):
+                    if self.interrupt.is_set():
+                        out.abort()
+                        print("[INFO] Prompt interrupted by customer")
+                        return False
+                    out.write(np.ascontiguousarray(pcm[start:start + block]))
+            finally:
+                self.playing.clear()
+        return True
@@ -0,0 +1,338 @@
+"""Headless replay benchmark: recorded cars through the real pipeline, no camera, mic, Qt or Ollama.
+
+A manifest lists scenarios, each a video of a car arriving plus the
+customer's utterances as 16 kHz mono WAV files:
+
+    {
+      "scenarios": [
+        {
+          "name": "regular-two-items",
+          "video": "car1.mp4",
+          "utterances": [
+            {"wav": "car1-1.wav", "text": "two veggie burgers and a soda"},
+            {"wav": "car1-2.wav", "text": "that's all"}
+          ],
+          "expected_order": [{"item": "veggie burger", "quantity": 2}, {"item": "soda", "quantity": 1}]
+        }
+      ]
+    }
+
+Paths are relative to the manifest. "text" is the reference transcript: it
+is used for the word error rate, and instead of the WAV with --no-asr.
+Frames go through FramePreprocessor, FaceDetector and FaceRecognizer, WAVs
+through VoskTranscriber, and transcripts through LlmEngine (against the
+Ollama stub replaying --responses, unless --ollama-url is given) into an
+OrderSession.
+
+End to end is "car arrives -> first item confirmed": from the first frame
+with a face, through recognition, the first utterance's transcription and
+its parse, to the first item applied to the order. The greeting is not
+included, nor is the time the customer spends speaking unless --realtime.
+
+    python -m app.bench.replay bench/manifest.json --responses bench/responses.json
+    python -m app.bench.replay bench/manifest.json --ollama-url http://localhost:11434 --record bench/responses.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from app.nlp import ollama_stub
+from app.nlp.llm_engine import LlmEngine, compact_order
+from app.order.menu_catalog import MenuCatalog
+from app.order.order_session import CONFIRM_PHRASES, OrderSession
+from app.vision.detector import FaceDetector
+from app.vision.preprocess import FramePreprocessor
+from app.vision.recognizer import FaceRecognizer
+
+STAGES = ["preprocess", "detect", "recognize", "asr", "asr_tail", "llm", "llm_first_item", "apply"]
+
+
+def summarize(samples):
+    """count/mean/p50/p95/p99/max of a list of durations in seconds, reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "mean": round(float(ms.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(ms.max()), 3)}
+
+
+def word_error_rate(reference, hypothesis):
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return float(bool(hyp))
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ReplayBench:
+    """Replays scenarios through the pipeline stages and collects per-stage latencies."""
+
+    def __init__(self, preprocessor, detector, recognizer, transcriber, engine, catalog, use_grammar=True,
+                 realtime=False, max_frames=None):
+        self.preprocessor = preprocessor
+        self.detector = detector
+        self.recognizer = recognizer
+        self.transcriber = transcriber  # None: use the reference transcripts
+        self.engine = engine
+        self.catalog = catalog
+        self.use_grammar = use_grammar
+        self.realtime = realtime
+        self.max_frames = max_frames
+
+        self.samples = defaultdict(list)
+        self.end_to_end = []
+        self.recorded = []  # LLM replies, for --record
+
+    def _timed(self, stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples[stage].append(time.perf_counter() - started)
+        return result
+
+    def run_scenario(self, scenario, base_dir):
+        name = scenario.get("name", scenario.get("video", "scenario"))
+        result = {"name": name}
+
+        if scenario.get("video"):
+            self._replay_video(os.path.join(base_dir, scenario["video"]), result)
+
+        session = OrderSession(catalog=self.catalog)
+        session.begin()
+        order_started = time.perf_counter()
+        first_item_at = self._take_order(scenario.get("utterances", []), base_dir, session, result)
+
+        # Arrival -> recognition, then first utterance -> first item; without a
+        # face in the video the clock starts at the first utterance.
+        if first_item_at is not None:
+            seconds = result.get("vision_seconds", 0.0) + (first_item_at - order_started)
+            self.end_to_end.append(seconds)
+            result["end_to_end_ms"] = round(seconds * 1000.0, 3)
+
+        result["order"] = session.items
+        expected = scenario.get("expected_order")
+        if expected is not None:
+            want = sorted((self.catalog.resolve(e["item"]) or e["item"].lower(), e.get("quantity", 1))
+                          for e in expected)
+            got = sorted((e["item"], e["quantity"]) for e in session.items)
+            result["order_correct"] = want == got
+        return result
+
+    def _replay_video(self, path, result):
+        """Run every frame through preprocess/detect, recognizing each detected face.
+
+        result["vision_seconds"] is the time from starting on the first frame
+        with a face (the car arriving) to its recognition.
+        """
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise RuntimeError(f"Could not open video {path}")
+        frames = faces = 0
+        arrived = False
+        try:
+            while self.max_frames is None or frames < self.max_frames:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames += 1
+                frame_started = time.perf_counter()
+                pframe = self._timed("preprocess", self.preprocessor.process, frame)
+                boxes = self._timed("detect", self.detector.detect, pframe)
+                if not boxes:
+                    continue
+                faces += len(boxes)
+                crops = [pframe.gray_crop(box) for box in boxes]
+                matches = self._timed("recognize", self.recognizer.identify_faces, crops)
+                if not arrived:
+                    arrived = True
+                    result["arrival_frame"] = frames - 1
+                    result["vision_seconds"] = time.perf_counter() - frame_started
+                    result["customer"] = matches[0][1]
+        finally:
+            capture.release()
+        result["frames"] = frames
+        result["faces"] = faces
+
+    def _take_order(self, utterances, base_dir, session, result):
+        """Transcribe and parse each utterance; returns the time the first item was applied."""
+        first_item_at = None
+        wers = []
+        turns = []
+        for utterance in utterances:
+            reference = utterance.get("text", "")
+            if self.transcriber is not None and utterance.get("wav"):
+                path = os.path.join(base_dir, utterance["wav"])
+                text = self._timed("asr", self.transcriber.transcribe_file, path, use_grammar=self.use_grammar,
+                                   realtime=self.realtime)
+                if self.realtime:
+                    # What the customer waits for after they stop talking.
+                    with wave.open(path, "rb") as wav:
+                        audio_seconds = wav.getnframes() / wav.getframerate()
+                    self.samples["asr_tail"].append(max(0.0, self.samples["asr"][-1] - audio_seconds))
+                if reference:
+                    wers.append(word_error_rate(reference, text))
+            else:
+                text = reference
+            turn = {"heard": text}
+            turns.append(turn)
+
+            if any(phrase in text.lower() for phrase in CONFIRM_PHRASES):
+                break
+            if not text.strip():
+                continue
+
+            current_order = session.get_current_order_json()
+            parse_started = time.perf_counter()
+            streamed = []
+
+            def on_item(item):
+                nonlocal first_item_at
+                if not streamed:
+                    self.samples["llm_first_item"].append(time.perf_counter() - parse_started)
+                streamed.append(item)
+                self._timed("apply", session.update_from_llm, {"order": [item]})
+                if first_item_at is None:
+                    first_item_at = time.perf_counter()
+
+            response = self._timed("llm", self.engine.stream_order, text, current_order, on_item=on_item)
+            if not streamed:
+                self._timed("apply", session.update_from_llm, json.loads(response))
+            self.recorded.append({"utterance": text,
+                                  "order": compact_order(self.engine._current_items(current_order)),
+                                  "response": json.loads(response)})
+            turn["items"] = len(streamed)
+        result["turns"] = turns
+        if wers:
+            result["wer"] = round(float(np.mean(wers)), 4)
+        return first_item_at
+
+    def report(self, scenarios, config):
+        wers = [s["wer"] for s in scenarios if "wer" in s]
+        checked = [s["order_correct"] for s in scenarios if "order_correct" in s]
+        return {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": git_revision(),
+            "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                         "system": platform.system(), "cpus": os.cpu_count(), "opencv": cv2.__version__},
+            "config": config,
+            "stages": {stage: summarize(self.samples[stage]) for stage in STAGES},
+            "end_to_end": summarize(self.end_to_end),
+            "accuracy": {
+                "wer": round(float(np.mean(wers)), 4) if wers else None,
+                "orders_correct": sum(checked),
+                "orders_checked": len(checked),
+            },
+            "llm_calls": self.engine.total_usage["calls"],
+            "scenarios": scenarios,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded cars through the pipeline and report latencies.")
+    parser.add_argument("manifest", help="scenario manifest (see module docstring)")
+    parser.add_argument("--out", help="results file (default: bench_results/replay-<time>.json)")
+    parser.add_argument("--menu", help="menu.json to use instead of app/data/menu.json")
+    parser.add_argument("--face-dir", default="known_faces")
+    parser.add_argument("--recognizer", choices=["lbph", "numpy"], default="numpy")
+    parser.add_argument("--detection-level", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, help="stop each video after this many frames")
+    parser.add_argument("--vosk-model", default="models/vosk-model-small-en-us-0.15")
+    parser.add_argument("--no-asr", action="store_true", help="use the reference transcripts instead of the WAVs")
+    parser.add_argument("--no-grammar", action="store_true", help="free dictation instead of the menu grammar")
+    parser.add_argument("--realtime", action="store_true", help="feed audio at speaking pace")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every turn to the LLM")
+    parser.add_argument("--prompt-mode", choices=["delta", "full"], default="delta")
+    parser.add_argument("--ollama-url", help="real Ollama to use instead of the built-in stub")
+    parser.add_argument("--responses", help="recorded replies for the stub (see --record)")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="stub time to first token")
+    parser.add_argument("--stub-token-delay", type=float, default=0.0, help="stub time per streamed chunk")
+    parser.add_argument("--record", help="write the LLM replies seen in this run here, for later --responses")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, 'r') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+
+    catalog = MenuCatalog(args.menu) if args.menu else MenuCatalog.default()
+    server = None
+    base_url = args.ollama_url
+    if base_url is None:
+        server = ollama_stub.serve(port=0, delay=args.stub_delay, token_delay=args.stub_token_delay,
+                                   menu_path=catalog.path, responses_path=args.responses)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    transcriber = None
+    if not args.no_asr:
+        # Imported here so --no-asr runs without Vosk or an audio stack installed.
+        from app.audio.grammar import MenuGrammar
+        from app.audio.transcriber import VoskTranscriber
+        transcriber = VoskTranscriber(model_path=args.vosk_model, menu_grammar=not args.no_grammar,
+                                      grammar=MenuGrammar(catalog), live=False)
+
+    # The LBPH model and its state file go to a scratch dir, never over the
+    # app's trained_model.yml; nor does the bench compact the shared gallery.
+    model_dir = tempfile.TemporaryDirectory(prefix="replay-model-")
+    bench = ReplayBench(
+        preprocessor=FramePreprocessor(detection_level=args.detection_level),
+        detector=FaceDetector(),
+        recognizer=FaceRecognizer(model_path=os.path.join(model_dir.name, "trained_model.yml"),
+                                  face_dir=args.face_dir, backend=args.recognizer, compact_fraction=1.0),
+        transcriber=transcriber,
+        engine=LlmEngine(fast_path=not args.no_fast_path, cache_path=None, prompt_mode=args.prompt_mode,
+                         base_url=base_url, catalog=catalog),
+        catalog=catalog,
+        use_grammar=not args.no_grammar,
+        realtime=args.realtime,
+        max_frames=args.max_frames,
+    )
+
+    scenarios = []
+    for scenario in manifest.get("scenarios", []):
+        print(f"[INFO] Replaying {scenario.get('name', scenario.get('video'))}")
+        scenarios.append(bench.run_scenario(scenario, base_dir))
+    if server is not None:
+        server.shutdown()
+    model_dir.cleanup()
+
+    results = bench.report(scenarios, vars(args))
+    out = args.out or os.path.join("bench_results", time.strftime("replay-%Y%m%d-%H%M%S.json"))
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(bench.recorded, f, indent=2)
+
+    print(f"{'stage':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in list(results["stages"].items()) + [("end_to_end", results["end_to_end"])]:
+        if stats["count"]:
+            print(f"{stage:<16}{stats['count']:>6}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    print(f"[INFO] Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
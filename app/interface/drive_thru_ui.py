@@ -1,14 +1,85 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QTextBrowser, QVBoxLayout, QHBoxLayout, QTextEdit
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QPixmap, QImage
 import sys
-import json
 import os
 import cv2
 
+from app.order.menu_catalog import MenuCatalog
+
+class LanePane(QWidget):
+    """Video feed, status bar and transcript for one lane."""
+
+    def __init__(self, title=None):
+        super().__init__()
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        if title:
+            self.title_label = QLabel(title)
+            self.title_label.setAlignment(Qt.AlignCenter)
+            self.title_label.setStyleSheet("font-size: 18px; font-weight: bold;")
+            layout.addWidget(self.title_label, stretch=0)
+
+        self.video_label = QLabel("Video Feed Here")
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.video_label.setStyleSheet("background-color: #222; color: white; font-size: 18px;")
+
+        self.status_label = QLabel("Idle")
+        self.status_label.setAlignment(Qt.AlignCenter)
+        self.status_label.setStyleSheet("background-color: #e0e0e0; padding: 5px; font-size: 14px;")
+
+        self.transcription_box = QTextEdit()
+        self.transcription_box.setReadOnly(True)
+        self.transcription_box.setStyleSheet("background-color: #f4f4f4; padding: 10px; font-size: 20px;")
+
+        layout.addWidget(self.video_label, stretch=1)
+        layout.addWidget(self.status_label, stretch=0)
+        layout.addWidget(self.transcription_box, stretch=1)
+
+    def set_video_frame(self, frame):
+        if not self.video_label or not self.video_label.size().isValid():
+            return
+
+        self.set_video_rgb(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def set_video_rgb(self, frame_rgb):
+        """Show a frame that is already in RGB order (no colour conversion)."""
+        if not self.video_label or not self.video_label.size().isValid():
+            return
+
+        h, w, ch = frame_rgb.shape
+        bytes_per_line = ch * w
+        q_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(q_image)
+        scaled_pixmap = pixmap.scaled(self.video_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.video_label.setPixmap(scaled_pixmap)
+
+    def set_status_text(self, text):
+        color_map = {
+            "Idle": ("#888888", "#FFFFFF"),
+            "Listening...": ("#007BFF", "#FFFFFF"),
+            "Processing...": ("#FFA500", "#000000"),
+            "Completed": ("#28A745", "#FFFFFF")
+        }
+        bg_color, text_color = color_map.get(text, ("#444444", "#FFFFFF"))
+        self.status_label.setText(text)
+        self.status_label.setStyleSheet(
+            f"background-color: {bg_color}; color: {text_color}; padding: 6px; font-size: 14px;"
+        )
+
+    def append_transcription(self, text):
+        self.transcription_box.append(text)
+
+
 class DriveThruUI(QWidget):
-    def __init__(self):
+    """Menu on the left and one LanePane per lane to the right of it."""
+
+    def __init__(self, lane_names=None, catalog=None):
         super().__init__()
+        self.lane_names = list(lane_names or ["Lane 1"])
+        self.catalog = catalog or MenuCatalog.default()
+        self.menu_version = None
         self.setWindowTitle("Drive-Thru Assistant")
         self.showMaximized()
         self.init_ui()
@@ -23,36 +94,39 @@ class DriveThruUI(QWidget):
         self.menu_browser.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.menu_browser.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.menu_browser.setFixedWidth(500)
-        self.menu_browser.setHtml(self.generate_menu_html())
+        self.refresh_menu()
+        # Redraw the menu panel when menu.json is edited.
+        self.menu_timer = QTimer(self)
+        self.menu_timer.timeout.connect(self.refresh_menu)
+        self.menu_timer.start(2000)
 
-        # Right: Video + Status + Transcription stacked with equal height
-        self.video_label = QLabel("Video Feed Here")
-        self.video_label.setAlignment(Qt.AlignCenter)
-        self.video_label.setStyleSheet("background-color: #222; color: white; font-size: 18px;")
-
-        self.status_label = QLabel("Idle")
-        self.status_label.setAlignment(Qt.AlignCenter)
-        self.status_label.setStyleSheet("background-color: #e0e0e0; padding: 5px; font-size: 14px;")
+        # Right: one pane per lane (video + status + transcription stacked with equal height)
+        titled = len(self.lane_names) > 1
+        self.panes = [LanePane(name if titled else None) for name in self.lane_names]
+        lanes_layout = QHBoxLayout()
+        for pane in self.panes:
+            lanes_layout.addWidget(pane, stretch=1)
 
-        self.transcription_box = QTextEdit()
-        self.transcription_box.setReadOnly(True)
-        self.transcription_box.setStyleSheet("background-color: #f4f4f4; padding: 10px; font-size: 20px;")
-
-        right_layout = QVBoxLayout()
-        right_layout.addWidget(self.video_label, stretch=1)
-        right_layout.addWidget(self.status_label, stretch=0)
-        right_layout.addWidget(self.transcription_box, stretch=1)
+        # Single-lane callers use the first pane's widgets directly.
+        self.video_label = self.panes[0].video_label
+        self.status_label = self.panes[0].status_label
+        self.transcription_box = self.panes[0].transcription_box
 
         # Final layout structure
         main_layout.addWidget(self.menu_browser, stretch=0)
-        main_layout.addLayout(right_layout, stretch=1)
+        main_layout.addLayout(lanes_layout, stretch=1)
         main_layout.setContentsMargins(10, 10, 10, 10)
         main_layout.setSpacing(20)
 
-    def generate_menu_html(self):
-        menu_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'menu.json')
-        with open(menu_path, 'r') as f:
-            menu_data = json.load(f)
+    def refresh_menu(self):
+        menu_data = self.catalog.menu
+        if self.catalog.version != self.menu_version:
+            self.menu_browser.setHtml(self.generate_menu_html(menu_data))
+            self.menu_version = self.catalog.version
+
+    def generate_menu_html(self, menu_data=None):
+        if menu_data is None:
+            menu_data = self.catalog.menu
 
         html = '<h2 style="text-align:center;">Menu</h2>'
         for section, items in menu_data.items():
@@ -73,32 +147,16 @@ class DriveThruUI(QWidget):
         return html
 
     def set_video_frame(self, frame):
-        if not self.video_label or not self.video_label.size().isValid():
-            return
+        self.panes[0].set_video_frame(frame)
 
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = frame_rgb.shape
-        bytes_per_line = ch * w
-        q_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
-        scaled_pixmap = pixmap.scaled(self.video_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.video_label.setPixmap(scaled_pixmap)
+    def set_video_rgb(self, frame_rgb):
+        self.panes[0].set_video_rgb(frame_rgb)
 
     def set_status_text(self, text):
-        color_map = {
-            "Idle": ("#888888", "#FFFFFF"),
-            "Listening...": ("#007BFF", "#FFFFFF"),
-            "Processing...": ("#FFA500", "#000000"),
-            "Completed": ("#28A745", "#FFFFFF")
-        }
-        bg_color, text_color = color_map.get(text, ("#444444", "#FFFFFF"))
-        self.status_label.setText(text)
-        self.status_label.setStyleSheet(
-            f"background-color: {bg_color}; color: {text_color}; padding: 6px; font-size: 14px;"
-        )
+        self.panes[0].set_status_text(text)
 
     def append_transcription(self, text):
-        self.transcription_box.append(text)
+        self.panes[0].append_transcription(text)
 
 if __name__ == '__main__':
     print("Run main.py instead to start the full application.")
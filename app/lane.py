@@ -0,0 +1,308 @@
+import json
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from app.audio.grammar import MenuGrammar
+from app.nlp.llm_gateway import LlmGateway, SPECULATIVE
+from app.nlp.speculative import SpeculativeParser
+from app.order.history import OrderHistory
+from app.order.journal import OrderJournal
+from app.order.menu_catalog import MenuCatalog
+from app.order.order_session import CONFIRM_PHRASES, OrderSession
+from app.vision.capture import FrameGrabber
+from app.vision.detector import FaceDetector
+from app.vision.preprocess import FramePreprocessor
+from app.vision.recognizer import FaceRecognizer
+from app.vision.tracker import FaceTracker
+from app.utils import metrics
+from app.utils.startup import StartupLoader
+
+DEFAULT_LANES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'lanes.json')
+DEFAULT_VOSK_MODEL = "models/vosk-model-small-en-us-0.15"
+DEFAULT_JOURNAL_DIR = "order_journal"
+DEFAULT_HISTORY_DB = "order_history.db"
+
+FRAME_SECONDS = metrics.Histogram("drive_thru_frame_seconds", "process_frame time, capture excluded",
+                                  labelnames=("lane",))
+
+LANE_DEFAULTS = {
+    "camera": 0,          # cv2.VideoCapture source: device index, file or stream URL
+    "microphone": None,   # sounddevice input device (index or name); None = system default
+    "speaker": None,      # sounddevice output device
+    "detect_interval": 10,
+}
+
+
+def load_lanes_config(path=None):
+    """Read the lanes file; returns (settings dict, list of per-lane dicts with defaults filled in)."""
+    path = path or DEFAULT_LANES_PATH
+    if not os.path.exists(path):
+        print(f"[WARN] No lanes file at {path}; running a single lane on the default devices")
+        config = {}
+    else:
+        with open(path, 'r') as f:
+            config = json.load(f)
+
+    lanes = []
+    for i, entry in enumerate(config.get("lanes") or [{}]):
+        lane = dict(LANE_DEFAULTS)
+        lane["name"] = f"Lane {i + 1}"
+        lane["journal_dir"] = config.get("journal_dir", DEFAULT_JOURNAL_DIR)
+        lane.update(entry)
+        lanes.append(lane)
+    names = [lane["name"] for lane in lanes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Lane names must be unique: {names}")
+    return config, lanes
+
+
+class SharedModels:
+    """Everything that is loaded once per process and used read-only by every lane.
+
+    The menu and order history are ready at once; the models load
+    concurrently in the background through `loader` and stay None until
+    their component is ready. Vosk, pyttsx3 and langchain are imported by
+    their loaders, so none of them delays the window and cameras.
+    """
+
+    # What a lane needs before it can serve a car; "llm_warmup" is not one of them.
+    REQUIRED = ("detector", "recognizer", "vosk_model", "speech", "llm")
+
+    def __init__(self, vosk_model_path=DEFAULT_VOSK_MODEL, llm_workers=1, ollama_url=None,
+                 history_db=DEFAULT_HISTORY_DB, warm_up=True, recognizer_backend="lbph"):
+        self.vosk_model_path = vosk_model_path
+        self.recognizer_backend = recognizer_backend
+        self.llm_workers = llm_workers
+        self.ollama_url = ollama_url
+
+        self.catalog = MenuCatalog.default()
+        self.grammar = MenuGrammar(self.catalog)
+        self.history = OrderHistory(history_db)
+        self.vosk_model = None
+        self.detector = None
+        self.recognizer = None
+        self.llm_engine = None
+        self.llm = None
+        self.speech = None
+
+        self.loader = StartupLoader()
+        self.loader.add("detector", self._load_detector)
+        self.loader.add("recognizer", self._load_recognizer)
+        self.loader.add("vosk_model", self._load_vosk_model)
+        self.loader.add("speech", self._load_speech)
+        self.loader.add("llm", self._load_llm)
+        if warm_up:
+            self.loader.add("llm_warmup", self._warm_up_llm, after=["llm"])
+        self.loader.start()
+
+    def _load_detector(self):
+        self.detector = FaceDetector()
+
+    def _load_recognizer(self):
+        self.recognizer = FaceRecognizer(backend=self.recognizer_backend)
+
+    def _load_vosk_model(self):
+        from vosk import Model
+        self.vosk_model = Model(self.vosk_model_path)
+        self.grammar.get()
+
+    def _load_speech(self):
+        from app.audio.tts import SpeechRenderer
+        speech = SpeechRenderer()
+        speech.ready.wait()  # fixed prompts pre-rendered
+        self.speech = speech
+
+    def _load_llm(self):
+        from app.nlp.llm_engine import LlmEngine
+        self.llm_engine = LlmEngine(base_url=self.ollama_url, catalog=self.catalog)
+        # Lanes never call the engine directly; the gateway schedules them onto Ollama.
+        self.llm = LlmGateway(self.llm_engine, workers=self.llm_workers)
+
+    def _warm_up_llm(self):
+        self.llm_engine.warm_up()
+
+
+class Lane(QObject):
+    """One camera/microphone/speaker set with its own order session and UI pane.
+
+    The camera feed shows straight away; recognition and sessions start once
+    the shared models it needs are loaded.
+    """
+
+    startup_changed = pyqtSignal()
+
+    def __init__(self, config, shared, ui):
+        super().__init__()
+        self.config = config
+        self.name = config["name"]
+        self.ui = ui
+        self.shared = shared
+        self.history = shared.history
+        self.ready = False
+        self.orchestrator = None
+        self.transcriber = None
+        self.preprocessor = FramePreprocessor(detection_level=1)
+
+        self.grabber = FrameGrabber(config["camera"]).start()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.process_frame)
+        self.timer.start(30)
+
+        self.last_greeted_name = None
+        self.last_greeted_time = 0
+        self.face_absent_frames = 0
+        self.reset_triggered = False
+
+        # Loader callbacks arrive on loader threads; the signal brings them to the Qt thread.
+        self.startup_changed.connect(self._on_startup_changed)
+        shared.loader.subscribe(lambda name, state: self.startup_changed.emit())
+
+    def _on_startup_changed(self):
+        if self.ready:
+            return
+        loader = self.shared.loader
+        failed = loader.failed(*SharedModels.REQUIRED)
+        if failed:
+            self.ui.set_status_text(f"Startup failed: {', '.join(failed)}")
+            return
+        waiting = loader.waiting_for(*SharedModels.REQUIRED)
+        if waiting:
+            self.ui.set_status_text(f"Starting up: loading {', '.join(waiting)}...")
+            return
+        self._finish_setup()
+        self.ui.set_status_text("Idle")
+
+    def _finish_setup(self):
+        """Build everything that needs the shared models; runs once, on the Qt thread."""
+        # Imported here: these pull in sounddevice and pyttsx3.
+        from app.audio.transcriber import VoskTranscriber
+        from app.audio.tts import TextToSpeech
+        from app.orchestrator import SessionOrchestrator, USUAL_PHRASES
+
+        config, shared = self.config, self.shared
+        self.ready = True
+        self.recognizer = shared.recognizer
+        self.tracker = FaceTracker(shared.detector, detect_interval=config["detect_interval"])
+        self.tts = TextToSpeech(device=config["speaker"], renderer=shared.speech, lane=self.name)
+        self.transcriber = VoskTranscriber(device=config["microphone"], model=shared.vosk_model, lane=self.name,
+                                           grammar=shared.grammar)
+        # Full duplex: keep listening while we talk and stop talking when the customer does.
+        self.transcriber.stream.on_speech_start = self.tts.barge_in
+        self.transcriber.stream.echo_gain = self.tts.echo_gain
+        self.speculator = SpeculativeParser(shared.llm, skip_phrases=CONFIRM_PHRASES + USUAL_PHRASES,
+                                            priority=SPECULATIVE)
+        slug = re.sub(r"[^a-z0-9]+", "-", self.name.lower()).strip("-")
+        self.journal = OrderJournal(os.path.join(config["journal_dir"], f"{slug}.log"))
+        recovered = self.journal.recover()
+        self.order_session = OrderSession(catalog=shared.catalog, journal=self.journal)
+        self.orchestrator = SessionOrchestrator(self.tts, self.transcriber, shared.llm, self.speculator,
+                                                self.recognizer, self.order_session,
+                                                history=shared.history, lane=self.name)
+        self.orchestrator.ui_event.connect(self.on_ui_event)
+
+        if recovered is not None:
+            # We crashed mid-order; the car is most likely still at the speaker.
+            print(f"[INFO] {self.name}: recovered unfinished order {recovered['session']}")
+            self.order_session.restore(recovered["session"], recovered["deltas"])
+            meta = recovered["meta"]
+            self.last_greeted_name = meta.get("customer")
+            self.last_greeted_time = time.time()
+            self.orchestrator.start_session(name=meta.get("customer"), uid=meta.get("uid"), resume=True)
+
+    def on_ui_event(self, kind, payload):
+        """Apply a UI update sent by the session orchestrator; runs on the Qt thread."""
+        if kind == "status":
+            self.ui.set_status_text(payload)
+        elif kind == "append":
+            self.ui.append_transcription(payload)
+            self.ui.transcription_box.moveCursor(self.ui.transcription_box.textCursor().End)
+        elif kind == "registered":
+            # Don't greet the new face as a returning customer in this same visit.
+            self.last_greeted_name = payload
+            self.last_greeted_time = time.time()
+        elif kind == "final":
+            self.ui.transcription_box.append("\nFinal Order:")
+            self.ui.transcription_box.append(payload)
+            self.ui.transcription_box.moveCursor(self.ui.transcription_box.textCursor().End)
+            self.ui.set_status_text("Completed")
+
+    def process_frame(self):
+        frame_id, frame = self.grabber.read()
+        if frame is None:
+            return
+        if not self.ready:
+            self.ui.set_video_rgb(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            return
+        with FRAME_SECONDS.time(lane=self.name):
+            self._process_frame(frame)
+
+    def _process_frame(self, frame):
+        pframe = self.preprocessor.process(frame)
+        tracks = self.tracker.update(pframe)
+
+        if len(tracks) == 0:
+            self.face_absent_frames += 1
+        else:
+            self.face_absent_frames = 0
+        
+        if self.face_absent_frames >= 60 and not self.reset_triggered:
+            self.reset_session()
+
+        # Recognize all new faces in the frame in one batch.
+        crops = {}
+        pending = [track for track in tracks if track.needs_recognition()]
+        for track in pending:
+            crops[track.track_id] = pframe.gray_crop(track.box)
+        matches = self.recognizer.identify_faces([crops[track.track_id] for track in pending])
+        for track, (uid, name) in zip(pending, matches):
+            track.uid, track.name = uid, name
+            if uid is not None:
+                # Look up their usual order while the greeting is still being spoken.
+                self.history.prefetch(uid)
+
+        for track in tracks:
+            x, y, w, h = track.box
+            resized_crop = crops.get(track.track_id)
+            name = track.name
+
+            current_time = time.time()
+            cooldown_seconds = 5
+
+            if name != self.last_greeted_name:
+                if name == "Unknown" and resized_crop is not None and not self.orchestrator.active:
+                    resized_crop_copy = np.array(resized_crop, dtype=np.uint8).copy()
+                    self.orchestrator.start_session(face_crop=resized_crop_copy)
+                elif name != "Unknown" and current_time - self.last_greeted_time > cooldown_seconds:
+                    if self.orchestrator.start_session(name=name, uid=track.uid):
+                        self.last_greeted_name = name
+                        self.last_greeted_time = current_time
+
+            cv2.rectangle(pframe.rgb, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(pframe.rgb, name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+        self.ui.set_video_rgb(pframe.rgb)
+    
+    def reset_session(self):
+        print(f"[INFO] {self.name}: resetting session for next customer")
+        self.reset_triggered = True
+        # The session task clears the order on its own thread as it unwinds.
+        self.orchestrator.cancel()
+        self.last_greeted_name = None
+        self.face_absent_frames = 0
+        self.tracker.reset()
+        self.ui.transcription_box.clear()
+        self.ui.set_status_text("Idle")
+        QTimer.singleShot(500, lambda: setattr(self, 'reset_triggered', False))
+
+    def stop(self):
+        self.timer.stop()
+        self.grabber.stop()
+        if self.ready:
+            self.orchestrator.shutdown()
+            self.transcriber.stream.stop()
+            self.journal.close()
@@ -1,12 +1,126 @@
 from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 import json
+import threading
+import time
+
+from app.nlp.rule_parser import RuleOrderParser
+from app.nlp.stream_parser import IncrementalOrderParser
+from app.nlp.order_cache import OrderDeltaCache
+from app.nlp.order_schema import ORDER_SCHEMA, OrderValidator, extract_json_object
+from app.order.menu_catalog import MenuCatalog
+from app.utils import metrics
+
+PARSE_SECONDS = metrics.Histogram("drive_thru_parse_seconds", "Utterance to order delta, by who answered it",
+                                  labelnames=("source",), log_events=True)
+FIRST_ITEM_SECONDS = metrics.Histogram("drive_thru_llm_first_item_seconds", "LLM call to its first streamed item")
+LLM_TOKENS = metrics.Counter("drive_thru_llm_tokens_total", "Ollama tokens", labelnames=("kind",))
+
+# Everything above "Order:" is identical on every turn, so Ollama can keep its
+# KV cache for that prefix; only the last three lines change.
+DELTA_PROMPT = '''You are an order processing assistant for a restaurant drive-thru.
+Menu items: {menu_items}
+
+Return ONLY the changes the customer's latest words make to the order, as JSON:
+{{{{"order": [{{{{"item": "menu item", "quantity": 1, "instructions": [], "action": "add"}}}}]}}}}
+
+Rules:
+- "add": item not in the order yet; quantity is how many to add.
+- "modify": item already in the order; quantity is the NEW TOTAL and instructions the full new list.
+- "remove": take the item off the order completely.
+- "another" / "one more" means modify with the current quantity + 1.
+- "remove one" means modify with the current quantity - 1, or remove if that reaches 0.
+- Special requests like "no onions" go in instructions.
+- Never repeat unchanged items. If nothing changes, return {{{{"order": []}}}}.
+- Only the actions add, modify and remove exist. Output JSON only, no other text.
+
+Order: {{current_order}}
+Customer: {{order_text}}
+JSON:'''
+
+
+def compact_order(items):
+    """Token-light order state, e.g. "2 burger [no onions]; 1 soda"."""
+    if not items:
+        return "empty"
+    parts = []
+    for entry in items:
+        part = f"{entry.get('quantity', 1)} {entry.get('item', '')}"
+        if entry.get("instructions"):
+            part += f" [{', '.join(entry['instructions'])}]"
+        parts.append(part)
+    return "; ".join(parts)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Collects Ollama's prompt/completion token counts for one call."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                self.prompt_tokens += info.get("prompt_eval_count", 0) or 0
+                self.completion_tokens += info.get("eval_count", 0) or 0
+
 
 class LlmEngine:
-    def __init__(self, model_name="mistral"):
-        self.llm = OllamaLLM(model=model_name)
+    def __init__(self, model_name="mistral", fast_path=True, cache_path="order_cache.json",
+                 prompt_mode="delta", keep_alive="30m", base_url=None, catalog=None):
+        if prompt_mode not in ("delta", "full"):
+            raise ValueError(f"Unknown prompt mode: {prompt_mode}")
+        self.prompt_mode = prompt_mode
+        # keep_alive keeps the model (and its cached prompt prefix) loaded
+        # between turns; format constrains decoding to the order schema.
+        # base_url points at another Ollama, e.g. the stub in app/nlp/ollama_stub.py.
+        options = {"base_url": base_url} if base_url else {}
+        try:
+            self.llm = OllamaLLM(model=model_name, keep_alive=keep_alive, format=ORDER_SCHEMA, **options)
+        except ValueError:
+            # Older langchain-ollama only knows plain JSON mode.
+            self.llm = OllamaLLM(model=model_name, keep_alive=keep_alive, format="json", **options)
+        self.catalog = catalog or MenuCatalog.default()
+        self.menu_path = self.catalog.path
+        menu = self.catalog.menu
+        self.validator = OrderValidator(self.catalog)
+
+        # Deterministic parser tried before every LLM call; None disables it.
+        self.rule_parser = None
+        if fast_path:
+            self.rule_parser = RuleOrderParser(menu)
+
+        self.usage_lock = threading.Lock()
+        self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        self.total_usage = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
 
-        self.prompt = PromptTemplate.from_template('''
+        self._build_prompt(menu)
+
+        # Memo of previous LLM answers; None disables it.
+        self.cache = None
+        if cache_path:
+            self.cache = OrderDeltaCache(cache_path, sources=[self.menu_path], salt=self.prompt.template)
+
+        self.catalog.subscribe(self._on_menu_change)
+
+    def _on_menu_change(self, menu):
+        """Menu hot reload: new lexicon and prompt; the cache drops itself via its file fingerprint."""
+        if self.rule_parser is not None:
+            self.rule_parser.set_menu(menu)
+        self._build_prompt(menu)
+        if self.cache is not None:
+            self.cache.salt = self.prompt.template
+
+    def _build_prompt(self, menu):
+        if self.prompt_mode == "delta":
+            menu_items = ", ".join(entry["name"] for section_items in menu.values() for entry in section_items)
+            menu_items = menu_items.replace("{", "{{").replace("}", "}}")
+            self.prompt = PromptTemplate.from_template(DELTA_PROMPT.format(menu_items=menu_items))
+        else:
+            self.prompt = PromptTemplate.from_template('''
 You are an order processing assistant for a restaurant.
 
 Here is the current order so far (in JSON format):
@@ -46,35 +160,171 @@ Respond in this format:
   ]
 }}
 ''')
+        self.chain = self.prompt | self.llm
 
-    def parse_order(self, order_text, current_order="No previous order"):
-        chain = self.prompt | self.llm
-        response = chain.invoke({
+    @staticmethod
+    def _current_items(current_order):
+        try:
+            return json.loads(current_order).get("order", [])
+        except (ValueError, AttributeError):
+            return []
+
+    def _fast_path(self, order_text, current_order):
+        """Answer from the rule parser or the cache; None means the LLM is needed."""
+        self.catalog.refresh()  # apply a menu edit before anything reads the lexicon or cache
+        current_items = self._current_items(current_order)
+        if self.rule_parser is not None:
+            parsed = self.rule_parser.parse(order_text, current_items)
+            if parsed is not None:
+                print("[INFO] Parsed without LLM")
+                return parsed
+        if self.cache is not None:
+            parsed = self.cache.get(order_text, current_items)
+            if parsed is not None:
+                print("[INFO] Order delta served from cache")
+                return parsed
+        return None
+
+    def _remember(self, order_text, current_order, parsed):
+        if self.cache is not None:
+            self.cache.put(order_text, self._current_items(current_order), parsed)
+
+    def _repair(self, response):
+        """Salvage and validate an LLM reply: returns (cleaned order, errors)."""
+        try:
+            obj = extract_json_object(response)
+        except ValueError as e:
+            return {"order": []}, [str(e)]
+        return self.validator.validate(obj)
+
+    def _retry(self, inputs, response, errors):
+        """One fast corrective call, showing the model its reply and what was wrong with it."""
+        print(f"[WARN] Invalid LLM reply ({'; '.join(errors)}); retrying once")
+        prompt_text = self.prompt.format(**inputs)
+        retry_text = (f"{prompt_text} {response.strip()}\n\n"
+                      f"That reply was invalid: {'; '.join(errors)}.\n"
+                      f"Reply again with only the corrected JSON.\nJSON:")
+        usage = TokenUsageHandler()
+        retried = self.llm.invoke(retry_text, config={"callbacks": [usage]})
+        self._record_usage(usage)
+        return retried
+
+    def _prompt_inputs(self, order_text, current_order):
+        if self.prompt_mode == "delta":
+            current_order = compact_order(self._current_items(current_order))
+        return {
             "order_text": order_text,
             "current_order": current_order
-        })
+        }
+
+    def _record_usage(self, handler):
+        with self.usage_lock:
+            self.last_usage = {"prompt_tokens": handler.prompt_tokens, "completion_tokens": handler.completion_tokens}
+            self.total_usage["prompt_tokens"] += handler.prompt_tokens
+            self.total_usage["completion_tokens"] += handler.completion_tokens
+            self.total_usage["calls"] += 1
+        LLM_TOKENS.inc(handler.prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(handler.completion_tokens, kind="completion")
+        print(f"[INFO] LLM tokens: prompt={handler.prompt_tokens} completion={handler.completion_tokens}")
+
+    def warm_up(self):
+        """Run one throwaway generation so Ollama loads the model before the first customer.
+
+        It uses the real prompt, so the static prefix is also in the KV cache
+        afterwards. Returns how long it took.
+        """
+        started = time.monotonic()
+        self.chain.invoke(self._prompt_inputs("nothing yet", json.dumps({"order": []})))
+        return time.monotonic() - started
+
+    def parse_order(self, order_text, current_order="No previous order"):
+        """Return the order delta for one utterance as a JSON string ({"order": [...]}).
+
+        Replies that are not clean JSON are repaired and validated (actions
+        normalized, item names mapped onto the menu); if that still fails the
+        model gets one retry. The result is always valid JSON, possibly an
+        empty order, so a bad generation never costs the customer their turn.
+        """
+        return self.stream_order(order_text, current_order, on_item=None, stream=False)
+
+    def stream_order(self, order_text, current_order="No previous order", on_item=None, stream=True,
+                     cancel_event=None):
+        """Like parse_order, but calls on_item(item) for each order item as soon as the model closes it.
+
+        Setting `cancel_event` (a threading.Event) stops reading the stream;
+        only the items already emitted are returned.
+        """
+        started = time.perf_counter()
+        parsed = self._fast_path(order_text, current_order)
+        if parsed is not None:
+            PARSE_SECONDS.observe(time.perf_counter() - started, source="fast_path")
+            if on_item is not None:
+                for item in parsed["order"]:
+                    on_item(item)
+            return json.dumps(parsed)
+
+        response = self._generate(order_text, current_order, on_item, stream, cancel_event, started)
+        PARSE_SECONDS.observe(time.perf_counter() - started, source="llm")
         return response
 
+    def _generate(self, order_text, current_order, on_item, stream, cancel_event, started):
+        inputs = self._prompt_inputs(order_text, current_order)
+        usage = TokenUsageHandler()
+        emitted = []
+        if stream:
+            parser = IncrementalOrderParser()
+            for chunk in self.chain.stream(inputs, config={"callbacks": [usage]}):
+                if cancel_event is not None and cancel_event.is_set():
+                    return json.dumps({"order": emitted})
+                for raw_item in parser.feed(chunk):
+                    item, error = self.validator.validate_item(raw_item)
+                    if item is not None:
+                        if not emitted:
+                            FIRST_ITEM_SECONDS.observe(time.perf_counter() - started)
+                        emitted.append(item)
+                        if on_item is not None:
+                            on_item(item)
+            response = parser.text
+        else:
+            response = self.chain.invoke(inputs, config={"callbacks": [usage]})
+        self._record_usage(usage)
+
+        parsed, errors = self._repair(response)
+        if errors and not emitted:
+            retried, retry_errors = self._repair(self._retry(inputs, response, errors))
+            if not retry_errors or len(retried["order"]) > len(parsed["order"]):
+                parsed, errors = retried, retry_errors
+        if errors:
+            print(f"[WARN] Dropped invalid order entries: {'; '.join(errors)}")
+        else:
+            self._remember(order_text, current_order, parsed)
+
+        if emitted:
+            # Items were already applied while streaming; report what was applied.
+            return json.dumps({"order": emitted})
+        if on_item is not None:
+            for item in parsed["order"]:
+                on_item(item)
+        return json.dumps(parsed)
+
 # Example interactive testing
 if __name__ == "__main__":
+    from app.order.order_session import OrderSession
+
     engine = LlmEngine()
-    current_order_json = "No previous order"
+    session = OrderSession()
 
     while True:
         customer_input = input("\nCustomer says: ")
 
         if customer_input.lower() in ["done", "that is all", "confirm", "exit"]:
-            print("\nFinal Order:\n", current_order_json)
+            print("\nFinal Order:\n", session.get_current_order_pretty())
             break
 
-        response = engine.parse_order(customer_input, current_order=current_order_json)
+        response = engine.parse_order(customer_input, current_order=session.get_current_order_json())
         print("\n[LLM Response]")
         print(response)
 
-        # Try updating current order
-        try:
-            parsed = json.loads(response)
-            current_order_json = json.dumps(parsed, indent=2)
-        except Exception as e:
-            print("⚠️ Error parsing LLM response:", e)
-            print("Response was:", response)
+        # Apply the delta to the running order
+        session.update_from_llm(json.loads(response))
+        print(session.get_current_order_pretty())
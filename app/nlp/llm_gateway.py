@@ -0,0 +1,312 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+from app.nlp.order_cache import OrderDeltaCache
+from app.utils import metrics
+
+INTERACTIVE, SPECULATIVE, BULK = 0, 1, 2
+
+# Marked so callers can tell "the LLM gave up" from "nothing changed".
+FALLBACK_RESPONSE = json.dumps({"order": [], "fallback": True})
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SPECULATIVE: "speculative", BULK: "bulk"}
+QUEUE_DEPTH = metrics.Gauge("drive_thru_llm_queue_depth", "LLM requests waiting for a worker")
+QUEUE_SECONDS = metrics.Histogram("drive_thru_llm_queue_wait_seconds", "Time from submit to a worker picking it up",
+                                  labelnames=("priority",))
+OUTCOMES = metrics.Counter("drive_thru_llm_requests_total", "Gateway requests by outcome", labelnames=("outcome",))
+
+
+class _Request:
+    def __init__(self, key, order_text, current_order, priority, deadline):
+        self.key = key
+        self.order_text = order_text
+        self.current_order = current_order
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.cancel_event = threading.Event()
+        self.waiters = []  # (future, on_item)
+        self.emitted = []
+        self.started = False
+        self.timer = None  # deadline Timer while running
+
+
+class LlmGateway:
+    """Schedules LlmEngine calls from every lane onto a shared Ollama backend.
+
+    - At most `workers` requests run against the backend at once (match
+      OLLAMA_NUM_PARALLEL); the rest wait in a queue of at most `max_queue`.
+    - Short interactive turns go first: the queue is ordered by priority,
+      then arrival. Without an explicit priority, utterances of up to
+      `interactive_words` words are INTERACTIVE and longer ones BULK.
+    - Identical requests (same utterance and order state) that are queued
+      or running share one backend call, unless the running one is already
+      being stopped (withdrawn or past its deadline).
+    - Every request has a deadline. Past it, a queued request is not sent and
+      a running one stops streaming; the caller gets the items already
+      streamed, or `fallback(order_text, current_order)` if there were none.
+    Rule-parser and cache hits never enter the queue.
+
+    submit() returns a Future for the JSON response; parse_order() is the
+    blocking LlmEngine-compatible form. Speculative and final parses both go
+    through submit(), so callers report each final customer turn with
+    record_turn() for `hit_rate`.
+    """
+
+    def __init__(self, engine, workers=1, max_queue=32, default_deadline=8.0, interactive_words=12,
+                 fallback=None):
+        self.engine = engine
+        self.max_queue = max_queue
+        self.default_deadline = default_deadline
+        self.interactive_words = interactive_words
+        self.fallback = fallback or (lambda order_text, current_order: FALLBACK_RESPONSE)
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.heap = []  # may hold stale entries (re-prioritised, withdrawn); skipped when popped
+        self.pending = {}  # key -> _Request, queued or running
+        self.queued = 0  # live requests waiting for a worker
+        self.seq = itertools.count()
+        self.stats = {"submitted": 0, "fast_path": 0, "coalesced": 0, "rejected": 0, "expired": 0,
+                      "completed": 0, "backend_calls": 0, "turns": 0, "fast_path_turns": 0}
+
+        self.workers = [threading.Thread(target=self._worker, name=f"llm-gateway-{i}", daemon=True)
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def classify(self, order_text):
+        return INTERACTIVE if len(order_text.split()) <= self.interactive_words else BULK
+
+    @property
+    def hit_rate(self):
+        """Fraction of customer turns answered without the LLM."""
+        with self.lock:
+            turns = self.stats["turns"]
+            return self.stats["fast_path_turns"] / turns if turns else 0.0
+
+    def record_turn(self, future):
+        """Count one final customer turn (not a speculative partial), answered through `future` from submit()."""
+        fast_path = getattr(future, "fast_path", False)
+        with self.lock:
+            self.stats["turns"] += 1
+            self.stats["fast_path_turns"] += int(fast_path)
+        if fast_path:
+            print(f"[INFO] Turn answered without the LLM ({self.hit_rate:.0%} of turns so far)")
+
+    def parse_order(self, order_text, current_order="No previous order", priority=None, deadline=None):
+        return self.submit(order_text, current_order, priority=priority, deadline=deadline).result()
+
+    def stream_order(self, order_text, current_order="No previous order", on_item=None, priority=None,
+                     deadline=None):
+        return self.submit(order_text, current_order, on_item=on_item, priority=priority,
+                           deadline=deadline).result()
+
+    def submit(self, order_text, current_order="No previous order", on_item=None, priority=None, deadline=None):
+        """Queue a parse; `deadline` is in seconds from now. Cancelling the Future withdraws this caller.
+
+        The Future's `fast_path` attribute is True when the rule parser or the
+        cache answered it without queueing.
+        """
+        future = Future()
+        future.fast_path = False
+        with self.lock:
+            self.stats["submitted"] += 1
+
+        parsed = self.engine._fast_path(order_text, current_order)
+        if parsed is not None:
+            future.fast_path = True
+            with self.lock:
+                self.stats["fast_path"] += 1
+            OUTCOMES.inc(outcome="fast_path")
+            self._deliver(future, on_item, parsed["order"], json.dumps(parsed))
+            return future
+
+        key = OrderDeltaCache.key(order_text, self.engine._current_items(current_order))
+        priority = self.classify(order_text) if priority is None else priority
+        expires = time.monotonic() + (self.default_deadline if deadline is None else deadline)
+
+        with self.lock:
+            request = self.pending.get(key)
+            if request is not None and request.cancel_event.is_set():
+                # Withdrawn or expired while running: it will only produce a
+                # fallback, so this caller gets a request of its own.
+                request = None
+            if request is not None:
+                self.stats["coalesced"] += 1
+                OUTCOMES.inc(outcome="coalesced")
+                # A running request's deadline timer re-checks this when it fires.
+                request.deadline = max(request.deadline, expires)
+                if priority < request.priority and not request.started:
+                    # Re-queue at the better priority; the old heap entry is skipped.
+                    request.priority = priority
+                    heapq.heappush(self.heap, (priority, next(self.seq), request))
+            else:
+                if self.queued >= self.max_queue:
+                    self.stats["rejected"] += 1
+                    OUTCOMES.inc(outcome="rejected")
+                    request = None
+                else:
+                    request = _Request(key, order_text, current_order, priority, expires)
+                    self.pending[key] = request
+                    heapq.heappush(self.heap, (priority, next(self.seq), request))
+                    self.queued += 1
+                    QUEUE_DEPTH.set(self.queued)
+                    self.not_empty.notify()
+            if request is not None:
+                request.waiters.append((future, on_item))
+                # Items this caller missed because it joined a running request.
+                missed = list(request.emitted)
+
+        if request is None:
+            print(f"[WARN] LLM queue full; using fallback for {order_text!r}")
+            future.set_result(self.fallback(order_text, current_order))
+            return future
+        if on_item is not None:
+            for item in missed:
+                on_item(item)
+        future.add_done_callback(lambda f, r=request: self._withdraw(r, f))
+        return future
+
+    def _withdraw(self, request, future):
+        if not future.cancelled():
+            return
+        with self.lock:
+            request.waiters = [w for w in request.waiters if w[0] is not future]
+            if not request.waiters:
+                # Nobody wants the answer any more: don't start it / stop streaming it.
+                request.cancel_event.set()
+                if not request.started and self.pending.get(request.key) is request:
+                    del self.pending[request.key]
+                    self.queued -= 1
+                    QUEUE_DEPTH.set(self.queued)
+
+    @staticmethod
+    def _deliver(future, on_item, items, response):
+        if on_item is not None:
+            for item in items:
+                on_item(item)
+        try:
+            future.set_result(response)
+        except InvalidStateError:
+            pass  # cancelled by the caller meanwhile
+
+    def _next_request(self):
+        with self.lock:
+            while True:
+                while not self.heap:
+                    self.not_empty.wait()
+                priority, _, request = heapq.heappop(self.heap)
+                if request.started or request.cancel_event.is_set() or priority != request.priority:
+                    continue  # stale entry
+                request.started = True
+                self.queued -= 1
+                QUEUE_DEPTH.set(self.queued)
+                QUEUE_SECONDS.observe(time.monotonic() - request.enqueued,
+                                      priority=PRIORITY_NAMES.get(priority, priority))
+                return request
+
+    def _worker(self):
+        while True:
+            request = self._next_request()
+            now = time.monotonic()
+            if now >= request.deadline:
+                with self.lock:
+                    self.stats["expired"] += 1
+                    OUTCOMES.inc(outcome="expired")
+                print(f"[WARN] LLM request expired after {now - request.enqueued:.1f}s in queue: "
+                      f"{request.order_text!r}")
+                self._finish(request, None)
+                continue
+
+            with self.lock:
+                self._arm_deadline(request, request.deadline - now)
+            try:
+                with self.lock:
+                    self.stats["backend_calls"] += 1
+                OUTCOMES.inc(outcome="backend")
+                response = self.engine.stream_order(request.order_text, request.current_order,
+                                                    on_item=lambda item: self._on_item(request, item),
+                                                    cancel_event=request.cancel_event)
+            except Exception as e:
+                print(f"[ERROR] LLM request failed: {e}")
+                response = None
+            finally:
+                with self.lock:
+                    request.timer.cancel()
+                    request.timer = None
+            if request.cancel_event.is_set() and not request.emitted:
+                response = None
+            self._finish(request, response)
+
+    def _arm_deadline(self, request, seconds):
+        # Called with self.lock held.
+        request.timer = threading.Timer(seconds, self._deadline_reached, args=(request,))
+        request.timer.daemon = True
+        request.timer.start()
+
+    def _deadline_reached(self, request):
+        with self.lock:
+            if request.timer is None:
+                return  # finished meanwhile
+            remaining = request.deadline - time.monotonic()
+            if remaining > 0:
+                # A caller that coalesced onto it later extended the deadline.
+                self._arm_deadline(request, remaining)
+                return
+        request.cancel_event.set()
+
+    def _on_item(self, request, item):
+        with self.lock:
+            request.emitted.append(item)
+            waiters = list(request.waiters)
+        for future, on_item in waiters:
+            if on_item is not None and not future.done():
+                on_item(item)
+
+    def _finish(self, request, response):
+        with self.lock:
+            if self.pending.get(request.key) is request:
+                del self.pending[request.key]  # a fresh request may have taken the key
+            waiters = list(request.waiters)
+            self.stats["completed"] += 1
+        if response is None:
+            response = self.fallback(request.order_text, request.current_order)
+            items = json.loads(response).get("order", [])
+        elif request.emitted:
+            items = []  # already delivered through _on_item
+        else:
+            items = json.loads(response).get("order", [])
+        for future, on_item in waiters:
+            self._deliver(future, on_item, items, response)
+
+
+if __name__ == "__main__":
+    # Load demo against the Ollama stub:
+    #   python -m app.nlp.ollama_stub --port 11435 --delay 0.4 &
+    #   python -m app.nlp.llm_gateway http://localhost:11435
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.nlp.llm_engine import LlmEngine
+
+    engine = LlmEngine(base_url=sys.argv[1] if len(sys.argv) > 1 else None, fast_path=False, cache_path=None)
+    gateway = LlmGateway(engine, workers=1)
+    turns = ["add a soda please"] * 3 + [
+        "so for the whole car we'd like three veggie burgers two with no onions one with extra cheese "
+        "and then four fries and a couple of sodas and actually make one of the sodas a lemonade"
+    ] + ["two burgers", "remove the fries", "another lemonade"]
+
+    def timed(text):
+        started = time.monotonic()
+        gateway.parse_order(text, "No previous order")
+        return text, time.monotonic() - started
+
+    with ThreadPoolExecutor(max_workers=len(turns)) as pool:
+        for text, seconds in pool.map(timed, turns):
+            print(f"{seconds:6.2f}s  {text[:50]}")
+    print(gateway.stats)
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.nlp.order_cache import normalize_utterance
+from app.nlp.rule_parser import RuleOrderParser
+
+CUSTOMER_LINE = re.compile(r"^Customer(?: now said)?:\s*(.*?)\s*$", re.MULTILINE)
+ORDER_LINE = re.compile(r"^Order:\s*(.*?)\s*$", re.MULTILINE)
+
+
+def load_responses(path):
+    """Recorded replies: a JSON list of {"utterance", "order" (optional), "response"}."""
+    with open(path, 'r') as f:
+        records = json.load(f)
+    responses = {}
+    for record in records:
+        response = record["response"]
+        if not isinstance(response, str):
+            response = json.dumps(response)
+        utterance = normalize_utterance(record["utterance"])
+        responses[(utterance, record.get("order"))] = response
+        responses.setdefault((utterance, None), response)
+    return responses
+
+
+class StubBackend:
+    """Fake model for the Ollama stub: answers order prompts with the rule parser.
+
+    With `responses` (see load_responses) it replays recorded replies instead,
+    matched on the utterance and the order line of the prompt, then on the
+    utterance alone; anything not recorded still goes to the rule parser.
+    `delay` is the time to first token, `token_delay` the time per streamed
+    chunk, and `parallel` how many generations run at once (like
+    OLLAMA_NUM_PARALLEL); further requests wait for a slot.
+    """
+
+    def __init__(self, menu, delay=0.3, token_delay=0.02, parallel=1, responses=None):
+        self.parser = RuleOrderParser(menu)
+        self.responses = responses or {}
+        self.delay = delay
+        self.token_delay = token_delay
+        self.slots = threading.Semaphore(parallel)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.replayed = 0
+
+    def reply(self, prompt):
+        match = CUSTOMER_LINE.findall(prompt)
+        utterance = match[-1] if match else prompt
+        if self.responses:
+            orders = ORDER_LINE.findall(prompt)
+            key = normalize_utterance(utterance)
+            response = (self.responses.get((key, orders[-1] if orders else None))
+                        or self.responses.get((key, None)))
+            if response is not None:
+                with self.lock:
+                    self.requests += 1
+                    self.replayed += 1
+                return response
+        with self.lock:
+            self.requests += 1
+            parsed = self.parser.parse(utterance)
+        return json.dumps(parsed or {"order": []})
+
+    def generate(self, prompt):
+        """Yield the reply in small chunks, paced like a real model."""
+        with self.slots:
+            time.sleep(self.delay)
+            text = self.reply(prompt)
+            for start in range(0, len(text), 4):
+                time.sleep(self.token_delay)
+                yield text[start:start + 4]
+
+
+def make_handler(backend):
+    class OllamaStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, obj, status=200):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": "mistral:latest", "model": "mistral:latest"}]})
+            elif self.path == "/api/version":
+                self._send_json({"version": "0.0.0-stub"})
+            else:
+                self._send_json({"error": "not found"}, status=404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/api/generate":
+                prompt = request.get("prompt", "")
+            elif self.path == "/api/chat":
+                prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+            else:
+                self._send_json({"error": "not found"}, status=404)
+                return
+
+            chat = self.path == "/api/chat"
+            model = request.get("model", "mistral")
+            started = time.monotonic()
+            chunks = backend.generate(prompt)
+
+            def message(text, done):
+                msg = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+                if chat:
+                    msg["message"] = {"role": "assistant", "content": text}
+                else:
+                    msg["response"] = text
+                if done:
+                    msg.update({"done_reason": "stop", "total_duration": int((time.monotonic() - started) * 1e9),
+                                "prompt_eval_count": len(prompt.split()), "eval_count": count})
+                return msg
+
+            count = 0
+            if not request.get("stream", True):
+                text = ""
+                for chunk in chunks:
+                    text += chunk
+                    count += 1
+                self._send_json(message(text, True))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for chunk in chunks:
+                    count += 1
+                    self._write_chunk(message(chunk, False))
+                self._write_chunk(message("", True))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client stopped reading, e.g. a cancelled request
+
+        def _write_chunk(self, obj):
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return OllamaStubHandler
+
+
+def serve(host="127.0.0.1", port=11435, delay=0.3, token_delay=0.02, parallel=1, menu_path=None,
+          responses_path=None):
+    """Start the stub in a background thread; returns the server (call shutdown() to stop it).
+
+    port=0 picks a free port; the real one is server.server_address[1].
+    """
+    menu_path = menu_path or os.path.join(os.path.dirname(__file__), '..', 'data', 'menu.json')
+    with open(menu_path, 'r') as f:
+        menu = json.load(f)
+    responses = load_responses(responses_path) if responses_path else None
+    backend = StubBackend(menu, delay=delay, token_delay=token_delay, parallel=parallel, responses=responses)
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    server.backend = backend
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ollama-compatible stub server for exercising the LLM path offline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds per streamed chunk")
+    parser.add_argument("--parallel", type=int, default=1, help="concurrent generations (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--responses", help="JSON file of recorded replies to serve instead of the rule parser")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay, args.token_delay, args.parallel,
+                   responses_path=args.responses)
+    print(f"[INFO] Ollama stub listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,129 @@
+import atexit
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+def normalize_utterance(text):
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+def canonical_order(items):
+    """Order state as a compact, order-independent string."""
+    entries = sorted(
+        (str(entry.get("item", "")).lower(), entry.get("quantity", 1), sorted(entry.get("instructions", []) or []))
+        for entry in items
+    )
+    return json.dumps(entries, separators=(",", ":"))
+
+
+class OrderDeltaCache:
+    """LRU memo of utterance + order state -> order delta returned by the LLM.
+
+    Entries are only valid for the menu and prompt they were produced with:
+    the cache carries a fingerprint of `sources` (file contents) and `salt`
+    (the prompt template) and drops everything when it changes. It is saved to
+    `path` every `save_every` inserts and at exit, so a restarted lane starts
+    warm.
+    """
+
+    def __init__(self, path="order_cache.json", capacity=4096, sources=(), salt="", save_every=16):
+        self.path = path
+        self.capacity = capacity
+        self.sources = list(sources)
+        self.salt = salt
+        self.save_every = save_every
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0
+
+        self._mtimes = None
+        self.fingerprint = self._compute_fingerprint()
+        self._load()
+        atexit.register(self.save)
+
+    def _compute_fingerprint(self):
+        digest = hashlib.sha256(self.salt.encode("utf-8"))
+        mtimes = []
+        for source in self.sources:
+            with open(source, "rb") as f:
+                digest.update(f.read())
+            mtimes.append(os.path.getmtime(source))
+        self._mtimes = mtimes
+        return digest.hexdigest()
+
+    def _check_sources(self):
+        """Clear the cache if the menu changed since the fingerprint was taken."""
+        if [os.path.getmtime(source) for source in self.sources] == self._mtimes:
+            return
+        fingerprint = self._compute_fingerprint()
+        if fingerprint != self.fingerprint:
+            print("[INFO] Menu or prompt changed; clearing order cache")
+            self.fingerprint = fingerprint
+            self.entries.clear()
+            self.unsaved += 1
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Ignoring unreadable order cache {self.path}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            return
+        for key, delta in data.get("entries", [])[-self.capacity:]:
+            self.entries[key] = delta
+
+    def save(self):
+        with self.lock:
+            if not self.unsaved:
+                return
+            data = {"fingerprint": self.fingerprint, "entries": list(self.entries.items())}
+            self.unsaved = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def key(order_text, current_items):
+        return normalize_utterance(order_text) + "|" + canonical_order(current_items)
+
+    def get(self, order_text, current_items):
+        key = self.key(order_text, current_items)
+        with self.lock:
+            self._check_sources()
+            delta = self.entries.get(key)
+            if delta is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            # Callers apply and edit what they get; keep the cached delta pristine.
+            return copy.deepcopy(delta)
+
+    def put(self, order_text, current_items, delta):
+        key = self.key(order_text, current_items)
+        delta = copy.deepcopy(delta)
+        with self.lock:
+            self.entries[key] = delta
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            self.unsaved += 1
+            due = self.unsaved >= self.save_every
+        if due:
+            self.save()
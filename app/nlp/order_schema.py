@@ -0,0 +1,173 @@
+import json
+import re
+
+ORDER_ACTIONS = ("add", "modify", "remove")
+
+ACTION_ALIASES = {
+    "add": "add", "added": "add", "new": "add", "insert": "add", "order": "add",
+    "modify": "modify", "modified": "modify", "update": "modify", "change": "modify", "edit": "modify",
+    "increase": "modify", "decrease": "modify", "increment": "modify", "decrement": "modify", "set": "modify",
+    "remove": "remove", "removed": "remove", "delete": "remove", "cancel": "remove", "drop": "remove",
+}
+
+# Actions models invent for "leave this item alone"; such entries are dropped, not errors.
+NOOP_ACTIONS = {"nochange", "no_change", "no change", "none", "copy", "keep", "same", "unchanged", ""}
+
+WORD_NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10, "a": 1, "an": 1, "zero": 0}
+
+# JSON mode for Ollama's "format" option: the shape every reply must have.
+ORDER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "order": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "item": {"type": "string"},
+                    "quantity": {"type": "integer"},
+                    "instructions": {"type": "array", "items": {"type": "string"}},
+                    "action": {"type": "string", "enum": list(ORDER_ACTIONS)},
+                },
+                "required": ["item", "quantity", "instructions", "action"],
+            },
+        }
+    },
+    "required": ["order"],
+}
+
+
+def _balanced_object(text, start):
+    """Return text[start:end] for the object opening at `start`, closing it if the text was cut off."""
+    stack = []
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1]
+    # Truncated reply: close whatever is still open.
+    tail = '"' if in_string else ""
+    return text[start:] + tail + "".join(reversed(stack))
+
+
+def extract_json_object(text):
+    """Salvage the first JSON object from a model reply.
+
+    Tolerates leading/trailing prose, code fences, smart quotes, trailing
+    commas and a reply cut off mid-object. Raises ValueError if nothing
+    usable is found.
+    """
+    if not isinstance(text, str):
+        raise ValueError("LLM reply is not text")
+    text = text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("no JSON object in LLM reply")
+
+    candidate = _balanced_object(text, start)
+    attempts = [candidate, re.sub(r",\s*([}\]])", r"\1", candidate)]
+    for attempt in attempts:
+        try:
+            obj = json.loads(attempt)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj
+    raise ValueError("could not repair JSON object in LLM reply")
+
+
+class OrderValidator:
+    """Checks LLM order deltas against the schema and maps item names onto the menu catalog."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def resolve_item(self, raw):
+        return self.catalog.resolve(raw)
+
+    @staticmethod
+    def _quantity(raw):
+        if isinstance(raw, bool):
+            raise ValueError
+        if isinstance(raw, (int, float)):
+            return int(raw)
+        text = str(raw).strip().lower()
+        if text in WORD_NUMBERS:
+            return WORD_NUMBERS[text]
+        return int(float(text))
+
+    def validate(self, obj):
+        """Return (cleaned {"order": [...]}, list of error strings)."""
+        errors = []
+        if isinstance(obj, list):
+            obj = {"order": obj}
+        if not isinstance(obj, dict):
+            return {"order": []}, ["reply is not a JSON object"]
+        entries = obj.get("order")
+        if entries is None:
+            # A single bare item object.
+            entries = [obj] if "item" in obj else []
+            if not entries:
+                errors.append('missing "order" list')
+        if not isinstance(entries, list):
+            return {"order": []}, ['"order" must be a list']
+
+        cleaned = []
+        for entry in entries:
+            item, error = self.validate_item(entry)
+            if error:
+                errors.append(error)
+            elif item is not None:
+                cleaned.append(item)
+        return {"order": cleaned}, errors
+
+    def validate_item(self, entry):
+        """Return (cleaned item or None, error or None); no-op entries give (None, None)."""
+        if not isinstance(entry, dict):
+            return None, f"order entry {entry!r} is not an object"
+
+        action = str(entry.get("action", "add")).strip().lower()
+        if action in NOOP_ACTIONS:
+            return None, None
+        action = ACTION_ALIASES.get(action)
+        if action is None:
+            return None, f"invalid action {entry.get('action')!r}; use add, modify or remove"
+
+        raw_item = entry.get("item") or entry.get("name")
+        if not raw_item:
+            return None, f"order entry {entry!r} has no item"
+        item = self.resolve_item(raw_item)
+        if item is None:
+            return None, f"{raw_item!r} is not on the menu"
+
+        try:
+            quantity = self._quantity(entry.get("quantity", 1))
+        except (TypeError, ValueError):
+            return None, f"invalid quantity {entry.get('quantity')!r} for {item}"
+        if quantity <= 0 and action != "remove":
+            # "modify to zero" is how models say remove.
+            action = "remove"
+            quantity = 0
+
+        instructions = entry.get("instructions") or []
+        if isinstance(instructions, str):
+            instructions = [instructions]
+        instructions = [str(i) for i in instructions if str(i).strip()]
+
+        return {"item": item, "quantity": quantity, "instructions": instructions, "action": action}, None
@@ -0,0 +1,220 @@
+import re
+
+from app.order.menu_catalog import plural
+
+NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "couple": 2, "dozen": 12,
+}
+
+# Words that may appear around an order without changing its meaning.
+FILLER = {
+    "can", "could", "i", "i'd", "id", "get", "have", "want", "would", "like", "let", "me", "give", "please",
+    "the", "of", "some", "also", "plus", "and", "um", "uh", "oh", "okay", "ok", "yeah", "just", "for",
+    "my", "order", "to", "be", "will", "take", "them", "it", "that", "this", "too", "as", "well", "thanks",
+    "thank", "you", "hi", "hello", "hey", "gonna", "need", "we'll", "we", "im", "i'm", "i'll", "with",
+    "on",
+}
+
+REMOVE_WORDS = {"remove", "cancel", "delete", "drop", "minus"}
+MODIFIER_WORDS = {"no", "extra", "without", "light", "easy", "add", "less"}
+
+CLAUSE_SPLIT = re.compile(r"\b(?:and|also|plus|then)\b|,")
+
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+class RuleOrderParser:
+    """Deterministic order parser over the menu lexicon.
+
+    Handles the bulk of drive-thru turns ("two burgers and a soda", "another
+    lemonade", "remove the fries", "no onions on the burger") without an LLM
+    call. parse() returns the same {"order": [...]} shape as LlmEngine, or None
+    when any word of the utterance is not accounted for, or when the turn is
+    ambiguous against the current order ("the soda" or "three burgers" for an
+    item already in it, "no onions" without naming the item), in which case
+    the caller should fall back to the LLM.
+    """
+
+    def __init__(self, menu):
+        self.set_menu(menu)
+
+    def set_menu(self, menu):
+        """Rebuild the lexicon for a new menu.
+
+        May run on another thread than parse() (menu hot reload), so the new
+        lexicon is built aside and swapped in with a single assignment.
+        """
+        lexicon = {}  # tuple of tokens -> canonical item name
+        names = [entry["name"] for section_items in menu.values() for entry in section_items]
+        for name in names:
+            words = tuple(_tokens(name))
+            lexicon[words] = name
+            lexicon[words[:-1] + (plural(words[-1]),)] = name
+
+        # Last word alone ("fries", "sticks") when it names exactly one item
+        # and is not also a word in another item.
+        last_words = {}
+        for name in names:
+            words = _tokens(name)
+            last_words.setdefault(words[-1], []).append(name)
+        all_words = [w for name in names for w in _tokens(name)[:-1]]
+        for word, owners in last_words.items():
+            if len(owners) == 1 and len(_tokens(owners[0])) > 1 and word not in all_words:
+                lexicon.setdefault((word,), owners[0])
+                lexicon.setdefault((plural(word),), owners[0])
+        self.vocabulary = (lexicon, max((len(k) for k in lexicon), default=1))
+
+    @property
+    def lexicon(self):
+        return self.vocabulary[0]
+
+    @staticmethod
+    def _match_item(vocabulary, tokens, i):
+        lexicon, max_len = vocabulary
+        for n in range(min(max_len, len(tokens) - i), 0, -1):
+            name = lexicon.get(tuple(tokens[i:i + n]))
+            if name:
+                return name, n
+        return None, 0
+
+    def _parse_clause(self, vocabulary, tokens):
+        """Return (intent, item, quantity, instructions, explicit, said_add) or None if a word is unexplained.
+
+        `explicit` is True when the clause itself says what to do (a verb or a
+        quantity), as opposed to a bare item name; `said_add` when that verb
+        is "add".
+        """
+        intent = "add"
+        explicit = False
+        said_add = False
+        item = None
+        quantity = None
+        instructions = []
+        i = 0
+        while i < len(tokens):
+            tok = tokens[i]
+            name, length = self._match_item(vocabulary, tokens, i)
+            if name:
+                if item is not None and item != name:
+                    return None  # two items in one clause, leave it to the LLM
+                item = name
+                i += length
+            elif tok in REMOVE_WORDS or (tok == "take" and i + 1 < len(tokens) and tokens[i + 1] == "off"):
+                intent = "remove"
+                i += 2 if tok == "take" else 1
+            elif tok == "another" or (tok == "one" and i + 1 < len(tokens) and tokens[i + 1] == "more"):
+                intent = "increment"
+                quantity = 1
+                i += 1 if tok == "another" else 2
+            elif tok == "more" and quantity is not None:
+                # "two more burgers"
+                intent = "increment"
+                i += 1
+            elif tok.isdigit() or tok in NUMBERS:
+                if quantity is not None and tok in ("a", "an"):
+                    i += 1
+                    continue
+                quantity = int(tok) if tok.isdigit() else NUMBERS[tok]
+                i += 1
+            elif tok in MODIFIER_WORDS and i + 1 < len(tokens):
+                target = tokens[i + 1]
+                if self._match_item(vocabulary, tokens, i + 1)[0] or target in FILLER or target in NUMBERS:
+                    if tok != "add":
+                        return None
+                    explicit = said_add = True
+                    i += 1  # "add a burger": plain add
+                    continue
+                instructions.append(f"{tok} {target}")
+                i += 2
+            elif tok in FILLER or tok == "add":
+                i += 1
+            else:
+                return None
+        explicit = explicit or intent != "add" or quantity is not None
+        return intent, item, quantity, instructions, explicit, said_add
+
+    def parse(self, text, current_items=None):
+        current_items = current_items or []
+        existing = {entry["item"].lower(): entry for entry in current_items}
+        updates = {}  # item (lower) -> update dict, in mention order
+        last_item = current_items[-1]["item"].lower() if current_items else None
+        mentioned = None  # last item named in this utterance
+
+        clauses = [_tokens(c) for c in CLAUSE_SPLIT.split(text.lower())]
+        clauses = [c for c in clauses if c]
+        if not clauses:
+            return None
+
+        vocabulary = self.vocabulary  # one menu for the whole utterance, even across a reload
+        removing = False
+        for tokens in clauses:
+            parsed = self._parse_clause(vocabulary, tokens)
+            if parsed is None:
+                return None
+            intent, item, quantity, instructions, explicit, said_add = parsed
+            if intent == "add" and not explicit and removing:
+                # "remove the fries and the soda": the verb carries over; too
+                # ambiguous to guess, let the LLM decide.
+                return None
+            removing = intent == "remove"
+
+            if item is None:
+                # "one more" refers back to the last item mentioned; "no onions"
+                # only to one named earlier in this utterance, since the last
+                # item of the order may well be a drink.
+                if intent == "add":
+                    if not instructions or mentioned is None:
+                        return None
+                    key = mentioned
+                    intent = "instructions"
+                elif last_item is None:
+                    return None
+                else:
+                    key = last_item
+            else:
+                key = item.lower()
+                if intent == "add" and key in existing and key not in updates and not said_add:
+                    if instructions and quantity is None:
+                        intent = "instructions"  # "no onions on the burger"
+                    else:
+                        # "the soda" / "three burgers" for an item already ordered:
+                        # confirming, setting or adding to the quantity? Ask the LLM.
+                        return None
+            last_item = mentioned = key
+
+            base = updates.get(key) or existing.get(key)
+            current_qty = base["quantity"] if base else 0
+            current_instr = list(base.get("instructions", [])) if base else []
+
+            if intent == "remove":
+                if base is None:
+                    return None
+                if quantity is not None and quantity < current_qty:
+                    updates[key] = {"item": key, "quantity": current_qty - quantity,
+                                    "instructions": current_instr, "action": "modify"}
+                else:
+                    updates[key] = {"item": key, "quantity": 0, "instructions": [], "action": "remove"}
+                continue
+
+            if intent == "instructions":
+                if base is None:
+                    return None
+                updates[key] = {"item": key, "quantity": current_qty,
+                                "instructions": current_instr + instructions,
+                                "action": "modify" if key in existing else "add"}
+                continue
+
+            added = quantity if quantity is not None else 1
+            if intent == "increment" and base is None:
+                return None
+            if key in existing or key in updates:
+                action = "modify" if key in existing else "add"
+                updates[key] = {"item": key, "quantity": current_qty + added,
+                                "instructions": current_instr + instructions, "action": action}
+            else:
+                updates[key] = {"item": key, "quantity": added, "instructions": instructions, "action": "add"}
+
+        return {"order": list(updates.values())}
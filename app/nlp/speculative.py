@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.nlp.order_cache import normalize_utterance
+
+
+class SpeculativeParser:
+    """Starts order parsing on a Vosk partial transcript before the customer has finished.
+
+    Once the partial text has not changed for `stability_window` seconds (the
+    customer has most likely stopped talking and we are only waiting out the
+    endpointing silence) it is handed to the LLM engine in the background.
+    When the final transcript arrives, resolve() returns the speculative
+    result if the text matches, and otherwise discards it.
+
+    With an LlmGateway the parse goes through gateway.submit() at `priority`,
+    so it queues behind real turns, and dropping a guess cancels its Future,
+    which withdraws the request from the gateway. With a bare LlmEngine it
+    streams on a private thread with its own cancel event, set when the
+    guess is dropped, so Ollama stops generating it.
+    """
+
+    def __init__(self, llm_engine, stability_window=0.35, skip_phrases=(), priority=None):
+        self.llm_engine = llm_engine  # LlmEngine, or an LlmGateway to queue behind real turns
+        self.priority = priority
+        self.stability_window = stability_window
+        self.skip_phrases = skip_phrases
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-llm")
+        # on_partial runs on the transcriber thread, cancel() also on the Qt and session threads.
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._reset(None)
+
+    def _reset(self, current_order):
+        self.current_order = current_order
+        self.partial = ""
+        self.changed_at = time.monotonic()
+        self.speculated_text = None
+        self.future = None
+        self.cancel_event = None
+
+    def begin(self, current_order):
+        """Start a new turn against the given order state (JSON from OrderSession)."""
+        with self.lock:
+            self._drop()
+            self._reset(current_order)
+
+    def on_partial(self, text):
+        """Feed every partial transcript; launches the speculative parse once it is stable."""
+        if self.current_order is None:
+            return
+        text = normalize_utterance(text)
+        now = time.monotonic()
+        if text != self.partial:
+            self.partial = text
+            self.changed_at = now
+            return
+        if not text or text == self.speculated_text or now - self.changed_at < self.stability_window:
+            return
+        if any(phrase in text for phrase in self.skip_phrases):
+            return
+
+        # The text settled on something new: the older guess is useless now.
+        with self.lock:
+            if self.current_order is None:
+                return  # cancelled meanwhile
+            self._drop()
+            self.speculated_text = text
+            self.future = self._submit(text)
+
+    def _submit(self, text):
+        if hasattr(self.llm_engine, "submit"):
+            options = {"priority": self.priority} if self.priority is not None else {}
+            return self.llm_engine.submit(text, self.current_order, **options)
+        self.cancel_event = threading.Event()
+        return self.executor.submit(self.llm_engine.stream_order, text, self.current_order,
+                                    cancel_event=self.cancel_event)
+
+    def resolve(self, final_text):
+        """Return the Future of the speculative parse if it was for `final_text`, else None.
+
+        Does not wait for it: the caller awaits the Future, and cancelling it
+        withdraws the request from the gateway.
+        """
+        with self.lock:
+            future, speculated, current_order = self.future, self.speculated_text, self.current_order
+            if speculated != normalize_utterance(final_text):
+                self._drop()
+                future = None
+            self.future = None
+        if future is None or current_order is None:
+            self.misses += 1
+            return None
+        if hasattr(self.llm_engine, "submit") and not future.done():
+            # It is the real turn now: resubmitting coalesces onto the same
+            # request and moves it up to an interactive priority.
+            future, stale = self.llm_engine.submit(final_text, current_order), future
+            stale.cancel()
+        self.hits += 1
+        print(f"[INFO] Using speculative parse ({self.hits}/{self.hits + self.misses} turns)")
+        return future
+
+    def cancel(self):
+        """Drop any speculative work and speculate no more until the next begin().
+
+        Through the gateway this withdraws the request; a direct LlmEngine
+        call is told to stop streaming.
+        """
+        with self.lock:
+            self.current_order = None
+            self._drop()
+
+    def _drop(self):
+        future, self.future = self.future, None
+        cancel_event, self.cancel_event = self.cancel_event, None
+        self.speculated_text = None
+        if future is not None:
+            future.cancel()
+        if cancel_event is not None:
+            cancel_event.set()
@@ -0,0 +1,82 @@
+import json
+
+
+class IncrementalOrderParser:
+    """Pulls item objects out of a streamed {"order": [...]} response as soon as each one closes.
+
+    Text is fed in arbitrary chunks (LLM tokens). The parser tracks string
+    literals and nesting, and every object that closes directly inside the
+    top-level "order" array is decoded and returned by feed(). Anything
+    before the first "{" (a chatty preamble) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.last_key = None
+        self.key_start = None
+        self.order_depth = None  # stack depth of the "order" array once it opens
+        self.items = []
+
+    def feed(self, chunk):
+        """Consume more text; returns the list of items completed by this chunk."""
+        self.buffer += chunk
+        completed = []
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.last_key = self.buffer[self.key_start:self.pos]
+                        self.key_start = None
+                self.pos += 1
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                # Remember keys of the root object so we know when "order" opens.
+                if len(self.stack) == 1:
+                    self.key_start = self.pos + 1
+            elif ch in "{[":
+                self.stack.append(ch)
+                if ch == "[" and len(self.stack) == 2 and self.last_key == "order":
+                    self.order_depth = len(self.stack)
+                elif ch == "{" and self.order_depth is not None and len(self.stack) == self.order_depth + 1:
+                    self.item_start = self.pos
+            elif ch in "}]":
+                if self.stack:
+                    opened = self.stack.pop()
+                    if opened == "{" and self.item_start is not None and len(self.stack) == self.order_depth:
+                        item = self._decode(self.buffer[self.item_start:self.pos + 1])
+                        self.item_start = None
+                        if item is not None:
+                            self.items.append(item)
+                            completed.append(item)
+                    elif opened == "[" and len(self.stack) + 1 == self.order_depth:
+                        self.order_depth = None
+            self.pos += 1
+
+        return completed
+
+    @staticmethod
+    def _decode(text):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            return None
+        return item if isinstance(item, dict) else None
+
+    @property
+    def text(self):
+        return self.buffer
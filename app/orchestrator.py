@@ -0,0 +1,399 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from app.audio.stream import ListenCancelled
+from app.nlp.order_cache import normalize_utterance
+from app.nlp.rule_parser import FILLER
+from app.order.menu_catalog import plural
+from app.order.order_session import CONFIRM_PHRASES
+from app.utils import metrics
+
+USUAL_PHRASES = ["the usual", "my usual", "same as last time"]
+
+IDLE, GREETING, REGISTERING, LISTENING, PARSING, CONFIRMING = (
+    "idle", "greeting", "registering", "listening", "parsing", "confirming")
+
+SESSION_SECONDS = metrics.Histogram("drive_thru_session_seconds", "Whole customer session, by how it ended",
+                                    buckets=(10, 20, 30, 45, 60, 90, 120, 180, 300, 600),
+                                    labelnames=("lane", "status"), log_events=True)
+TURN_SECONDS = metrics.Histogram("drive_thru_turn_seconds", "Transcript to updated order for one customer turn",
+                                 labelnames=("lane",), log_events=True)
+
+
+def remainder(text, phrase):
+    """What was said besides `phrase` and confirmations, e.g. "but no onions"; "" if only filler is left."""
+    rest = normalize_utterance(text).replace(phrase, " ", 1)
+    for confirm in CONFIRM_PHRASES:
+        rest = rest.replace(confirm, " ")
+    rest = " ".join(rest.split())
+    return rest if any(word not in FILLER for word in rest.split()) else ""
+
+
+def describe_items(items):
+    """Spoken form of an order, e.g. "2 burgers and 1 soda"."""
+    parts = []
+    for entry in items:
+        quantity = entry.get("quantity", 1)
+        name = entry.get("item", "")
+        parts.append(f"{quantity} {plural(name) if quantity != 1 else name}")
+    if len(parts) > 1:
+        return ", ".join(parts[:-1]) + " and " + parts[-1]
+    return "".join(parts)
+
+
+class SessionOrchestrator(QObject):
+    """Runs one customer session at a time as an asyncio task: greet -> listen -> parse -> confirm.
+
+    The event loop lives on its own thread. TTS, ASR and the LLM are awaitable
+    stages with explicit timeouts; the blocking ones run on a small executor.
+    Nothing here touches Qt widgets: every UI change goes out through the
+    `ui_event` signal, which Qt delivers on the GUI thread.
+
+    cancel() stops the running session: playback and listening stop, the
+    speculative and real LLM requests are withdrawn from the gateway, then the
+    task is cancelled. No stage is left holding an executor thread or an
+    Ollama slot. The cancelled task clears the order itself, on the loop
+    thread, and the next session does not start until it has unwound.
+
+    With an OrderHistory, completed orders are recorded against the
+    customer's uid, and a recognised regular can order "the usual" in one
+    turn without going through the LLM.
+    """
+
+    ui_event = pyqtSignal(str, object)
+
+    def __init__(self, tts, transcriber, llm, speculator, recognizer, order_session, history=None, lane=None,
+                 speak_timeout=20.0, listen_timeout=30.0, utterance_timeout=30.0, name_timeout=15.0,
+                 parse_timeout=20.0, usual_wait=0.1):
+        super().__init__()
+        self.tts = tts
+        self.transcriber = transcriber
+        self.llm = llm  # LlmGateway
+        self.speculator = speculator
+        self.recognizer = recognizer
+        self.order_session = order_session
+        self.history = history
+        self.lane = lane
+
+        self.speak_timeout = speak_timeout
+        self.listen_timeout = listen_timeout  # for the customer to start talking
+        self.utterance_timeout = utterance_timeout  # safety net once they have; the VAD ends utterances
+        self.name_timeout = name_timeout
+        self.parse_timeout = parse_timeout
+        self.usual_wait = usual_wait  # how long the greeting waits for the history prefetch
+
+        self.state = IDLE
+        self.customer = (None, None)  # (uid, name) of the current session
+        self.lock = threading.Lock()
+        self.future = None
+        self.task = None  # asyncio task of the latest session; loop thread only
+        self.llm_future = None  # gateway Future of the parse in progress
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-stage")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="session-loop", daemon=True)
+        self.thread.start()
+
+    # --- called from the Qt thread ---
+
+    @property
+    def active(self):
+        with self.lock:
+            return self.future is not None and not self.future.done()
+
+    def start_session(self, name=None, face_crop=None, resume=False, uid=None):
+        """Start a session for a recognised `name` (enrolled as `uid`), or register `face_crop` first.
+
+        With `resume` the order already in order_session (restored from the
+        journal after a crash) is continued instead of starting a new one.
+        Returns False (and does nothing) if a session is already running.
+        """
+        with self.lock:
+            if self.future is not None and not self.future.done():
+                return False
+            self.cancelled.clear()
+            self.future = asyncio.run_coroutine_threadsafe(self._session(name, face_crop, resume, uid), self.loop)
+        return True
+
+    def cancel(self):
+        """Abandon the running session, e.g. when the car drives off."""
+        with self.lock:
+            future, llm_future = self.future, self.llm_future
+        if future is None or future.done():
+            return
+        # Stop the blocking stages right away; the task unwinds on the loop thread.
+        self.cancelled.set()
+        self.tts.barge_in()
+        self.transcriber.stream.interrupt()
+        self.speculator.cancel()
+        if llm_future is not None:
+            llm_future.cancel()
+        future.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=False)
+
+    # --- everything below runs on the loop thread ---
+
+    def _ui(self, kind, payload=None):
+        self.ui_event.emit(kind, payload)
+
+    def _set_state(self, state, status=None):
+        self.state = state
+        if status is not None:
+            self._ui("status", status)
+
+    def _checkpoint(self):
+        # wait_for() can swallow a cancel that races with the stage finishing.
+        if self.cancelled.is_set():
+            raise asyncio.CancelledError()
+
+    async def _blocking(self, fn, *args, timeout=None, **kwargs):
+        future = self.loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._checkpoint()
+
+    async def speak(self, text):
+        """Play a prompt; returns False if it was cut off or timed out."""
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(self.tts.speak(text)), self.speak_timeout)
+            self._checkpoint()
+            return result
+        except asyncio.TimeoutError:
+            print(f"[WARN] TTS timed out: {text!r}")
+            self.tts.barge_in()
+            return False
+        except asyncio.CancelledError:
+            self.tts.barge_in()
+            raise
+
+    async def listen(self, order=True):
+        """Transcribe the customer's next utterance; "" if nobody spoke in time."""
+        try:
+            if order:
+                # The transcriber gives up if nobody starts talking within listen_timeout;
+                # the outer limit only catches a stuck stage, never a customer mid-sentence.
+                transcribe = functools.partial(self.transcriber.transcribe_order, timeout=self.listen_timeout,
+                                               on_partial=self.speculator.on_partial)
+                return await self._blocking(transcribe, timeout=self.listen_timeout + self.utterance_timeout)
+            return await self._blocking(self.transcriber.transcribe_once, timeout=self.name_timeout)
+        except asyncio.TimeoutError:
+            self.transcriber.stream.interrupt()
+            return ""
+        except ListenCancelled:
+            return ""
+        except asyncio.CancelledError:
+            self.transcriber.stream.interrupt()
+            raise
+
+    async def parse(self, text, on_item):
+        """Turn an utterance into an order delta (JSON string), applying items through on_item.
+
+        The gateway enforces the deadline itself and answers with its fallback
+        past it; the outer timeout only guards against a stuck gateway.
+        """
+        future = self.speculator.resolve(text)
+        if future is not None:
+            # Parsed (or being parsed) while we were waiting out the end-of-speech silence.
+            try:
+                response = await self._await_llm(future)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                print(f"[WARN] Speculative parse failed: {e}")
+            else:
+                self.llm.record_turn(future)
+                for item in json.loads(response).get("order", []):
+                    on_item(item)
+                return response
+        future = self.llm.submit(text, self.order_session.get_current_order_json(), on_item=on_item,
+                                 deadline=self.parse_timeout)
+        self.llm.record_turn(future)
+        return await self._await_llm(future)
+
+    async def _await_llm(self, future):
+        """Wait for a gateway Future; cancelling or timing out withdraws the request."""
+        with self.lock:
+            self.llm_future = future
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(future), self.parse_timeout + 5.0)
+        finally:
+            with self.lock:
+                self.llm_future = None
+        self._checkpoint()
+        return response
+
+    async def _session(self, name, face_crop, resume=False, uid=None):
+        previous, self.task = self.task, asyncio.current_task()
+        if previous is not None and not previous.done():
+            # cancel() marks the old session done before its task has unwound;
+            # let it end its journal session and clear the order first.
+            await asyncio.wait([previous])
+        self.customer = (uid, name)
+        started = time.monotonic()
+        status = "abandoned"
+        try:
+            if resume:
+                self._ui("append", f"Recovered order:\n{self.order_session.get_current_order_pretty()}")
+                await self._take_order("Sorry about that. We still have your order. What else would you like?")
+                status = "completed"
+                return
+            prompt = "Please place your order now."
+            if face_crop is not None:
+                name, uid, heard = await self._register(face_crop)
+                if not name:
+                    return
+                self.customer = (uid, name)
+            else:
+                self._set_state(GREETING)
+                usual = None
+                if self.history is not None and uid:
+                    # The prefetch started at recognition is usually done; give it a moment if not.
+                    usual = await self._blocking(self.history.usual, uid, wait=self.usual_wait)
+                if usual:
+                    heard = await self.speak(f"Welcome back, {name}! Say 'the usual' for {describe_items(usual)}.")
+                else:
+                    heard = await self.speak(f"Welcome back, {name}!")
+            if not heard:
+                # They started talking over us; that is their order, so just listen.
+                prompt = None
+            self.order_session.begin(customer=name, uid=uid)
+            await self._take_order(prompt)
+            status = "completed"
+        except asyncio.CancelledError:
+            print("[INFO] Session cancelled")
+            status = "cancelled"
+            self.order_session.end("cancelled")
+            raise
+        except Exception as e:
+            print(f"[ERROR] Session failed: {e}")
+            status = "failed"
+            self.order_session.end("failed")
+            self._ui("status", "Idle")
+        finally:
+            self.speculator.cancel()
+            self.state = IDLE
+            SESSION_SECONDS.observe(time.monotonic() - started, lane=self.lane, status=status,
+                                    fields={"items": len(self.order_session.items)})
+            if status == "cancelled":
+                self.order_session.items = []  # the car left; nothing carries over to the next one
+
+    async def _register(self, face_crop):
+        self._set_state(REGISTERING, "Registering...")
+        await self.speak("Welcome. Please state your name.")
+        spoken_name = await self.listen(order=False)
+        if not spoken_name:
+            self._ui("status", "Idle")
+            return None, None, False
+        uid = await self._blocking(self.recognizer.save_new_face, face_crop, spoken_name)
+        self._ui("registered", spoken_name)
+        heard = await self.speak(f"Thank you {spoken_name}, you are now registered.")
+        return spoken_name, uid, heard
+
+    async def _take_order(self, prompt="Please place your order now."):
+        """Order loop; `prompt` (None: straight to listening) asks for the first item."""
+        if prompt:
+            await self.speak(prompt)
+
+        while True:
+            self._set_state(LISTENING, "Listening...")
+            self.speculator.begin(self.order_session.get_current_order_json())
+            customer_input = await self.listen()
+            print(f"Customer said: {customer_input}")
+
+            if not customer_input.strip():
+                self.speculator.cancel()
+                continue
+
+            self._set_state(PARSING, "Processing...")
+            self._ui("append", f"Customer: {customer_input}")
+
+            lowered = customer_input.lower()
+            confirmed = any(phrase in lowered for phrase in CONFIRM_PHRASES)
+            usual_phrase = next((phrase for phrase in USUAL_PHRASES if phrase in lowered), None)
+            if usual_phrase:
+                self.speculator.cancel()
+                # "the usual but no onions": the rest is parsed against the order with the usual in it.
+                extra = remainder(customer_input, usual_phrase)
+                added = await self._add_usual(ask_more=not extra and not confirmed)
+                if not added:
+                    continue
+                if not extra:
+                    if confirmed:
+                        print("Customer confirmed the order.")
+                        break
+                    continue
+                customer_input = extra
+            elif confirmed:
+                self.speculator.cancel()
+                print("Customer confirmed the order.")
+                break
+
+            streamed = []
+            turn_started = time.perf_counter()
+
+            def on_item(item):
+                # Show each item the moment the model finishes writing it.
+                streamed.append(item)
+                self.order_session.update_from_llm({"order": [item]})
+                self._ui("append", f"  {item.get('action', 'add')}: {item.get('quantity', 1)} × {item.get('item', '')}")
+
+            try:
+                response = await self.parse(customer_input, on_item)
+                if json.loads(response).get("fallback"):
+                    raise asyncio.TimeoutError()
+                if not streamed:
+                    # Nothing came through incrementally; make sure it was valid at all.
+                    self.order_session.update_from_llm(json.loads(response))
+                self._ui("append", f"Order so far:\n{self.order_session.get_current_order_pretty()}")
+                TURN_SECONDS.observe(time.perf_counter() - turn_started, lane=self.lane,
+                                     fields={"words": len(customer_input.split())})
+            except asyncio.TimeoutError:
+                print("[WARN] Order parsing timed out")
+                self._ui("append", "Sorry, that took too long. Please repeat your order.")
+                continue
+            except ValueError as e:
+                print(f"⚠️ Error parsing LLM response: {e}")
+                continue
+
+            if confirmed:
+                print("Customer confirmed the order.")
+                break
+            self._set_state(CONFIRMING)
+            await self.speak("Do you need anything else? If not, please say 'I am done.'")
+
+        final_order_text = self.order_session.get_current_order_pretty()
+        uid, name = self.customer
+        if self.history is not None:
+            self.history.record(uid, name, self.lane, self.order_session.items)
+        self.order_session.end("completed")
+        self._ui("final", final_order_text)
+        print("\nFinal Order:\n", final_order_text)
+
+    async def _add_usual(self, ask_more=True):
+        """Add the customer's usual order straight from history; False if they have none.
+
+        With `ask_more` the usual is read back along with "anything else?".
+        """
+        uid, _ = self.customer
+        usual = self.history.usual(uid) if self.history is not None and uid else None
+        if not usual:
+            await self.speak("Sorry, I don't have a usual order for you yet. What would you like?")
+            return False
+        for entry in usual:
+            self.order_session.update_from_llm({"order": [dict(entry, action="add")]})
+        self._ui("append", f"Order so far:\n{self.order_session.get_current_order_pretty()}")
+        if ask_more:
+            self._set_state(CONFIRMING)
+            await self.speak(f"Got it, {describe_items(usual)}. Do you need anything else? If not, please say 'I am done.'")
+        return True
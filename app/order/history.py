@@ -0,0 +1,173 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from app.nlp.order_cache import canonical_order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id           INTEGER PRIMARY KEY,
+    uid          TEXT,
+    name         TEXT,
+    lane         TEXT,
+    completed_at REAL NOT NULL,
+    signature    TEXT NOT NULL,
+    items        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_uid ON orders (uid, completed_at);
+CREATE INDEX IF NOT EXISTS orders_by_time ON orders (completed_at);
+"""
+
+# Most frequent distinct orders for one customer, newest first on ties.
+TOP_ORDERS_SQL = """
+SELECT items, COUNT(*) AS times, MAX(completed_at) AS last
+FROM orders
+WHERE uid = ? AND completed_at >= ?
+GROUP BY signature
+ORDER BY times DESC, last DESC
+LIMIT ?
+"""
+
+
+class OrderHistory:
+    """Completed orders in a local SQLite database (WAL mode), indexed by customer uid and time.
+
+    record() and prefetch() only queue work. A single writer thread owns the
+    connection: it inserts everything queued since its last pass in one
+    transaction, then answers prefetch requests by computing the customer's
+    most frequent orders into memory, where usual() reads them without
+    touching the disk. prefetch() returns an Event that is set once they are
+    in memory, and usual(uid, wait=...) can wait a moment for one in flight.
+    """
+
+    def __init__(self, path="order_history.db", top_n=3, window_days=180, batch_size=64):
+        self.path = path
+        self.top_n = top_n
+        self.window_days = window_days
+        self.batch_size = batch_size
+
+        self.lock = threading.Lock()
+        self.top_orders = {}  # uid -> [(items, times), ...], most frequent first
+        self.loaded = {}      # uid -> Event, set once top_orders[uid] has been computed
+        self.jobs = queue.Queue()
+        self.conn = None
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._worker, args=(ready,), name="order-history", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a commit survives a crash of the app, just not a power cut.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    # --- called from session threads ---
+
+    def record(self, uid, name, lane, items):
+        """Queue a completed order; empty orders are not kept."""
+        if not items:
+            return
+        items = [dict(entry) for entry in items]
+        self.jobs.put(("order", (uid, name, lane, time.time(), canonical_order(items), json.dumps(items))))
+
+    def prefetch(self, uid):
+        """Start computing `uid`'s usual orders so usual() can answer immediately.
+
+        Returns an Event set once they are loaded; asking again for a uid
+        already loaded or in flight returns the same Event without new work.
+        """
+        if not uid:
+            return None
+        with self.lock:
+            loaded = self.loaded.get(uid)
+            if loaded is not None:
+                return loaded
+            loaded = self.loaded[uid] = threading.Event()
+        self.jobs.put(("prefetch", uid))
+        return loaded
+
+    def usual(self, uid, wait=None):
+        """The customer's most frequent order (list of order items), or None if not known yet.
+
+        With `wait`, first blocks up to that many seconds for the prefetch of
+        `uid` (started here if nobody asked for it yet).
+        """
+        if wait is not None and uid:
+            self.prefetch(uid).wait(wait)
+        with self.lock:
+            top = self.top_orders.get(uid)
+        return [dict(entry) for entry in top[0][0]] if top else None
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written."""
+        done = threading.Event()
+        self.jobs.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        self.jobs.put(("close", None))
+        self.thread.join()
+
+    # --- writer thread ---
+
+    def _worker(self, ready):
+        try:
+            self.conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not open order history {self.path}: {e}")
+        ready.set()
+
+        while True:
+            jobs = [self.jobs.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = [data for kind, data in jobs if kind == "order"]
+            if rows and self.conn is not None:
+                try:
+                    with self.conn:
+                        self.conn.executemany(
+                            "INSERT INTO orders (uid, name, lane, completed_at, signature, items) "
+                            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                except sqlite3.Error as e:
+                    print(f"[ERROR] Could not save {len(rows)} order(s) to history: {e}")
+
+            # Customers who just ordered get their usual refreshed too.
+            uids = {data for kind, data in jobs if kind == "prefetch"}
+            uids.update(row[0] for row in rows if row[0] in self.top_orders)
+            for uid in uids:
+                self._load_top_orders(uid)
+                with self.lock:
+                    loaded = self.loaded.get(uid)
+                if loaded is not None:
+                    loaded.set()  # also on a read error: waiters should not hang on it
+
+            for kind, data in jobs:
+                if kind == "flush":
+                    data.set()
+            if any(kind == "close" for kind, _ in jobs):
+                break
+
+        if self.conn is not None:
+            self.conn.close()
+
+    def _load_top_orders(self, uid):
+        if self.conn is None:
+            return
+        since = time.time() - self.window_days * 86400
+        try:
+            rows = self.conn.execute(TOP_ORDERS_SQL, (uid, since, self.top_n)).fetchall()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not read order history for {uid}: {e}")
+            return
+        top = [(json.loads(items), times) for items, times, _ in rows]
+        with self.lock:
+            self.top_orders[uid] = top
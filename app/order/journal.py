@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return b"%08x\t" % zlib.crc32(payload) + payload + b"\n"
+
+
+def _decode(line):
+    """Return the record for one journal line, or None if it is torn or corrupt."""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b"\t":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform (Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OrderJournal:
+    """Append-only, checksummed log of one lane's order sessions.
+
+    Each line is `<crc32 hex>\\t<json>` for a "begin", "delta" (an
+    update_from_llm payload) or "end" record. append() only queues the
+    record: a writer thread writes everything queued since its last pass and
+    fsyncs once (group commit), so the session never waits on the disk;
+    wait() blocks until a record is durable. A batch that fails to write or
+    fsync is rolled back off the end of the file and retried every
+    `retry_interval` seconds; meanwhile wait() raises the error instead of
+    reporting those records as durable. A failed compaction is logged and
+    reported the same way, and appending carries on in the uncompacted log.
+
+    recover() replays the file on startup, stops at the first torn or corrupt
+    line (a crash mid-write) and returns the session that was still open.
+    The log is compacted down to the open session's records at startup and
+    whenever it grows past `compact_bytes`.
+    """
+
+    def __init__(self, path, compact_bytes=1 << 20, retry_interval=0.5):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.retry_interval = retry_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.pending = []
+        self.next_seq = 1
+        self.durable_seq = 0
+        self.durable_bytes = 0  # file size after the last successful fsync
+        self.error = None       # OSError of the last failed write, until one succeeds
+        self.open_session = None  # session id
+        self.open_records = []    # records of the open session, for compaction
+        self.closed = False
+
+        self.file = None
+        self.thread = None
+
+    # --- startup ---
+
+    def recover(self):
+        """Read the existing log; returns {"session": id, "meta": {...}, "deltas": [...]} or None.
+
+        Must be called once, before the first append().
+        """
+        records = []
+        good_bytes = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        break
+                    records.append(record)
+                    good_bytes += len(line)
+            size = os.path.getsize(self.path)
+            if good_bytes < size:
+                print(f"[WARN] Journal {self.path}: dropped {size - good_bytes} bytes of torn/corrupt tail")
+
+        for record in records:
+            self._track(record)
+        if records:
+            self.next_seq = records[-1].get("seq", 0) + 1
+            self.durable_seq = self.next_seq - 1
+
+        self._rewrite()
+        self._open()
+        self.thread = threading.Thread(target=self._writer, name="order-journal", daemon=True)
+        self.thread.start()
+
+        if self.open_session is None:
+            return None
+        begin = self.open_records[0]
+        return {
+            "session": self.open_session,
+            "meta": begin.get("data") or {},
+            "deltas": [r["data"] for r in self.open_records if r["type"] == "delta"],
+        }
+
+    def _track(self, record):
+        """Keep the records of the session that is still open (one per lane at a time)."""
+        kind = record.get("type")
+        if kind == "begin":
+            # A new car: whatever was open before it was abandoned.
+            self.open_session = record["session"]
+            self.open_records = [record]
+        elif record.get("session") != self.open_session:
+            return
+        elif kind == "delta":
+            self.open_records.append(record)
+        elif kind == "end":
+            self.open_session = None
+            self.open_records = []
+
+    # --- hot path ---
+
+    def append(self, kind, session, data=None):
+        """Queue a record; returns its sequence number without touching the disk."""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("journal is closed")
+            seq = self.next_seq
+            self.next_seq += 1
+            record = {"seq": seq, "ts": round(time.time(), 3), "type": kind, "session": session, "data": data}
+            self._track(record)
+            self.pending.append(record)
+            self.changed.notify_all()
+        return seq
+
+    def wait(self, seq=None, timeout=None):
+        """Block until record `seq` (default: everything appended so far) is on disk.
+
+        Returns False on timeout; raises the OSError if writing it failed (it is still being retried).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            seq = self.next_seq - 1 if seq is None else seq
+            while self.durable_seq < seq:
+                if self.error is not None:
+                    raise self.error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    # --- writer thread ---
+
+    def _writer(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.changed.wait()
+                batch, self.pending = self.pending, []
+                if not batch and self.closed:
+                    break
+            try:
+                if self.file.closed:
+                    self._open()  # after a rollback or a failed compaction
+                self.file.write(b"".join(_encode(record) for record in batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except OSError as e:
+                print(f"[ERROR] Journal write failed: {e}")
+                self._rollback()
+                with self.lock:
+                    # Not durable: put the batch back in front and tell the waiters.
+                    self.pending = batch + self.pending
+                    self.error = e
+                    self.changed.notify_all()
+                    closed = self.closed
+                if closed:
+                    print(f"[ERROR] Journal {self.path}: giving up on {len(self.pending)} records at close")
+                    break
+                time.sleep(self.retry_interval)
+                continue
+            with self.lock:
+                self.durable_seq = batch[-1]["seq"]
+                self.durable_bytes = self.file.tell()
+                self.error = None
+                self.changed.notify_all()
+                compact = self.durable_bytes > self.compact_bytes
+            if compact:
+                try:
+                    self._compact()
+                except OSError as e:
+                    print(f"[ERROR] Journal {self.path}: compaction failed: {e}")
+                    with self.lock:
+                        self.error = e
+                        self.changed.notify_all()
+                    self._reopen_after_compaction()
+        if not self.file.closed:
+            self.file.close()
+
+    def _open(self):
+        self.file = open(self.path, "ab")
+        self.durable_bytes = self.file.tell()
+
+    def _rollback(self):
+        """Cut a partly written batch off the end of the file, so a retry does not follow a torn line."""
+        try:
+            self.file.close()
+        except OSError:
+            pass  # the unflushed buffer is dropped along with it
+        try:
+            if os.path.getsize(self.path) > self.durable_bytes:
+                os.truncate(self.path, self.durable_bytes)
+        except OSError as e:
+            print(f"[ERROR] Journal {self.path}: could not truncate after a failed write: {e}")
+
+    def _compact(self):
+        self.file.close()
+        self._rewrite()
+        self._open()
+
+    def _reopen_after_compaction(self):
+        try:
+            os.remove(f"{self.path}.tmp")
+        except OSError:
+            pass
+        if self.file.closed:
+            try:
+                self._open()
+            except OSError as e:
+                # The next batch tries again, inside the write error handling.
+                print(f"[ERROR] Journal {self.path}: could not reopen after a failed compaction: {e}")
+
+    def _rewrite(self):
+        """Atomically replace the log with just the open session's records."""
+        with self.lock:
+            # Records still queued are written after the rewrite, not in it.
+            keep = [r for r in self.open_records if r["seq"] <= self.durable_seq]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(_encode(record) for record in keep))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
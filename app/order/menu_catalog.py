@@ -0,0 +1,235 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+DEFAULT_MENU_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'menu.json')
+
+
+def normalize_name(text):
+    return " ".join(re.findall(r"[a-z0-9']+", str(text).lower()))
+
+
+def plural(name):
+    if name.endswith("s"):
+        return name
+    if name.endswith(("x", "ch", "sh")):
+        return name + "es"
+    if name.endswith("y") and len(name) > 1 and name[-2] not in "aeiou":
+        return name[:-1] + "ies"
+    return name + "s"
+
+
+def singular(name):
+    if name.endswith("ies") and len(name) > 3:
+        return name[:-3] + "y"
+    if name.endswith(("xes", "ches", "shes")):
+        return name[:-2]
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MenuItem:
+    __slots__ = ("name", "key", "price", "section", "image", "aliases")
+
+    def __init__(self, entry, section):
+        self.name = entry["name"]
+        self.key = normalize_name(self.name)
+        self.price = float(entry.get("price", 0.0))
+        self.section = section
+        self.image = entry.get("image", "")
+        self.aliases = [normalize_name(a) for a in entry.get("aliases", [])]
+
+
+class _Index:
+    """Immutable lookup tables for one version of the menu."""
+
+    def __init__(self, menu):
+        self.menu = menu
+        self.items = {}    # key -> MenuItem
+        self.forms = {}    # normalized surface form -> key
+        for section, entries in menu.items():
+            for entry in entries:
+                item = MenuItem(entry, section)
+                self.items[item.key] = item
+
+        # Last word alone ("fries", "sticks") when it names exactly one item
+        # and is not also a word in another item ("cheese" would be both).
+        last_words = defaultdict(set)
+        other_words = set()
+        for key in self.items:
+            words = key.split()
+            last_words[words[-1]].add(key)
+            other_words.update(words[:-1])
+        for key, item in self.items.items():
+            for form in [key, *item.aliases]:
+                words = form.split()
+                for variant in (form, " ".join(words[:-1] + [plural(words[-1])]),
+                                " ".join(words[:-1] + [singular(words[-1])])):
+                    self.forms.setdefault(variant, key)
+        for word, owners in last_words.items():
+            if len(owners) == 1 and word not in other_words:
+                key = next(iter(owners))
+                for variant in (word, plural(word), singular(word)):
+                    self.forms.setdefault(variant, key)
+
+        self.grams = defaultdict(list)  # trigram -> surface forms containing it
+        self.form_grams = {}
+        for form in self.forms:
+            grams = trigrams(form)
+            self.form_grams[form] = grams
+            for gram in grams:
+                self.grams[gram].append(form)
+
+
+class MenuCatalog:
+    """The menu, loaded once and shared: item lookup, prices and fuzzy name resolution.
+
+    resolve() maps whatever ASR or the LLM produced ("Fries", "burgers",
+    "mozarella stick") to the canonical item key (the lower-case menu name)
+    through a hash index of names, plurals, singulars and `aliases` from
+    menu.json, falling back to a trigram index scored by Dice similarity.
+    The fallback is strict, since a wrong match puts an item on the bill the
+    customer never ordered: the best form must score at least `fuzzy_cutoff`,
+    be of similar length (`min_length_ratio`), and beat the best form of any
+    other item by `ambiguity_margin`, or resolve() returns None.
+    The file is re-read when its mtime changes (checked at most every
+    `check_interval` seconds); subscribe() callbacks get the new menu dict.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, path=None, check_interval=1.0, fuzzy_cutoff=0.75, min_length_ratio=0.75,
+                 ambiguity_margin=0.05):
+        self.path = path or DEFAULT_MENU_PATH
+        self.check_interval = check_interval
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.min_length_ratio = min_length_ratio
+        self.ambiguity_margin = ambiguity_margin
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.version = 0
+        self.mtime = None
+        self.checked_at = 0.0
+        self.index = None
+        self.reload()
+
+    @classmethod
+    def default(cls):
+        """Process-wide catalog for app/data/menu.json."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def reload(self):
+        """Re-read the file now; returns True if the menu changed."""
+        mtime = os.path.getmtime(self.path)
+        try:
+            with open(self.path, 'r') as f:
+                menu = json.load(f)
+            index = _Index(menu)
+        except (OSError, ValueError, KeyError) as e:
+            # Half-written file or a typo: keep serving the previous menu.
+            print(f"[ERROR] Could not load menu {self.path}: {e}")
+            if self.index is None:
+                raise
+            return False
+        with self.lock:
+            changed = self.index is None or index.menu != self.index.menu
+            self.index = index
+            self.mtime = mtime
+            if changed:
+                self.version += 1
+            listeners = list(self.listeners)
+        if changed and self.version > 1:
+            print(f"[INFO] Menu reloaded ({len(index.items)} items)")
+            for listener in listeners:
+                listener(index.menu)
+        return changed
+
+    def refresh(self):
+        """Reload if the file changed since the last check; cheap enough to call on every lookup."""
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return False
+        self.checked_at = now
+        try:
+            if os.path.getmtime(self.path) == self.mtime:
+                return False
+        except OSError:
+            return False
+        return self.reload()
+
+    def subscribe(self, listener):
+        """Call listener(menu_dict) after every reload that changes the menu."""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def _current(self):
+        self.refresh()
+        return self.index
+
+    @property
+    def menu(self):
+        """The raw {section: [entries]} dict."""
+        return self._current().menu
+
+    def items(self):
+        return list(self._current().items.values())
+
+    def names(self):
+        return [item.name for item in self._current().items.values()]
+
+    def get(self, name):
+        """MenuItem for a name or alias, exact (normalized) match only."""
+        index = self._current()
+        key = index.forms.get(normalize_name(name))
+        return index.items[key] if key else None
+
+    def resolve(self, name):
+        """Canonical item key for a possibly misheard/misspelled name, or None."""
+        index = self._current()
+        text = normalize_name(name)
+        key = index.forms.get(text)
+        if key is not None or not text:
+            return key
+
+        # Dice >= cutoff needs at least `needed` shared trigrams, so a match
+        # must contain one of the query's (len - needed + 1) rarest trigrams;
+        # only those candidates are scored.
+        grams = trigrams(text)
+        needed = math.ceil(self.fuzzy_cutoff * len(grams) / (2.0 - self.fuzzy_cutoff))
+        rarest = sorted(grams, key=lambda g: len(index.grams.get(g, ())))[:len(grams) - needed + 1]
+        candidates = {form for gram in rarest for form in index.grams.get(gram, ())}
+
+        scores = {}  # item key -> best score over its forms
+        for form in candidates:
+            if min(len(form), len(text)) < self.min_length_ratio * max(len(form), len(text)):
+                continue  # "lemon" is not a misheard "lemonade"
+            form_grams = index.form_grams[form]
+            score = 2.0 * len(grams & form_grams) / (len(grams) + len(form_grams))
+            key = index.forms[form]
+            if score >= self.fuzzy_cutoff and score > scores.get(key, 0.0):
+                scores[key] = score
+        if not scores:
+            return None
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.ambiguity_margin:
+            return None  # too close to call between two items
+        return ranked[0][0]
+
+    def price(self, name):
+        """Unit price for `name`, or None if it cannot be resolved to a menu item."""
+        key = self.resolve(name)
+        return self._current().items[key].price if key else None
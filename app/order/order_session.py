@@ -1,13 +1,41 @@
 import re
 import json
-import os
+import uuid
+
+from app.order.menu_catalog import MenuCatalog
+
+# What ends an order turn loop; shared by the orchestrator and the replay bench.
+CONFIRM_PHRASES = ["confirm", "done", "that's all", "complete", "finish"]
 
 class OrderSession:
-    def __init__(self):
+    def __init__(self, catalog=None, journal=None):
+        self.items = []
+        self.catalog = catalog or MenuCatalog.default()
+        self.journal = journal  # OrderJournal, optional
+        self.session_id = None
+
+    def begin(self, customer=None, uid=None):
+        """Start a fresh order for the next car."""
         self.items = []
-        menu_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'menu.json')
-        with open(menu_path, 'r') as f:
-            self.menu = json.load(f)
+        self.session_id = uuid.uuid4().hex[:12]
+        if self.journal is not None:
+            self.journal.append("begin", self.session_id, {"customer": customer, "uid": uid})
+
+    def end(self, status="completed"):
+        if self.journal is not None and self.session_id is not None:
+            self.journal.append("end", self.session_id, {"status": status, "order": self.items})
+        self.session_id = None
+
+    def restore(self, session_id, deltas):
+        """Rebuild an unfinished order from its journaled deltas (see OrderJournal.recover)."""
+        self.items = []
+        self.session_id = session_id
+        for delta in deltas:
+            self._apply(delta)
+
+    @property
+    def menu(self):
+        return self.catalog.menu
 
     def add_items(self, new_items):
         for item in new_items:
@@ -62,7 +90,11 @@ class OrderSession:
     def update_from_llm(self, parsed_response):
         if "order" not in parsed_response:
             return
+        if self.journal is not None and self.session_id is not None and parsed_response["order"]:
+            self.journal.append("delta", self.session_id, {"order": parsed_response["order"]})
+        self._apply(parsed_response)
 
+    def _apply(self, parsed_response):
         for update in parsed_response["order"]:
             item = update.get("item")
             qty = update.get("quantity", 1)
@@ -72,8 +104,8 @@ class OrderSession:
             if not item or not action:
                 continue
 
-            # Normalize item name
-            item = item.lower()
+            # Normalize item name onto the menu ("fries" -> "french fries")
+            item = self.catalog.resolve(item) or item.lower()
 
             if action == "add":
                 self.items.append({
@@ -125,8 +157,8 @@ class OrderSession:
         return "\n".join(lines)
 
     def _get_price(self, item_name):
-        for section_items in self.menu.values():
-            for entry in section_items:
-                if entry["name"].lower() == item_name.lower():
-                    return entry["price"]
-        return 0.0  # fallback if not found
\ No newline at end of file
+        price = self.catalog.price(item_name)
+        if price is None:
+            print(f"[WARN] {item_name!r} is not on the menu; pricing it at $0.00")
+            return 0.0
+        return price
\ No newline at end of file
@@ -0,0 +1,55 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+_logger = None
+_listener = None
+
+
+def setup(path="logs/drive_thru.jsonl", max_bytes=10 << 20, backups=5):
+    """Start the structured event log: one JSON object per line, rotated at `max_bytes`.
+
+    Records are handed to a background thread through a queue, so event()
+    never waits on the disk.
+    """
+    global _logger, _listener
+    if _logger is not None:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                   encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    logger = logging.getLogger("drive_thru.events")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    _logger = logger
+
+
+def enabled():
+    return _logger is not None
+
+
+def event(kind, **fields):
+    """Log one event, e.g. event("llm_call", lane="Lane 1", seconds=0.41); a no-op until setup()."""
+    if _logger is None:
+        return
+    record = {"ts": round(time.time(), 3), "event": kind}
+    record.update(fields)
+    _logger.info(json.dumps(record, default=str))
+
+
+def shutdown():
+    global _logger, _listener
+    if _listener is not None:
+        _listener.stop()
+    _logger = _listener = None
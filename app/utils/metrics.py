@@ -0,0 +1,228 @@
+"""Low-overhead counters, gauges and fixed-bucket histograms, served in the Prometheus text format.
+
+Metrics are declared once at module level and are free until enable() is
+called: every update checks one module flag first, and Histogram.time()
+returns a shared no-op span.
+
+    FRAME_SECONDS = metrics.Histogram("drive_thru_frame_seconds", "process_frame time", labelnames=("lane",))
+
+    with FRAME_SECONDS.time(lane=self.name):
+        ...
+
+Histograms created with `log_events=True` also write each observation to
+the structured log (app/utils/logger.py); keep that to per-turn events, not
+per-frame ones.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.utils import logger
+
+# Seconds; covers a 1 ms Haar pass up to a 30 s LLM timeout.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+enabled = False
+_registry = []
+_registry_lock = threading.Lock()
+_server = None
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=""):
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help="", labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            children = list(self.children.items())
+        for key, value in children:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.children[key] = self.children.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. With `fn`, it is sampled at scrape time instead:
+    fn() returns a number, or {label value tuple: number} for labelled gauges."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help="", labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        if not enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.children[key] = value
+
+    def expose(self):
+        if self.fn is not None:
+            try:
+                values = self.fn()
+            except Exception as e:
+                print(f"[WARN] Could not sample {self.name}: {e}")
+                values = {}
+            with self.lock:
+                self.children = dict(values) if isinstance(values, dict) else {(): values}
+        return super().expose()
+
+
+class _Span:
+    __slots__ = ("histogram", "labels", "fields", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.fields = None
+
+    def note(self, **fields):
+        """Extra fields for the structured log record of this span."""
+        if self.fields is None:
+            self.fields = fields
+        else:
+            self.fields.update(fields)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, fields=self.fields, **self.labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def note(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=LATENCY_BUCKETS, labelnames=(), log_events=False):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.log_events = log_events
+
+    def observe(self, value, fields=None, **labels):
+        """Record one value; `fields` go only to the structured log record (with log_events)."""
+        if not enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            child = self.children.get(key)
+            if child is None:
+                # Per-bucket counts (last one is +Inf), sum, count.
+                child = self.children[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            child[0][index] += 1
+            child[1] += value
+            child[2] += 1
+        if self.log_events:
+            logger.event(self.name, value=round(value, 6), **labels, **(fields or {}))
+
+    def time(self, **labels):
+        """Context manager observing the time spent inside it."""
+        if not enabled:
+            return _NOOP_SPAN
+        return _Span(self, labels)
+
+    def _samples(self, key, child):
+        counts, total, count = child
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def enable(port=9108, host="127.0.0.1", log_path=None):
+    """Start collecting; serve /metrics on host:port (None: no endpoint) and log events to `log_path`."""
+    global enabled, _server
+    enabled = True
+    if log_path:
+        logger.setup(log_path)
+    if port is not None and _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"[INFO] Metrics on http://{host}:{_server.server_address[1]}/metrics")
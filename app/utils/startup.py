@@ -0,0 +1,145 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils import logger
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class StartupLoader:
+    """Loads components concurrently in the background, each as soon as the ones it needs are ready.
+
+    add(name, fn, after=()) registers a loader; start() runs them on a small
+    thread pool and returns at once. Progress is available through state(),
+    ready(), wait() and subscribe(callback(name, state)); callbacks run on
+    the loader threads. `timings` holds (started, seconds) per component,
+    relative to start(), and a summary is printed once everything is done.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.loaders = {}   # name -> (fn, after)
+        self.states = {}
+        self.errors = {}
+        self.timings = {}
+        self.listeners = []
+        self.started_at = None
+        self.executor = None
+
+    def add(self, name, fn, after=()):
+        with self.lock:
+            self.loaders[name] = (fn, tuple(after))
+            self.states[name] = PENDING
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup")
+        self._schedule()
+        return self
+
+    def subscribe(self, listener):
+        """Call listener(name, state) on every change; it is first called with the current states."""
+        with self.lock:
+            self.listeners.append(listener)
+            current = list(self.states.items())
+        for name, state in current:
+            listener(name, state)
+
+    def state(self, name):
+        with self.lock:
+            return self.states[name]
+
+    def ready(self, *names):
+        with self.lock:
+            return all(self.states[name] == READY for name in names)
+
+    def waiting_for(self, *names):
+        """Those of `names` that are not ready yet."""
+        with self.lock:
+            return [name for name in names if self.states[name] != READY]
+
+    def failed(self, *names):
+        """{name: error} for those of `names` (default: all) that failed to load."""
+        with self.lock:
+            return {name: error for name, error in self.errors.items() if not names or name in names}
+
+    def wait(self, *names, timeout=None):
+        """Block until `names` (default: all) have finished loading; True if all are ready."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            names = names or tuple(self.loaders)
+            while any(self.states[name] in (PENDING, LOADING) for name in names):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+            return all(self.states[name] == READY for name in names)
+
+    def _set_state(self, name, state, error=None):
+        with self.lock:
+            self.states[name] = state
+            if error is not None:
+                self.errors[name] = error
+            listeners = list(self.listeners)
+            self.changed.notify_all()
+        for listener in listeners:
+            try:
+                listener(name, state)
+            except Exception as e:
+                print(f"[WARN] Startup listener failed: {e}")
+
+    def _schedule(self):
+        """Start everything whose dependencies are ready; fail everything whose dependencies failed."""
+        runnable, blocked = [], []
+        with self.lock:
+            for name, (fn, after) in self.loaders.items():
+                if self.states[name] != PENDING:
+                    continue
+                if any(self.states[dep] == FAILED for dep in after):
+                    blocked.append(name)
+                elif all(self.states[dep] == READY for dep in after):
+                    self.states[name] = LOADING
+                    runnable.append(name)
+        for name in blocked:
+            self._set_state(name, FAILED, "a dependency failed")
+        for name in runnable:
+            self._set_state(name, LOADING)
+            self.executor.submit(self._run, name)
+        if blocked:
+            self._schedule()
+        else:
+            self._maybe_report()
+
+    def _run(self, name):
+        fn, _ = self.loaders[name]
+        started = time.monotonic()
+        try:
+            fn()
+        except Exception as e:
+            self.timings[name] = (started - self.started_at, time.monotonic() - started)
+            print(f"[ERROR] Startup: {name} failed after {self.timings[name][1]:.2f}s: {e}")
+            self._set_state(name, FAILED, str(e))
+        else:
+            self.timings[name] = (started - self.started_at, time.monotonic() - started)
+            print(f"[INFO] Startup: {name} ready in {self.timings[name][1]:.2f}s")
+            self._set_state(name, READY)
+        self._schedule()
+
+    def _maybe_report(self):
+        with self.lock:
+            if any(state in (PENDING, LOADING) for state in self.states.values()) or self.executor is None:
+                return
+            executor, self.executor = self.executor, None
+        total = time.monotonic() - self.started_at
+        lines = [f"[INFO] Startup finished in {total:.2f}s:"]
+        for name, (started, seconds) in sorted(self.timings.items(), key=lambda kv: kv[1][0]):
+            lines.append(f"    {name:<14} +{started:5.2f}s  {seconds:6.2f}s  {self.states[name]}")
+        print("\n".join(lines))
+        logger.event("startup", seconds=round(total, 3),
+                     components={name: {"started": round(started, 3), "seconds": round(seconds, 3),
+                                        "state": self.states[name]}
+                                 for name, (started, seconds) in self.timings.items()})
+        executor.shutdown(wait=False)
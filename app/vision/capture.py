@@ -0,0 +1,106 @@
+import cv2
+import threading
+import time
+from collections import deque
+
+from app.utils import metrics
+
+FRAMES_CAPTURED = metrics.Counter("drive_thru_camera_frames_total", "Frames read from the camera",
+                                  labelnames=("camera",))
+FRAMES_DROPPED = metrics.Counter("drive_thru_camera_dropped_frames_total",
+                                 "Frames replaced before anyone read them", labelnames=("camera",))
+
+
+class FrameGrabber:
+    """Reads frames from a capture device on its own thread.
+
+    Frames land in a small ring buffer; consumers always get the newest one
+    and anything they never looked at is counted as dropped.
+    """
+
+    def __init__(self, source=0, buffer_size=2):
+        self.source = source
+        self.label = str(source)
+        self.cap = cv2.VideoCapture(source)
+        # Ask the driver not to queue frames on its side either.
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.buffer = deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+
+        self.frame_id = 0
+        self.last_read_id = 0
+        self.captured_frames = 0
+        self.dropped_frames = 0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def _capture_loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+
+            with self.lock:
+                self.frame_id += 1
+                self.captured_frames += 1
+                FRAMES_CAPTURED.inc(camera=self.label)
+                if len(self.buffer) == self.buffer.maxlen:
+                    evicted_id = self.buffer[0][0]
+                    if evicted_id > self.last_read_id:
+                        self.dropped_frames += 1
+                        FRAMES_DROPPED.inc(camera=self.label)
+                self.buffer.append((self.frame_id, frame))
+                self.frame_ready.notify_all()
+
+    def read(self, timeout=None):
+        """Return (frame_id, frame) for the newest frame, or (None, None).
+
+        Frames older than the newest one that were never read are counted
+        in `dropped_frames`. With a timeout, waits for a frame newer than
+        the last one returned.
+        """
+        with self.lock:
+            if timeout is not None and self.frame_id <= self.last_read_id:
+                self.frame_ready.wait_for(lambda: self.frame_id > self.last_read_id or not self.running,
+                                          timeout=timeout)
+            if not self.buffer:
+                return None, None
+
+            frame_id, frame = self.buffer[-1]
+            if frame_id <= self.last_read_id:
+                return None, None
+
+            skipped = sum(1 for fid, _ in self.buffer if self.last_read_id < fid < frame_id)
+            self.dropped_frames += skipped
+            FRAMES_DROPPED.inc(skipped, camera=self.label)
+            self.last_read_id = frame_id
+            return frame_id, frame
+
+    def stats(self):
+        with self.lock:
+            return {
+                "captured": self.captured_frames,
+                "dropped": self.dropped_frames,
+            }
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            self.frame_ready.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.cap.isOpened():
+            self.cap.release()
@@ -17,6 +17,18 @@ class FaceDetector:
         )
         return faces
 
+    def detect(self, pframe):
+        """Detect on the downscaled plane of a PreprocessedFrame; boxes come back at full resolution."""
+        min_side = max(1, 60 // pframe.scale)
+        faces = self.face_cascade.detectMultiScale(
+            pframe.detection_gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(min_side, min_side),
+            flags=cv2.CASCADE_SCALE_IMAGE,
+        )
+        return pframe.to_full_res(faces)
+
     # def show_debug_feed(self):
     #     cap = cv2.VideoCapture(0)
     #     if not cap.isOpened():
@@ -0,0 +1,302 @@
+import cv2
+import os
+import json
+import shutil
+import threading
+import numpy as np
+from datetime import datetime
+
+GALLERY_VERSION = 1
+FACE_SIZE = (200, 200)
+
+
+class FaceGallery:
+    """Packed on-disk store for enrolled face samples.
+
+    Layout of the gallery directory:
+        manifest.json   version, face size and generation, rewritten only on creation/compaction
+        faces.u8        all samples back to back as one contiguous uint8 array (N x H x W)
+        labels.i32      the integer label of each sample, same order
+        people.jsonl    append-only log of enrolments / removals (uid, label, name)
+
+    Samples and labels are memory-mapped, so opening a gallery costs a couple of
+    syscalls no matter how many faces it holds. New samples are appended; removed
+    people are only dropped from the files by compact().
+    """
+
+    def __init__(self, path="known_faces/gallery"):
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+
+        manifest = self._read_manifest()
+        if manifest is None:
+            manifest = {"version": GALLERY_VERSION, "face_size": list(FACE_SIZE)}
+            self._write_manifest(manifest)
+        if manifest.get("version") != GALLERY_VERSION:
+            raise ValueError(f"Unsupported gallery version {manifest.get('version')} in {self.path}")
+        self.face_size = tuple(manifest["face_size"])
+        # Bumped by compact(); anything derived from sample positions keys on it.
+        self.generation = manifest.get("generation", 0)
+
+        self.people = {}          # uid -> {"label", "name", "registered_at"}
+        self.uid_by_label = {}    # label -> uid
+        self.removed = set()
+        self.next_label = 0       # never reused until compact(), removed samples keep theirs
+        self._load_people()
+
+        self._faces = None
+        self._labels = None
+        self._mapped_count = -1
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_manifest(self):
+        if not os.path.exists(self._file("manifest.json")):
+            return None
+        with open(self._file("manifest.json"), "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._file("manifest.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self._file("manifest.json"))
+
+    def _load_people(self):
+        log_path = self._file("people.jsonl")
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash mid-append.
+                    continue
+                self._apply_log_entry(entry)
+
+    def _apply_log_entry(self, entry):
+        uid = entry["uid"]
+        if entry.get("op") == "remove":
+            self.removed.add(uid)
+            person = self.people.pop(uid, None)
+            if person is not None:
+                self.uid_by_label.pop(person["label"], None)
+            return
+        self.removed.discard(uid)
+        self.people[uid] = {
+            "label": entry["label"],
+            "name": entry["name"],
+            "registered_at": entry.get("registered_at"),
+        }
+        self.uid_by_label[entry["label"]] = uid
+        self.next_label = max(self.next_label, entry["label"] + 1)
+
+    def _append_log(self, entry):
+        with open(self._file("people.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply_log_entry(entry)
+
+    @property
+    def sample_bytes(self):
+        return self.face_size[0] * self.face_size[1]
+
+    def __len__(self):
+        """Number of complete samples (a torn trailing write is ignored)."""
+        faces_path, labels_path = self._file("faces.u8"), self._file("labels.i32")
+        if not os.path.exists(faces_path) or not os.path.exists(labels_path):
+            return 0
+        return min(os.path.getsize(faces_path) // self.sample_bytes, os.path.getsize(labels_path) // 4)
+
+    def arrays(self):
+        """Return (faces, labels) as read-only memory maps over the first len(self) samples."""
+        with self.lock:
+            count = len(self)
+            if count != self._mapped_count:
+                h, w = self.face_size
+                if count == 0:
+                    self._faces = np.empty((0, h, w), dtype=np.uint8)
+                    self._labels = np.empty((0,), dtype=np.int32)
+                else:
+                    self._faces = np.memmap(self._file("faces.u8"), dtype=np.uint8, mode="r", shape=(count, h, w))
+                    self._labels = np.memmap(self._file("labels.i32"), dtype=np.int32, mode="r", shape=(count,))
+                self._mapped_count = count
+            return self._faces, self._labels
+
+    def label_map(self):
+        """label -> uid for everyone currently enrolled."""
+        with self.lock:
+            return dict(self.uid_by_label)
+
+    def metadata(self, uid):
+        return self.people.get(uid, {})
+
+    def _normalize(self, gray_face_img):
+        if gray_face_img.ndim != 2 or gray_face_img.dtype != np.uint8:
+            gray_face_img = cv2.cvtColor(gray_face_img, cv2.COLOR_BGR2GRAY)
+        if gray_face_img.shape != self.face_size:
+            gray_face_img = cv2.resize(gray_face_img, (self.face_size[1], self.face_size[0]))
+        return np.ascontiguousarray(gray_face_img, dtype=np.uint8)
+
+    def add(self, uid, gray_face_img, name=None, registered_at=None):
+        """Append one sample for `uid`, enrolling the person first if needed. Returns its label."""
+        face = self._normalize(gray_face_img)
+        with self.lock:
+            person = self.people.get(uid)
+            if person is None:
+                if name is None:
+                    raise ValueError(f"Unknown uid {uid} needs a name to be enrolled")
+                label = self._new_label()
+                self._append_log({
+                    "uid": uid,
+                    "label": label,
+                    "name": name,
+                    "registered_at": registered_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            else:
+                label = person["label"]
+
+            # Trim a torn trailing record before appending so files stay aligned.
+            count = len(self)
+            for filename, record_size in (("faces.u8", self.sample_bytes), ("labels.i32", 4)):
+                with open(self._file(filename), "ab") as f:
+                    if f.tell() != count * record_size:
+                        f.truncate(count * record_size)
+                    f.seek(count * record_size)
+                    f.write(face.tobytes() if filename == "faces.u8" else np.int32(label).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            return label
+
+    def _new_label(self):
+        # Not max(live labels) + 1: a removed person's samples keep their label
+        # on disk until compact(), and a newcomer given it would inherit them.
+        return self.next_label
+
+    def remove(self, uid):
+        """Forget a person; their samples stay on disk until compact(). Returns False for an unknown uid."""
+        with self.lock:
+            if uid not in self.people:
+                return False
+            self._append_log({"op": "remove", "uid": uid})
+            return True
+
+    def removed_samples(self):
+        """How many samples on disk belong to removed people (reclaimed by compact())."""
+        with self.lock:
+            _, labels = self.arrays()
+            return int(np.count_nonzero(~np.isin(labels, list(self.uid_by_label))))
+
+    def compact(self):
+        """Rewrite the gallery without removed people, renumbering labels 0..n-1.
+
+        Returns the old -> new label mapping so callers can retrain.
+        """
+        with self.lock:
+            faces, labels = self.arrays()
+            live_labels = sorted(self.uid_by_label)
+            remap = {old: new for new, old in enumerate(live_labels)}
+            keep = np.isin(labels, live_labels)
+
+            tmp_dir = self.path.rstrip(os.sep) + ".compact"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            with open(os.path.join(tmp_dir, "faces.u8"), "wb") as f:
+                # Chunked so compaction of a large gallery does not need it all in RAM.
+                for start in range(0, len(labels), 4096):
+                    chunk = slice(start, start + 4096)
+                    f.write(np.ascontiguousarray(faces[chunk][keep[chunk]]).tobytes())
+            new_labels = np.array([remap[l] for l in labels[keep]], dtype=np.int32)
+            new_labels.tofile(os.path.join(tmp_dir, "labels.i32"))
+            with open(os.path.join(tmp_dir, "people.jsonl"), "w") as f:
+                for old in live_labels:
+                    uid = self.uid_by_label[old]
+                    person = self.people[uid]
+                    f.write(json.dumps({"uid": uid, "label": remap[old], "name": person["name"],
+                                        "registered_at": person["registered_at"]}) + "\n")
+
+            # Drop our maps before swapping the files underneath them.
+            self._faces = self._labels = None
+            self._mapped_count = -1
+            for name in ("faces.u8", "labels.i32", "people.jsonl"):
+                os.replace(os.path.join(tmp_dir, name), self._file(name))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            self.generation += 1
+            self._write_manifest({"version": GALLERY_VERSION, "face_size": list(self.face_size),
+                                  "generation": self.generation})
+
+            self.people, self.uid_by_label, self.removed = {}, {}, set()
+            self.next_label = 0
+            self._load_people()
+            return remap
+
+
+def migrate_legacy_layout(face_dir="known_faces", metadata_file=None, gallery=None):
+    """Import the old one-directory-per-uid PNG layout into a FaceGallery.
+
+    People already present in the gallery are skipped, so it is safe to rerun.
+    The legacy files are left in place.
+    """
+    if metadata_file is None:
+        metadata_file = os.path.join(face_dir, "metadata.json")
+    if gallery is None:
+        gallery = FaceGallery(os.path.join(face_dir, "gallery"))
+
+    metadata = {}
+    if os.path.exists(metadata_file):
+        with open(metadata_file, "r") as f:
+            metadata = json.load(f)
+
+    migrated_people = 0
+    migrated_faces = 0
+    for uid in sorted(os.listdir(face_dir)):
+        person_path = os.path.join(face_dir, uid)
+        if not os.path.isdir(person_path) or os.path.abspath(person_path) == os.path.abspath(gallery.path):
+            continue
+        if uid in gallery.people:
+            continue
+
+        info = metadata.get(uid, {})
+        name = info.get("name", "Unknown")
+        for img_name in sorted(os.listdir(person_path)):
+            img = cv2.imread(os.path.join(person_path, img_name), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                continue
+            gallery.add(uid, img, name=name, registered_at=info.get("registered_at"))
+            migrated_faces += 1
+        if uid in gallery.people:
+            migrated_people += 1
+
+    print(f"[INFO] Migrated {migrated_people} people ({migrated_faces} faces) into {gallery.path}")
+    return migrated_people, migrated_faces
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate known_faces/ PNG directories into a packed face gallery.")
+    parser.add_argument("--face-dir", default="known_faces")
+    parser.add_argument("--gallery", default=None, help="gallery directory (default: <face-dir>/gallery)")
+    parser.add_argument("--compact", action="store_true", help="compact the gallery after migrating")
+    parser.add_argument("--remove", nargs="+", metavar="UID", default=[],
+                        help="forget these people (the app compacts the gallery on its next start)")
+    args = parser.parse_args()
+
+    target = FaceGallery(args.gallery or os.path.join(args.face_dir, "gallery"))
+    migrate_legacy_layout(args.face_dir, gallery=target)
+    for uid in args.remove:
+        if target.remove(uid):
+            print(f"[INFO] Removed {uid} from {target.path}")
+        else:
+            print(f"[WARN] No enrolled person with UID {uid}")
+    if args.compact:
+        target.compact()
@@ -0,0 +1,207 @@
+import os
+import threading
+import numpy as np
+
+# Same defaults as cv2.face.LBPHFaceRecognizer_create(), so distances (and the
+# confidence threshold of 70) mean the same thing for both backends.
+RADIUS = 1
+NEIGHBORS = 8
+GRID = (8, 8)
+BINS = 1 << NEIGHBORS
+
+
+def lbp_codes(faces):
+    """Extended (circular, bilinear) LBP codes for a batch of faces, as in OpenCV's elbp().
+
+    faces: (N, H, W) uint8. Returns (N, H - 2r, W - 2r) uint8.
+    """
+    src = np.asarray(faces, dtype=np.float32)
+    n, h, w = src.shape
+    r = RADIUS
+    center = src[:, r:h - r, r:w - r]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+
+    for k in range(NEIGHBORS):
+        # float32 throughout, like OpenCV, so borderline comparisons agree.
+        x = np.float32(r * np.cos(2.0 * np.pi * k / NEIGHBORS))
+        y = np.float32(-r * np.sin(2.0 * np.pi * k / NEIGHBORS))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = x - np.float32(fx), y - np.float32(fy)
+        one = np.float32(1)
+        w1, w2 = (one - tx) * (one - ty), tx * (one - ty)
+        w3, w4 = (one - tx) * ty, tx * ty
+
+        def shifted(dy, dx):
+            return src[:, r + dy:h - r + dy, r + dx:w - r + dx]
+
+        t = (w1 * shifted(fy, fx) + w2 * shifted(fy, cx)
+             + w3 * shifted(cy, fx) + w4 * shifted(cy, cx))
+        eps = np.finfo(np.float32).eps
+        codes |= (((t > center) | (np.abs(t - center) < eps)).astype(np.uint8) << k)
+    return codes
+
+
+def lbp_histograms(faces):
+    """Spatial LBP histograms (raw counts) for a batch of faces: (N, GRID_X * GRID_Y * BINS) uint16."""
+    codes = lbp_codes(faces)
+    n, h, w = codes.shape
+    gy, gx = GRID
+    cell_h, cell_w = h // gy, w // gx
+
+    cells = codes[:, :gy * cell_h, :gx * cell_w].reshape(n, gy, cell_h, gx, cell_w)
+    cells = cells.transpose(0, 1, 3, 2, 4).reshape(n * gy * gx, cell_h * cell_w)
+
+    # One bincount over offset codes gives every cell's histogram at once.
+    offsets = (np.arange(n * gy * gx, dtype=np.int64) * BINS)[:, None]
+    hist = np.bincount((cells + offsets).ravel(), minlength=n * gy * gx * BINS)
+    return hist.reshape(n, gy * gx * BINS).astype(np.uint16)
+
+
+def cell_pixels(face_size):
+    h, w = face_size[0] - 2 * RADIUS, face_size[1] - 2 * RADIUS
+    return (h // GRID[0]) * (w // GRID[1])
+
+
+def chi_square(queries, gallery, scale, chunk=256):
+    """OpenCV HISTCMP_CHISQR_ALT between every query and every gallery row.
+
+    Histograms are raw counts; `scale` is the per-cell pixel count OpenCV
+    normalizes by. Returns (Q, N) float32.
+    """
+    q = queries.astype(np.float32)
+    out = np.empty((len(q), len(gallery)), dtype=np.float32)
+    for start in range(0, len(gallery), chunk):
+        g = np.asarray(gallery[start:start + chunk], dtype=np.float32)
+        diff = q[:, None, :] - g[None, :, :]
+        total = q[:, None, :] + g[None, :, :]
+        np.divide(diff * diff, total, out=diff, where=total > 0)
+        diff[total <= 0] = 0
+        out[:, start:start + chunk] = 2.0 * diff.sum(axis=2) / scale
+    return out
+
+
+class LbpHistogramIndex:
+    """All gallery LBP histograms as one matrix, scored in batches with NumPy.
+
+    The matrix lives in `<gallery>/lbp.<generation>.u16`, row-aligned with the
+    gallery samples, so reopening only computes histograms for samples added
+    since the last run. Above `ivf_min_size` rows a coarse inverted-file index
+    (k-means over a random projection of the square-rooted histograms) limits
+    the exact chi-square search to the `nprobe` closest clusters. Rows of
+    people removed from the gallery are masked out of every search until
+    compaction drops them.
+    """
+
+    def __init__(self, gallery, ivf_min_size=5000, nprobe=8, seed=0):
+        self.gallery = gallery
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.lock = threading.Lock()
+        self.scale = float(cell_pixels(gallery.face_size))
+        self.dim = GRID[0] * GRID[1] * BINS
+
+        rng = np.random.default_rng(seed)
+        self.projection = (rng.standard_normal((self.dim, 128)) / np.sqrt(128)).astype(np.float32)
+
+        self.hist = np.empty((0, self.dim), dtype=np.uint16)
+        self.labels = np.empty((0,), dtype=np.int32)
+        self.live = np.empty((0,), dtype=bool)  # rows whose person is still enrolled
+        self.centroids = None
+        self.assignments = None
+        self.ivf_rows = 0
+        self.sync()
+
+    def _path(self):
+        return os.path.join(self.gallery.path, f"lbp.{self.gallery.generation}.u16")
+
+    def sync(self):
+        """Bring the matrix up to date with the gallery (after appends, removals or a compaction)."""
+        with self.lock:
+            path = self._path()
+            for name in os.listdir(self.gallery.path):
+                if name.startswith("lbp.") and name.endswith(".u16") and os.path.join(self.gallery.path, name) != path:
+                    os.remove(os.path.join(self.gallery.path, name))
+
+            with self.gallery.lock:
+                faces, labels = self.gallery.arrays()
+                live_labels = list(self.gallery.label_map())
+            row_bytes = self.dim * 2
+            have = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+            have = min(have, len(faces))
+
+            if have < len(faces):
+                with open(path, "ab") as f:
+                    f.truncate(have * row_bytes)
+                    for start in range(have, len(faces), 128):
+                        f.write(lbp_histograms(faces[start:start + 128]).tobytes())
+
+            if len(faces):
+                self.hist = np.memmap(path, dtype=np.uint16, mode="r", shape=(len(faces), self.dim))
+            else:
+                self.hist = np.empty((0, self.dim), dtype=np.uint16)
+            self.labels = np.asarray(labels)
+            self.live = np.isin(self.labels, live_labels)
+
+            if len(self.hist) < self.ivf_min_size:
+                self.centroids = None
+                self.assignments = None
+            elif self.centroids is None or len(self.hist) < self.ivf_rows or len(self.hist) > 1.1 * self.ivf_rows:
+                # New rows are scanned exhaustively until the tail grows past 10%.
+                self._build_ivf()
+
+    def _coarse(self, hist):
+        return np.sqrt(np.asarray(hist, dtype=np.float32)) @ self.projection
+
+    def _build_ivf(self, iterations=10):
+        vectors = np.concatenate([self._coarse(self.hist[s:s + 2048]) for s in range(0, len(self.hist), 2048)])
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignments = self._nearest_centroids(vectors, centroids, 1)[:, 0]
+            for c in range(nlist):
+                members = vectors[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+
+        self.centroids = centroids
+        self.assignments = self._nearest_centroids(vectors, centroids, 1)[:, 0]
+        self.ivf_rows = len(vectors)
+
+    @staticmethod
+    def _nearest_centroids(vectors, centroids, k):
+        d = (vectors * vectors).sum(1)[:, None] - 2 * vectors @ centroids.T + (centroids * centroids).sum(1)[None, :]
+        k = min(k, centroids.shape[0])
+        return np.argpartition(d, k - 1, axis=1)[:, :k]
+
+    def search(self, faces):
+        """Nearest gallery sample for each face: list of (label, distance), (-1, inf) if empty."""
+        if len(faces) == 0:
+            return []
+        queries = lbp_histograms(np.stack(faces))
+        with self.lock:
+            if not self.live.any():
+                return [(-1, float("inf"))] * len(faces)
+
+            if self.centroids is None:
+                dist = chi_square(queries, self.hist, self.scale)
+                dist[:, ~self.live] = np.inf
+                best = dist.argmin(axis=1)
+                return [(int(self.labels[b]), float(dist[i, b])) for i, b in enumerate(best)]
+
+            results = []
+            probes = self._nearest_centroids(self._coarse(queries), self.centroids, self.nprobe)
+            for i, clusters in enumerate(probes):
+                rows = np.flatnonzero(np.isin(self.assignments, clusters))
+                # Rows appended since the last IVF build are not assigned yet; always scan them.
+                rows = np.concatenate([rows, np.arange(len(self.assignments), len(self.hist))])
+                rows = rows[self.live[rows]]
+                if len(rows) == 0:
+                    results.append((-1, float("inf")))
+                    continue
+                dist = chi_square(queries[i:i + 1], self.hist[rows], self.scale)[0]
+                b = int(dist.argmin())
+                results.append((int(self.labels[rows[b]]), float(dist[b])))
+            return results
@@ -0,0 +1,49 @@
+import cv2
+
+
+class PreprocessedFrame:
+    """One camera frame with the colour planes every stage needs, computed once.
+
+    `gray` is shared by detection, tracking and face crops, `rgb` is what the
+    UI displays (annotations are drawn straight onto it), and `detection_gray`
+    is `gray` pyrDown'ed `detection_level` times for the Haar pass.
+    """
+
+    def __init__(self, bgr, detection_level=1):
+        self.bgr = bgr
+        self.gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        self.rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+        small = self.gray
+        for _ in range(detection_level):
+            small = cv2.pyrDown(small)
+        self.detection_gray = small
+        self.scale = 1 << detection_level
+
+    @property
+    def shape(self):
+        return self.gray.shape
+
+    def to_full_res(self, boxes):
+        """Map (x, y, w, h) boxes from `detection_gray` back to full resolution."""
+        s = self.scale
+        return [(int(x) * s, int(y) * s, int(w) * s, int(h) * s) for (x, y, w, h) in boxes]
+
+    def gray_crop(self, box, size=(200, 200)):
+        """Resize a face region of the shared gray plane into a new `size` array.
+
+        The region itself is sliced without copying; the resize allocates the
+        crop, so callers may keep or modify it freely.
+        """
+        x, y, w, h = box
+        return cv2.resize(self.gray[y:y + h, x:x + w], size)
+
+
+class FramePreprocessor:
+    def __init__(self, detection_level=1):
+        # Level 1 halves 1080p to 960x540, which is plenty for faces at a
+        # drive-thru window; raise it on slower lane PCs.
+        self.detection_level = detection_level
+
+    def process(self, bgr):
+        return PreprocessedFrame(bgr, self.detection_level)
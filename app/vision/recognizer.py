@@ -3,97 +3,258 @@ import os
 import numpy as np
 import uuid
 import json
+import queue
+import threading
 from datetime import datetime
 
+from app.utils import metrics
+from app.vision.gallery import FaceGallery, migrate_legacy_layout
+from app.vision.lbp_index import LbpHistogramIndex
+
+PREDICT_SECONDS = metrics.Histogram("drive_thru_face_predict_seconds", "Recognizer call for one frame's faces",
+                                    labelnames=("backend",))
+
+
+def _atomic_write(path, write_fn):
+    """Write through a temp file and os.replace() it so readers never see a partial file."""
+    # Keep the extension last: OpenCV picks the FileStorage format from it.
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
 class FaceRecognizer:
-    def __init__(self, model_path="trained_model.yml", face_dir="known_faces", metadata_file="known_faces/metadata.json"):
+    """Names faces against the enrolled gallery.
+
+    backend="lbph" uses OpenCV's LBPHFaceRecognizer; backend="numpy" keeps the
+    LBP histograms as one matrix (LbpHistogramIndex) and scores every face in a
+    frame in one batch. Both use the same distance, so the threshold is shared.
+
+    Once more than `compact_fraction` of the gallery's samples belong to
+    removed people (checked at startup and after remove_face()), the gallery
+    is compacted and the model retrained in the background.
+    """
+
+    def __init__(self, model_path="trained_model.yml", face_dir="known_faces", metadata_file="known_faces/metadata.json",
+                 gallery_dir=None, backend="lbph", confidence_threshold=70, compact_fraction=0.2):
+        if backend not in ("lbph", "numpy"):
+            raise ValueError(f"Unknown recognizer backend: {backend}")
+        self.backend = backend
+        self.confidence_threshold = confidence_threshold
+        self.compact_fraction = compact_fraction
         self.model_path = model_path
         self.face_dir = face_dir
         self.metadata_file = metadata_file
+        self.state_path = os.path.splitext(model_path)[0] + ".json"
         self.recognizer = cv2.face.LBPHFaceRecognizer_create()
 
+        # Guards self.recognizer / self.label_map / self.trained_samples /
+        # self.trained_generation: predict() and update() both touch the live
+        # model, and background retrains swap it out wholesale.
+        self.model_lock = threading.Lock()
+        self.label_map = {}
+        self.trained_samples = 0     # gallery samples [0, n) are in the live model
+        self.trained_generation = 0  # gallery generation those sample positions refer to
+
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(target=self._background_worker, daemon=True)
+        self.worker.start()
+
         os.makedirs(self.face_dir, exist_ok=True)
-        self.metadata = self._load_metadata()
+        self.gallery = FaceGallery(gallery_dir or os.path.join(face_dir, "gallery"))
+        if len(self.gallery) == 0 and self._has_legacy_faces():
+            print("[INFO] Migrating known_faces/ to the packed gallery format...")
+            migrate_legacy_layout(face_dir, metadata_file, self.gallery)
 
-        if os.path.exists(model_path):
-            self.recognizer.read(model_path)
-            self.label_map = self._load_labels()
+        self.index = None
+        if backend == "numpy":
+            self.index = LbpHistogramIndex(self.gallery)
+            self.label_map = self.gallery.label_map()
         else:
-            self.label_map = {}
-            self._train()
+            trained_samples = self._load_state()
+            if os.path.exists(model_path) and 0 < trained_samples <= len(self.gallery):
+                self.recognizer.read(model_path)
+                self.label_map = self.gallery.label_map()
+                self.trained_samples = trained_samples
+                self.trained_generation = self.gallery.generation
+                # Catch up on anything enrolled after the model was last saved.
+                self._update_from_gallery()
+            else:
+                self._train()
 
-    def _load_metadata(self):
-        if os.path.exists(self.metadata_file):
-            with open(self.metadata_file, "r") as f:
-                return json.load(f)
-        return {}
+        # People removed while the app was down (python -m app.vision.gallery --remove).
+        self._compact_if_needed()
 
-    def _save_metadata(self):
-        with open(self.metadata_file, "w") as f:
-            json.dump(self.metadata, f, indent=2)
+    def _has_legacy_faces(self):
+        gallery_dir = os.path.abspath(self.gallery.path)
+        return any(
+            os.path.isdir(os.path.join(self.face_dir, entry))
+            and os.path.abspath(os.path.join(self.face_dir, entry)) != gallery_dir
+            for entry in os.listdir(self.face_dir)
+        )
 
-    def _load_labels(self):
-        label_path = os.path.join(self.face_dir, "labels.npy")
-        if os.path.exists(label_path):
-            return dict(np.load(label_path, allow_pickle=True).item())
-        return {}
+    def _load_state(self):
+        """How many gallery samples the saved model covers; 0 if it was saved for another gallery generation."""
+        if not os.path.exists(self.state_path):
+            return 0
+        with open(self.state_path, "r") as f:
+            state = json.load(f)
+        if state.get("generation") != self.gallery.generation:
+            # Compaction renumbered the samples and labels since the model was saved.
+            return 0
+        return state.get("samples", 0)
 
-    def _save_labels(self):
-        label_path = os.path.join(self.face_dir, "labels.npy")
-        np.save(label_path, self.label_map)
+    def _build_model(self):
+        """Train a fresh LBPH model from the gallery.
+
+        Touches no shared state, so it is safe to run on the background worker
+        while the live model keeps serving predictions. Returns the model, how
+        many gallery samples it covers and the gallery generation they belong to.
+        """
+        with self.gallery.lock:
+            faces, labels = self.gallery.arrays()
+            label_map = self.gallery.label_map()
+            generation = self.gallery.generation
+        if len(faces) == 0:
+            return None, 0, generation
+
+        live = np.isin(labels, list(label_map))
+        model = cv2.face.LBPHFaceRecognizer_create()
+        model.train(list(faces[live]), np.asarray(labels[live], dtype=np.int32))
+        return model, len(faces), generation
 
     def _train(self):
-        print("[INFO] Training LBPH model...")
-        images = []
-        labels = []
-        self.label_map = {}
-        current_label = 0
+        """Full retrain from the gallery, swapped in atomically once it is complete."""
+        if self.backend == "numpy":
+            self.index.sync()
+            with self.model_lock:
+                self.label_map = self.gallery.label_map()
+            return
 
-        for uid in os.listdir(self.face_dir):
-            person_path = os.path.join(self.face_dir, uid)
-            if not os.path.isdir(person_path) or uid == "metadata.json":
-                continue
+        print("[INFO] Training LBPH model...")
+        model, samples, generation = self._build_model()
+        if model is None:
+            print("[WARN] No face images found for training.")
+            return
 
-            self.label_map[current_label] = uid
+        with self.model_lock:
+            self.recognizer = model
+            self.label_map = self.gallery.label_map()
+            self.trained_samples = samples
+            self.trained_generation = generation
+            # Faces enrolled while we were training go in incrementally.
+            self._update_from_gallery()
 
-            for img_name in os.listdir(person_path):
-                img_path = os.path.join(person_path, img_name)
-                img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-                if img is not None:
-                    images.append(img)
-                    labels.append(current_label)
+        self._persist()
+        print("[INFO] Training complete.")
 
-            current_label += 1
+    def _update_from_gallery(self):
+        """Feed gallery samples the live model has not seen yet through LBPH update().
 
-        if not images:
-            print("[WARN] No face images found for training.")
+        After a compaction the live model's sample positions and labels no
+        longer match the gallery, so nothing is fed in; a full retrain is
+        queued instead (the compaction job runs one anyway).
+        """
+        with self.gallery.lock:
+            faces, labels = self.gallery.arrays()
+            generation = self.gallery.generation
+        if generation != self.trained_generation:
+            self.jobs.put("retrain")
             return
+        if len(faces) <= self.trained_samples:
+            return
+        new_faces = list(faces[self.trained_samples:])
+        new_labels = np.asarray(labels[self.trained_samples:], dtype=np.int32)
+        if self.trained_samples == 0:
+            self.recognizer.train(new_faces, new_labels)
+        else:
+            self.recognizer.update(new_faces, new_labels)
+        self.trained_samples = len(faces)
+        self.label_map = self.gallery.label_map()
 
-        self.recognizer.train(images, np.array(labels))
-        self.recognizer.save(self.model_path)
-        self._save_labels()
-        self._save_metadata()
-        print("[INFO] Training complete.")
+    def _persist(self):
+        with self.model_lock:
+            _atomic_write(self.model_path, self.recognizer.save)
+            state = {"samples": self.trained_samples, "generation": self.trained_generation}
+
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(state, f)
+        _atomic_write(self.state_path, write)
+
+    def _background_worker(self):
+        while True:
+            job = self.jobs.get()
+            # Collapse a burst of identical requests into one run.
+            pending = {job}
+            while not self.jobs.empty():
+                pending.add(self.jobs.get_nowait())
+
+            try:
+                if "compact" in pending:
+                    self.gallery.compact()
+                    self._train()
+                elif "retrain" in pending:
+                    self._train()
+                elif "persist" in pending and self.backend == "lbph":
+                    self._persist()
+            except Exception as e:
+                print(f"[ERROR] Background face model job failed: {e}")
+
+    def retrain_async(self):
+        """Schedule a full retrain on the background worker."""
+        self.jobs.put("retrain")
+
+    def compact_async(self):
+        """Drop removed people from the gallery files and retrain, in the background."""
+        self.jobs.put("compact")
+
+    def _compact_if_needed(self):
+        """Schedule compaction once removed people's samples pass `compact_fraction`; True if scheduled."""
+        total = len(self.gallery)
+        removed = self.gallery.removed_samples()
+        if removed == 0 or removed <= self.compact_fraction * total:
+            return False
+        print(f"[INFO] {removed} of {total} gallery samples belong to removed people; compacting")
+        self.compact_async()
+        return True
 
     def recognize_face(self, gray_face_img):
-        if not self.label_map:
-            return "Unknown"
+        return self.recognize_faces([gray_face_img])[0]
+
+    def recognize_faces(self, gray_face_imgs):
+        """Name every face crop from one frame; the numpy backend scores them in a single batch."""
+        return [name for _, name in self.identify_faces(gray_face_imgs)]
+
+    def identify_faces(self, gray_face_imgs):
+        """Like recognize_faces(), but returns (uid, name) pairs; (None, "Unknown") for strangers."""
+        if not gray_face_imgs:
+            return []
 
-        label, confidence = self.recognizer.predict(gray_face_img)
-        uid = self.label_map.get(label, None)
-        if uid is None or confidence > 70:
-            return "Unknown"
+        with PREDICT_SECONDS.time(backend=self.backend):
+            with self.model_lock:
+                if not self.label_map:
+                    return [(None, "Unknown")] * len(gray_face_imgs)
+                label_map = self.label_map
+                if self.backend == "lbph":
+                    matches = [self.recognizer.predict(img) for img in gray_face_imgs]
 
-        return self.metadata.get(uid, {}).get("name", "Unknown")
+            if self.backend == "numpy":
+                matches = self.index.search(gray_face_imgs)
+
+        results = []
+        for label, confidence in matches:
+            uid = label_map.get(label, None)
+            if uid is None or confidence > self.confidence_threshold:
+                results.append((None, "Unknown"))
+            else:
+                results.append((uid, self.gallery.metadata(uid).get("name", "Unknown")))
+        return results
 
     def save_new_face(self, gray_face_img, name):
+        """Enrol a new person; returns their uid."""
         uid = str(uuid.uuid4())[:8]
-        person_dir = os.path.join(self.face_dir, uid)
-        os.makedirs(person_dir, exist_ok=True)
-
-        count = len(os.listdir(person_dir))
-        filename = f"img_{count+1}.png"
-        img_path = os.path.join(person_dir, filename)
         if not isinstance(gray_face_img, np.ndarray):
             raise ValueError("gray_face_img is not a valid NumPy array")
 
@@ -105,12 +266,33 @@ class FaceRecognizer:
                 gray_face_img = cv2.cvtColor(gray_face_img, cv2.COLOR_BGR2GRAY)
             except Exception as e:
                 raise ValueError(f"Could not convert image to grayscale: {e}")
-        cv2.imwrite(img_path, gray_face_img)
-
-        self.metadata[uid] = {
-            "name": name,
-            "registered_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
 
+        self.gallery.add(uid, gray_face_img, name=name,
+                         registered_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         print(f"[INFO] Saved new face under UID {uid}")
-        self._train()  # retrain with new data
\ No newline at end of file
+
+        if self.backend == "numpy":
+            self.index.sync()
+            with self.model_lock:
+                self.label_map = self.gallery.label_map()
+            return uid
+
+        with self.model_lock:
+            self._update_from_gallery()
+        self.jobs.put("persist")
+        return uid
+
+    def remove_face(self, uid):
+        """Forget an enrolled person; returns False if `uid` is not enrolled."""
+        if not self.gallery.remove(uid):
+            return False
+        print(f"[INFO] Removed face UID {uid}")
+
+        if self.backend == "numpy":
+            self.index.sync()
+        with self.model_lock:
+            self.label_map = self.gallery.label_map()
+        # The compaction job retrains too; otherwise retrain so LBPH stops matching their samples.
+        if not self._compact_if_needed() and self.backend == "lbph":
+            self.retrain_async()
+        return True
@@ -0,0 +1,142 @@
+import cv2
+import itertools
+
+from app.utils import metrics
+
+DETECT_SECONDS = metrics.Histogram("drive_thru_face_detect_seconds", "Haar cascade pass on one frame")
+
+
+def _create_cv_tracker():
+    # MOSSE is by far the cheapest; fall back to KCF / CSRT depending on
+    # which OpenCV build (contrib or not, legacy namespace or not) is around.
+    candidates = []
+    legacy = getattr(cv2, "legacy", None)
+    if legacy is not None:
+        candidates += [getattr(legacy, "TrackerMOSSE_create", None), getattr(legacy, "TrackerKCF_create", None)]
+    candidates += [getattr(cv2, "TrackerMOSSE_create", None), getattr(cv2, "TrackerKCF_create", None),
+                   getattr(cv2, "TrackerCSRT_create", None)]
+    for factory in candidates:
+        if factory is not None:
+            return factory()
+    raise RuntimeError("No OpenCV tracker available (install opencv-contrib-python).")
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.name = None
+        self.uid = None
+        self.misses = 0
+        self.detected = True  # box came from the detector on this frame
+        self.cv_tracker = None
+
+    def needs_recognition(self):
+        """Recognize new tracks once; retry "Unknown" ones on detection frames only."""
+        if self.name is None:
+            return True
+        return self.name == "Unknown" and self.detected
+
+
+class FaceTracker:
+    """Runs the face detector every `detect_interval` frames (or when a track is
+    lost) and moves the boxes forward with a cheap OpenCV tracker in between.
+
+    Each track keeps the name it was recognized as, so the recognizer only has
+    to run when a new face shows up.
+    """
+
+    def __init__(self, detector, detect_interval=10, iou_threshold=0.3, max_misses=2):
+        self.detector = detector
+        self.detect_interval = detect_interval
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+
+        self.tracks = []
+        self.frames_since_detection = detect_interval
+        self.force_detection = True
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+        self.force_detection = True
+
+    def update(self, pframe):
+        """Advance all tracks to a PreprocessedFrame and return the live ones."""
+        self.frames_since_detection += 1
+        if self.force_detection or not self.tracks or self.frames_since_detection >= self.detect_interval:
+            self._detect(pframe)
+        else:
+            self._track(pframe.gray)
+        # Tracks the detector just missed are kept for re-association but
+        # are not reported as present.
+        return [t for t in self.tracks if t.misses == 0]
+
+    def _track(self, frame):
+        for track in self.tracks:
+            track.detected = False
+            ok, box = track.cv_tracker.update(frame)
+            if not ok:
+                # Lost it; let the detector sort things out on the next frame.
+                self.force_detection = True
+                continue
+            track.box = self._clamp(box, frame)
+
+    def _detect(self, pframe):
+        self.frames_since_detection = 0
+        self.force_detection = False
+        with DETECT_SECONDS.time():
+            detections = self.detector.detect(pframe)
+        frame = pframe.gray
+
+        unmatched = set(range(len(detections)))
+        survivors = []
+        for track in self.tracks:
+            best, best_iou = None, self.iou_threshold
+            for i in unmatched:
+                overlap = _iou(track.box, detections[i])
+                if overlap >= best_iou:
+                    best, best_iou = i, overlap
+
+            if best is None:
+                track.misses += 1
+                track.detected = False
+                if track.misses <= self.max_misses:
+                    survivors.append(track)
+                continue
+
+            unmatched.discard(best)
+            track.misses = 0
+            self._refresh(track, detections[best], frame)
+            survivors.append(track)
+
+        for i in sorted(unmatched):
+            track = Track(next(self._ids), detections[i])
+            self._refresh(track, detections[i], frame)
+            survivors.append(track)
+
+        self.tracks = survivors
+
+    def _refresh(self, track, box, frame):
+        track.box = box
+        track.detected = True
+        track.cv_tracker = _create_cv_tracker()
+        track.cv_tracker.init(frame, box)
+
+    @staticmethod
+    def _clamp(box, frame):
+        h, w = frame.shape[:2]
+        x, y, bw, bh = (int(round(v)) for v in box)
+        x = max(0, min(x, w - 1))
+        y = max(0, min(y, h - 1))
+        return (x, y, max(1, min(bw, w - x)), max(1, min(bh, h - y)))
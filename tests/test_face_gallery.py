@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.vision.gallery import FaceGallery
+from app.vision.lbp_index import LbpHistogramIndex
+from app.vision.recognizer import FaceRecognizer
+
+
+def random_face(seed):
+    # Smooth blobs rather than pixel noise, so different seeds are well past the match threshold.
+    blobs = np.random.default_rng(seed).integers(0, 256, (8, 8), dtype=np.uint8)
+    return cv2.resize(blobs, (200, 200), interpolation=cv2.INTER_LINEAR)
+
+
+def test_removed_label_is_not_reused_before_compaction(tmp_path):
+    gallery = FaceGallery(str(tmp_path / "gallery"))
+    gallery.add("alice", random_face(0), name="Alice")
+    gallery.add("bob", random_face(1), name="Bob")
+    assert gallery.remove("bob")
+    assert not gallery.remove("bob")
+
+    # Bob's sample still carries label 1 on disk; Carol must not inherit it.
+    assert gallery.add("carol", random_face(2), name="Carol") == 2
+    assert gallery.removed_samples() == 1
+
+
+def test_compact_drops_removed_people_and_renumbers(tmp_path):
+    path = str(tmp_path / "gallery")
+    gallery = FaceGallery(path)
+    for seed, uid in enumerate(["alice", "bob", "carol"]):
+        gallery.add(uid, random_face(seed), name=uid.title())
+        gallery.add(uid, random_face(seed + 10))
+    gallery.remove("alice")
+
+    remap = gallery.compact()
+
+    assert remap == {1: 0, 2: 1}
+    assert gallery.generation == 1
+    assert gallery.next_label == 2
+    assert gallery.removed_samples() == 0
+    assert gallery.label_map() == {0: "bob", 1: "carol"}
+    faces, labels = gallery.arrays()
+    assert list(labels) == [0, 0, 1, 1]
+    assert np.array_equal(faces[2], random_face(2))
+
+    # The renumbering and generation survive a reopen.
+    reopened = FaceGallery(path)
+    assert reopened.generation == 1
+    assert reopened.label_map() == {0: "bob", 1: "carol"}
+    assert reopened.add("dave", random_face(3), name="Dave") == 2
+
+
+@pytest.mark.parametrize("backend", ["numpy", "lbph"])
+def test_remove_face_compacts_past_threshold(tmp_path, backend):
+    recognizer = FaceRecognizer(model_path=str(tmp_path / "model.yml"), face_dir=str(tmp_path / "faces"),
+                                backend=backend, compact_fraction=0.3)
+    uids = [recognizer.save_new_face(random_face(seed), f"Person {seed}") for seed in range(3)]
+
+    assert recognizer.remove_face(uids[0])
+    expected = [None, uids[1], uids[2]]
+
+    def matches():
+        return [uid for uid, _ in recognizer.identify_faces([random_face(seed) for seed in range(3)])]
+
+    # Compaction and the retrain after it run on the recognizer's worker thread.
+    deadline = time.monotonic() + 10
+    while (recognizer.gallery.generation == 0 or matches() != expected) and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    assert recognizer.gallery.generation == 1
+    assert len(recognizer.gallery) == 2
+    assert recognizer.gallery.next_label == 2
+    assert matches() == expected
+
+
+def test_index_search_skips_removed_people(tmp_path):
+    gallery = FaceGallery(str(tmp_path / "gallery"))
+    face = random_face(0)
+    gallery.add("alice", face, name="Alice")
+    gallery.add("bob", np.clip(face.astype(np.int16) + 3, 0, 255).astype(np.uint8), name="Bob")
+    index = LbpHistogramIndex(gallery)
+    assert index.search([face])[0] == (0, 0.0)
+
+    gallery.remove("alice")
+    index.sync()
+    (label, distance), = index.search([face])
+    assert gallery.label_map()[label] == "bob"
+    assert distance < 70
+
+    gallery.remove("bob")
+    index.sync()
+    assert index.search([face]) == [(-1, float("inf"))]
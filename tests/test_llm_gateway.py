@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from app.nlp import ollama_stub
+from app.nlp.llm_gateway import INTERACTIVE, SPECULATIVE, LlmGateway
+from app.nlp.stream_parser import IncrementalOrderParser
+
+FALLBACK = json.dumps({"order": [], "fallback": True, "test": True})
+
+
+class StubEngine:
+    """The parts of LlmEngine the gateway uses, streaming straight from the Ollama stub over HTTP.
+
+    A call for an utterance passed to gate() holds before streaming until the
+    returned Event is set, so tests can line up the queue behind it without
+    relying on timing.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.calls = []  # utterances in the order the backend was called
+        self.gates = {}
+        self.called = threading.Condition()
+
+    def gate(self, order_text):
+        self.gates[order_text] = threading.Event()
+        return self.gates[order_text]
+
+    def wait_for_calls(self, count, timeout=10):
+        with self.called:
+            assert self.called.wait_for(lambda: len(self.calls) >= count, timeout)
+
+    def _fast_path(self, order_text, current_order):
+        return None
+
+    @staticmethod
+    def _current_items(current_order):
+        return []
+
+    def stream_order(self, order_text, current_order, on_item=None, cancel_event=None):
+        with self.called:
+            self.calls.append(order_text)
+            self.called.notify_all()
+        gate = self.gates.get(order_text)
+        if gate is not None:
+            assert gate.wait(10)
+
+        body = json.dumps({"model": "mistral", "prompt": f"Order: empty\nCustomer: {order_text}\nJSON:"})
+        request = urllib.request.Request(f"{self.url}/api/generate", data=body.encode("utf-8"))
+        parser = IncrementalOrderParser()
+        emitted = []
+        with urllib.request.urlopen(request) as response:
+            for line in response:
+                if cancel_event is not None and cancel_event.is_set():
+                    return json.dumps({"order": emitted})
+                for item in parser.feed(json.loads(line).get("response", "")):
+                    emitted.append(item)
+                    if on_item is not None:
+                        on_item(item)
+        return parser.text
+
+
+@pytest.fixture
+def stub():
+    server = ollama_stub.serve(port=0, delay=0.0, token_delay=0.0)
+    yield server
+    server.shutdown()
+
+
+def make_gateway(server, engine=None, **options):
+    engine = engine or StubEngine(f"http://127.0.0.1:{server.server_address[1]}")
+    return LlmGateway(engine, workers=1, fallback=lambda text, order: FALLBACK, **options), engine
+
+
+def first_item(future):
+    return json.loads(future.result(timeout=10))["order"][0]["item"]
+
+
+def test_interactive_goes_ahead_of_queued_speculative(stub):
+    gateway, engine = make_gateway(stub)
+    release = engine.gate("two burgers")
+    blocker = gateway.submit("two burgers", priority=INTERACTIVE)
+    engine.wait_for_calls(1)
+
+    speculative = [gateway.submit("a soda", priority=SPECULATIVE),
+                   gateway.submit("a lemonade", priority=SPECULATIVE)]
+    interactive = gateway.submit("three fries", priority=INTERACTIVE)
+    release.set()
+
+    assert first_item(interactive) == "french fries"
+    assert [first_item(f) for f in speculative] == ["soda", "lemonade"]
+    blocker.result(timeout=10)
+    assert engine.calls == ["two burgers", "three fries", "a soda", "a lemonade"]
+
+
+def test_identical_requests_are_coalesced(stub):
+    gateway, engine = make_gateway(stub)
+    release = engine.gate("two burgers")
+    blocker = gateway.submit("two burgers")
+    engine.wait_for_calls(1)
+    first = gateway.submit("a soda and a lemonade", current_order="empty")
+    second = gateway.submit("a soda and a lemonade", current_order="empty")
+    release.set()
+
+    assert first.result(timeout=10) == second.result(timeout=10)
+    blocker.result(timeout=10)
+    assert gateway.stats["coalesced"] == 1
+    assert gateway.stats["backend_calls"] == 2
+    assert stub.backend.requests == 2
+
+
+def test_missed_deadline_returns_fallback(stub):
+    gateway, engine = make_gateway(stub)
+    release = engine.gate("two burgers")
+    blocker = gateway.submit("two burgers", deadline=10.0)
+    engine.wait_for_calls(1)
+    late = gateway.submit("a soda", deadline=0.0)
+    release.set()
+
+    assert late.result(timeout=10) == FALLBACK
+    assert json.loads(blocker.result(timeout=10))["order"]
+    assert gateway.stats["expired"] == 1
+    assert engine.calls == ["two burgers"]
+
+
+def test_cancelling_a_queued_future_withdraws_it(stub):
+    gateway, engine = make_gateway(stub, max_queue=1)
+    release = engine.gate("two burgers")
+    blocker = gateway.submit("two burgers")
+    engine.wait_for_calls(1)
+    withdrawn = gateway.submit("a soda")
+    assert withdrawn.cancel()
+    assert gateway.queued == 0
+
+    # The withdrawn request no longer counts against max_queue.
+    accepted = gateway.submit("a lemonade")
+    release.set()
+    assert first_item(accepted) == "lemonade"
+    blocker.result(timeout=10)
+    assert gateway.stats["rejected"] == 0
+    assert engine.calls == ["two burgers", "a lemonade"]
+
+
+def test_resubmitting_after_withdrawing_a_running_request_gets_a_real_answer(stub):
+    gateway, engine = make_gateway(stub)
+    release = engine.gate("a soda")
+    withdrawn = gateway.submit("a soda")
+    engine.wait_for_calls(1)
+    assert withdrawn.cancel()  # running: it keeps its slot until it notices
+
+    # Must not coalesce onto the doomed request and inherit its fallback.
+    again = gateway.submit("a soda")
+    release.set()
+    assert first_item(again) == "soda"
+    assert gateway.stats["coalesced"] == 0
+    assert engine.calls == ["a soda", "a soda"]
+    assert not gateway.pending
+
+
+def test_coalescing_extends_the_deadline_of_a_running_request(stub):
+    gateway, engine = make_gateway(stub)
+    release = engine.gate("a soda")
+    first = gateway.submit("a soda", deadline=0.2)
+    engine.wait_for_calls(1)
+    second = gateway.submit("a soda", deadline=10.0)
+    time.sleep(0.4)  # past the first caller's deadline
+    release.set()
+
+    assert first_item(second) == "soda"
+    assert first.result(timeout=10) == second.result(timeout=10)
+    assert gateway.stats["coalesced"] == 1
+
+
+def test_hit_rate_counts_recorded_turns_only(stub):
+    class FastEngine(StubEngine):
+        def _fast_path(self, order_text, current_order):
+            return {"order": [{"item": "soda", "quantity": 1, "instructions": [], "action": "add"}]} \
+                if order_text == "a soda" else None
+
+    gateway, engine = make_gateway(stub, FastEngine(f"http://127.0.0.1:{stub.server_address[1]}"))
+    # Speculative partials go through submit() too, but are not turns.
+    partials = [gateway.submit(partial, priority=SPECULATIVE) for partial in ["a", "a so", "a soda"]]
+    for future in partials:
+        future.result(timeout=10)
+    assert gateway.hit_rate == 0.0
+
+    fast = gateway.submit("a soda")
+    slow = gateway.submit("three fries")
+    gateway.record_turn(fast)
+    gateway.record_turn(slow)
+    slow.result(timeout=10)
+    assert fast.fast_path and not slow.fast_path
+    assert gateway.stats["turns"] == 2
+    assert gateway.hit_rate == 0.5
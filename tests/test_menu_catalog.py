@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from app.order.menu_catalog import DEFAULT_MENU_PATH, MenuCatalog
+
+
+@pytest.fixture
+def menu_path(tmp_path):
+    path = tmp_path / "menu.json"
+    shutil.copy(DEFAULT_MENU_PATH, path)
+    return str(path)
+
+
+@pytest.fixture
+def catalog(menu_path):
+    return MenuCatalog(menu_path, check_interval=0.0)
+
+
+def write_menu(path, menu, bump):
+    with open(path, "w") as f:
+        json.dump(menu, f)
+    # mtime granularity can be coarse; make sure the change is visible.
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + bump))
+
+
+@pytest.mark.parametrize("heard, key", [
+    ("Burger", "burger"),
+    ("burgers", "burger"),
+    ("fries", "french fries"),
+    ("Fries", "french fries"),
+    ("sodas", "soda"),
+    ("ice creams", "ice cream"),
+    ("Grilled cheeses", "grilled cheese"),
+    ("mozarella stick", "mozzarella sticks"),
+    ("frensh fries", "french fries"),
+])
+def test_resolve_maps_variants_onto_the_menu(catalog, heard, key):
+    assert catalog.resolve(heard) == key
+
+
+@pytest.mark.parametrize("heard", ["cheeseburger", "pizza", "lemon", "soda pop", ""])
+def test_resolve_rejects_off_menu_items(catalog, heard):
+    # A wrong match bills the customer for something they never ordered.
+    assert catalog.resolve(heard) is None
+
+
+def test_cheeseburger_is_not_grilled_cheese(catalog):
+    assert catalog.resolve("cheeseburger") != "grilled cheese"
+    assert catalog.price("cheeseburger") is None
+
+
+def test_get_is_exact_and_price_resolves(catalog):
+    assert catalog.get("fries").name == "French Fries"
+    assert catalog.get("frensh fries") is None
+    assert catalog.price("burgers") == 5.0
+
+
+def test_aliases_from_the_menu_file(menu_path):
+    with open(menu_path) as f:
+        menu = json.load(f)
+    menu["Drinks"][0]["aliases"] = ["Pop", "soft drink"]
+    write_menu(menu_path, menu, bump=0)
+
+    catalog = MenuCatalog(menu_path)
+    assert catalog.resolve("pop") == "soda"
+    assert catalog.resolve("soft drinks") == "soda"
+
+
+def test_refresh_reloads_and_notifies_subscribers(menu_path, catalog):
+    seen = []
+    catalog.subscribe(seen.append)
+    assert not catalog.refresh()
+
+    with open(menu_path) as f:
+        menu = json.load(f)
+    menu["Entree"].append({"name": "Cheeseburger", "price": 6.0})
+    write_menu(menu_path, menu, bump=5)
+
+    assert catalog.resolve("cheeseburgers") == "cheeseburger"
+    assert catalog.price("cheeseburger") == 6.0
+    assert catalog.version == 2
+    assert len(seen) == 1 and seen[0] == menu
+
+
+def test_broken_menu_file_keeps_the_previous_menu(menu_path, catalog):
+    with open(menu_path, "w") as f:
+        f.write('{"Entree": [')
+    stat = os.stat(menu_path)
+    os.utime(menu_path, (stat.st_atime, stat.st_mtime + 5))
+
+    assert not catalog.refresh()
+    assert catalog.resolve("burger") == "burger"
+    assert catalog.version == 1
@@ -0,0 +1,109 @@
+import errno
+import threading
+
+from app.order.journal import OrderJournal
+
+
+def wait_durable(journal, seq, timeout=5):
+    with journal.lock:
+        return journal.changed.wait_for(lambda: journal.durable_seq >= seq, timeout)
+
+
+def test_failed_compaction_keeps_the_writer_alive(tmp_path):
+    path = str(tmp_path / "lane.log")
+    journal = OrderJournal(path, compact_bytes=1, retry_interval=0.01)
+    journal.recover()
+
+    attempted = threading.Event()
+    rewrite = journal._rewrite
+
+    def disk_full():
+        if not attempted.is_set():
+            attempted.set()
+            raise OSError(errno.ENOSPC, "No space left on device")
+        rewrite()
+    journal._rewrite = disk_full
+
+    first = journal.append("begin", "s1", {"customer": "Ann"})
+    assert journal.wait(first, timeout=5)
+    assert attempted.wait(5)
+    assert wait_durable(journal, first)
+
+    # Records appended after the failure still reach the disk.
+    second = journal.append("delta", "s1", {"order": [{"item": "soda", "quantity": 1, "action": "add"}]})
+    assert wait_durable(journal, second)
+    assert journal.thread.is_alive()
+    assert journal.error is None  # cleared by the next successful write
+    journal.close()
+
+    recovered = OrderJournal(path).recover()
+    assert recovered["session"] == "s1"
+    assert recovered["deltas"] == [{"order": [{"item": "soda", "quantity": 1, "action": "add"}]}]
+
+
+SODA = {"order": [{"item": "soda", "quantity": 1, "action": "add"}]}
+FRIES = {"order": [{"item": "french fries", "quantity": 2, "action": "add"}]}
+
+
+def write_session(path):
+    journal = OrderJournal(path)
+    journal.recover()
+    journal.append("begin", "old", {"customer": "Bob"})
+    journal.append("end", "old", {"status": "completed"})
+    journal.append("begin", "s1", {"customer": "Ann", "uid": 3})
+    journal.append("delta", "s1", SODA)
+    last = journal.append("delta", "s1", FRIES)
+    assert journal.wait(last, timeout=5)
+    journal.close()
+    with open(path, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def test_recover_returns_the_open_session(tmp_path):
+    path = str(tmp_path / "lane.log")
+    write_session(path)
+    recovered = OrderJournal(path).recover()
+    assert recovered == {"session": "s1", "meta": {"customer": "Ann", "uid": 3}, "deltas": [SODA, FRIES]}
+
+
+def test_recover_drops_a_torn_tail(tmp_path):
+    path = str(tmp_path / "lane.log")
+    lines = write_session(path)
+    with open(path, "wb") as f:
+        f.writelines(lines[:-1])
+        f.write(lines[-1][:len(lines[-1]) // 2])  # crash mid-write
+
+    journal = OrderJournal(path)
+    recovered = journal.recover()
+    assert recovered["deltas"] == [SODA]
+
+    # The torn bytes are gone, so new records do not follow a broken line.
+    seq = journal.append("delta", "s1", FRIES)
+    assert journal.wait(seq, timeout=5)
+    journal.close()
+    assert OrderJournal(path).recover()["deltas"] == [SODA, FRIES]
+
+
+def test_recover_stops_at_a_corrupt_line(tmp_path):
+    path = str(tmp_path / "lane.log")
+    lines = write_session(path)
+    corrupt = lines[-2].replace(b'"quantity":1', b'"quantity":9')
+    assert corrupt != lines[-2]
+    with open(path, "wb") as f:
+        f.writelines(lines[:-2] + [corrupt, lines[-1]])
+
+    # Everything from the bad checksum on is untrusted, even well-formed lines after it.
+    recovered = OrderJournal(path).recover()
+    assert recovered["session"] == "s1"
+    assert recovered["deltas"] == []
+
+
+def test_recover_after_a_completed_session_has_nothing_open(tmp_path):
+    path = str(tmp_path / "lane.log")
+    journal = OrderJournal(path)
+    journal.recover()
+    journal.append("begin", "s1")
+    journal.append("delta", "s1", SODA)
+    journal.append("end", "s1", {"status": "completed"})
+    journal.close()
+    assert OrderJournal(path).recover() is None
@@ -0,0 +1,87 @@
+import pytest
+
+from app.nlp.order_schema import OrderValidator, extract_json_object
+from app.order.menu_catalog import MenuCatalog
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return OrderValidator(MenuCatalog())
+
+
+@pytest.mark.parametrize("reply", [
+    '{"order": [{"item": "soda", "quantity": 1}]}',
+    'Sure! Here is the order:\n```json\n{"order": [{"item": "soda", "quantity": 1}]}\n```\nAnything else?',
+    '{“order”: [{“item”: “soda”, “quantity”: 1}]}',
+    '{"order": [{"item": "soda", "quantity": 1,},],}',
+    '{"order": [{"item": "soda", "quantity": 1}',
+    '{"order": [{"item": "soda", "quantity": 1, "instructions": ["no ice',
+])
+def test_extract_json_object_repairs_model_replies(reply):
+    obj = extract_json_object(reply)
+    assert obj["order"][0]["item"] == "soda"
+    assert obj["order"][0]["quantity"] == 1
+
+
+def test_extract_json_object_keeps_braces_inside_strings():
+    obj = extract_json_object('{"order": [{"item": "soda", "instructions": ["a } in a note"]}]} trailing')
+    assert obj["order"][0]["instructions"] == ["a } in a note"]
+
+
+@pytest.mark.parametrize("reply", ["no JSON here", "[1, 2, 3]", None, '{"order": [1, 2 3]}'])
+def test_extract_json_object_raises_when_nothing_is_usable(reply):
+    with pytest.raises(ValueError):
+        extract_json_object(reply)
+
+
+def test_validate_normalizes_entries(validator):
+    cleaned, errors = validator.validate({"order": [
+        {"item": "Fries", "quantity": "two", "action": "Added", "instructions": "extra salt"},
+        {"name": "burgers", "quantity": 2.0, "action": "update"},
+        {"item": "soda", "quantity": 0, "action": "modify"},
+        {"item": "lemonade", "action": "unchanged"},
+    ]})
+    assert errors == []
+    assert cleaned["order"] == [
+        {"item": "french fries", "quantity": 2, "instructions": ["extra salt"], "action": "add"},
+        {"item": "burger", "quantity": 2, "instructions": [], "action": "modify"},
+        {"item": "soda", "quantity": 0, "instructions": [], "action": "remove"},
+    ]
+
+
+def test_validate_accepts_a_bare_item_or_list(validator):
+    assert validator.validate({"item": "soda"})[0]["order"][0]["item"] == "soda"
+    assert validator.validate([{"item": "soda"}])[0]["order"][0]["item"] == "soda"
+
+
+def test_validate_reports_bad_entries_and_keeps_good_ones(validator):
+    cleaned, errors = validator.validate({"order": [
+        {"item": "soda", "quantity": 1, "action": "add"},
+        {"item": "pizza", "quantity": 1, "action": "add"},
+        {"item": "burger", "quantity": "lots", "action": "add"},
+        {"item": "burger", "quantity": True, "action": "add"},
+        {"item": "burger", "action": "explode"},
+        {"quantity": 1, "action": "add"},
+        "soda",
+    ]})
+    assert [item["item"] for item in cleaned["order"]] == ["soda"]
+    assert len(errors) == 6
+    assert "'pizza' is not on the menu" in errors
+
+
+@pytest.mark.parametrize("obj, error", [
+    ("soda", "reply is not a JSON object"),
+    ({"order": "soda"}, '"order" must be a list'),
+    ({"items": []}, 'missing "order" list'),
+])
+def test_validate_rejects_malformed_shapes(validator, obj, error):
+    assert validator.validate(obj) == ({"order": []}, [error])
+
+
+def test_repair_then_validate_a_truncated_reply(validator):
+    reply = 'Here you go: {"order": [{"item": "mozarella stick", "quantity": "3", "action": "add",'
+    cleaned, errors = validator.validate(extract_json_object(reply))
+    assert errors == []
+    assert cleaned["order"] == [
+        {"item": "mozzarella sticks", "quantity": 3, "instructions": [], "action": "add"},
+    ]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from app.nlp.rule_parser import RuleOrderParser
+from app.order.menu_catalog import DEFAULT_MENU_PATH
+
+
+@pytest.fixture(scope="module")
+def parser():
+    with open(DEFAULT_MENU_PATH) as f:
+        return RuleOrderParser(json.load(f))
+
+
+def entry(item, quantity, action, instructions=()):
+    return {"item": item, "quantity": quantity, "instructions": list(instructions), "action": action}
+
+
+CURRENT = [entry("burger", 2, "add"), entry("soda", 1, "add")]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("two burgers and a soda", [entry("burger", 2, "add"), entry("soda", 1, "add")]),
+    ("can I get three fries please", [entry("french fries", 3, "add")]),
+    ("a couple of mozzarella sticks", [entry("mozzarella sticks", 2, "add")]),
+    ("a burger with no onions", [entry("burger", 1, "add", ["no onions"])]),
+    ("no onions on the burger", [entry("burger", 1, "add", ["no onions"])]),
+    ("a soda and another one", [entry("soda", 2, "add")]),
+])
+def test_new_order(parser, text, expected):
+    assert parser.parse(text) == {"order": expected}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("another one", [entry("soda", 2, "modify")]),
+    ("one more", [entry("soda", 2, "modify")]),
+    ("another burger", [entry("burger", 3, "modify")]),
+    ("two more burgers", [entry("burger", 4, "modify")]),
+    ("add three burgers", [entry("burger", 5, "modify")]),
+    ("add a lemonade", [entry("lemonade", 1, "add")]),
+])
+def test_another_one_adds_to_what_was_ordered(parser, text, expected):
+    assert parser.parse(text, CURRENT) == {"order": expected}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("remove the soda", [entry("soda", 0, "remove")]),
+    ("remove one burger", [entry("burger", 1, "modify")]),
+    ("take off a burger", [entry("burger", 1, "modify")]),
+    ("remove two burgers", [entry("burger", 0, "remove")]),
+    ("cancel the burgers", [entry("burger", 0, "remove")]),
+])
+def test_remove_drops_the_item_or_part_of_it(parser, text, expected):
+    assert parser.parse(text, CURRENT) == {"order": expected}
+
+
+def test_instructions_attach_to_the_item_already_ordered(parser):
+    assert parser.parse("no onions on the burger", CURRENT) == \
+        {"order": [entry("burger", 2, "modify", ["no onions"])]}
+
+
+@pytest.mark.parametrize("text, current", [
+    ("another one", []),               # nothing to repeat
+    ("another lemonade", CURRENT),     # not ordered yet
+    ("remove the fries", CURRENT),     # not in the order
+    ("the soda", CURRENT),             # confirming or adding?
+    ("three burgers", CURRENT),        # setting or adding to the quantity?
+    ("no onions", CURRENT),            # on which item?
+    ("remove the burger and the soda", CURRENT),
+    ("a pizza", []),
+    ("a burger and fries with a shake", []),
+    ("", []),
+])
+def test_ambiguous_or_unknown_turns_go_to_the_llm(parser, text, current):
+    assert parser.parse(text, current) is None
+
+
+def test_set_menu_swaps_the_lexicon(parser):
+    fresh = RuleOrderParser({"Entree": [{"name": "Veggie Burger"}]})
+    assert fresh.parse("two veggie burgers") == {"order": [entry("veggie burger", 2, "add")]}
+    fresh.set_menu({"Drinks": [{"name": "Soda"}]})
+    assert fresh.parse("two veggie burgers") is None
+    assert fresh.parse("a soda") == {"order": [entry("soda", 1, "add")]}
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from app.nlp.stream_parser import IncrementalOrderParser
+
+RESPONSE = json.dumps({"order": [
+    {"item": "burger", "quantity": 2, "instructions": ["no {onions}", "say \"hi\""], "action": "add"},
+    {"item": "soda", "quantity": 1, "instructions": [], "action": "add"},
+]})
+
+
+def feed_all(parser, chunks):
+    return [item for chunk in chunks for item in parser.feed(chunk)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(RESPONSE)])
+def test_items_are_the_same_for_any_chunking(size):
+    parser = IncrementalOrderParser()
+    items = feed_all(parser, [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)])
+    assert items == json.loads(RESPONSE)["order"]
+    assert parser.items == items
+    assert parser.text == RESPONSE
+
+
+def test_each_item_is_returned_by_the_chunk_that_closes_it():
+    parser = IncrementalOrderParser()
+    first_end = RESPONSE.index('"add"}') + len('"add"}')
+    assert parser.feed(RESPONSE[:first_end - 1]) == []
+    assert [item["item"] for item in parser.feed(RESPONSE[first_end - 1:first_end])] == ["burger"]
+    assert [item["item"] for item in parser.feed(RESPONSE[first_end:])] == ["soda"]
+
+
+def test_preamble_and_other_keys_are_ignored():
+    text = ('Sure, here you go: {"note": {"item": "not this"}, "extra": [{"item": "nor this"}], '
+            '"order": [{"item": "fries", "quantity": 1}]}')
+    parser = IncrementalOrderParser()
+    assert feed_all(parser, list(text)) == [{"item": "fries", "quantity": 1}]
+
+
+def test_nested_objects_inside_an_item_stay_part_of_it():
+    text = '{"order": [{"item": "burger", "options": {"size": {"name": "large"}}}]}'
+    parser = IncrementalOrderParser()
+    assert parser.feed(text) == [{"item": "burger", "options": {"size": {"name": "large"}}}]
+
+
+def test_undecodable_items_are_skipped():
+    text = '{"order": [{"item": burger}, {"item": "soda"}]}'
+    parser = IncrementalOrderParser()
+    assert parser.feed(text) == [{"item": "soda"}]
+
+
+def test_truncated_stream_keeps_the_items_that_closed():
+    parser = IncrementalOrderParser()
+    assert feed_all(parser, [RESPONSE[:RESPONSE.index('{"item": "soda"') + 10]])[0]["item"] == "burger"
+    assert len(parser.items) == 1